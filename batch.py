@@ -0,0 +1,246 @@
+"""Headless batch rendering from a manifest — no clicking through the UI.
+
+    python batch.py manifest.jsonl --out renders/ --parallel 3
+    python batch.py manifest.csv --out renders/ --dry-run     # prompts only
+
+Every manifest row is one creative:
+
+    {"id": "gold-01", "mode": "campaign", "preset": "Luxury Beauty",
+     "product": "Goldkette mit Diamant", "refs": ["refs/kette_front.jpg"],
+     "count": 2, "overrides": {"lighting": "Golden Hour"}}
+
+mode: "campaign" (build_prompt_local), "product" (build_product_only_prompt)
+or "ad" (build_ad_creative_prompt). preset is a name from presets.json;
+overrides are any of the app's widget variables (e.g. ad_headline, prod_ar,
+model_quality). In CSV manifests refs are separated by ";", an "overrides"
+column may hold a JSON object, and every other column is an override too.
+
+Each worker thread renders on its own headless copy of the app (headless.py)
+with its own session_state, so rows with different settings never share state. Finished images go to
+<out>/images/, one line per image to <out>/index.jsonl. That index is the
+checkpoint: a re-run skips every image already marked "ok" and retries the rest.
+Needs GEMINI_API_KEY (environment or .streamlit/secrets.toml).
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import headless
+import result_cache
+
+MODES = ("campaign", "product", "ad")
+CSV_FIELDS = ("id", "mode", "preset", "product", "refs", "count", "overrides")
+
+_local = threading.local()
+
+
+def _csv_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def load_manifest(path):
+    """Rows of a .jsonl or .csv manifest, normalized to the JSONL shape."""
+    path = Path(path)
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = []
+            for record in csv.DictReader(f):
+                row = {key: record[key] for key in CSV_FIELDS if record.get(key)}
+                row["overrides"] = json.loads(row.get("overrides", "{}"))
+                row["overrides"].update({key: _csv_value(value) for key, value in record.items()
+                                         if key not in CSV_FIELDS and value != ""})
+                row["refs"] = [ref.strip() for ref in row.get("refs", "").split(";") if ref.strip()]
+                rows.append(row)
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    base = path.parent
+    for number, row in enumerate(rows, 1):
+        row.setdefault("id", f"row{number}")
+        row["mode"] = row.get("mode", "campaign")
+        row["count"] = int(row.get("count", 1))
+        row.setdefault("overrides", {})
+        # Relative reference paths are relative to the manifest
+        row["refs"] = [str(base / ref) for ref in row.get("refs", [])]
+    return rows
+
+
+def validate(rows, app):
+    """Fail before rendering anything: unknown modes, presets, settings, missing files, duplicate ids."""
+    problems = []
+    seen = set()
+    for row in rows:
+        where = f"row {row['id']!r}"
+        if row["id"] in seen:
+            problems.append(f"{where}: duplicate id")
+        seen.add(row["id"])
+        if row["mode"] not in MODES:
+            problems.append(f"{where}: unknown mode {row['mode']!r} (use {', '.join(MODES)})")
+        if row.get("preset") and row["preset"] not in app["PRESETS"]:
+            problems.append(f"{where}: unknown preset {row['preset']!r}")
+        unknown = [key for key in row["overrides"] if key not in app]
+        if unknown:
+            problems.append(f"{where}: unknown setting(s) {', '.join(unknown)}")
+        problems += [f"{where}: reference image not found: {ref}" for ref in row["refs"] if not Path(ref).is_file()]
+    return problems
+
+
+def apply_row(app, row):
+    """Set up the app's globals for one row; returns (prompt, aspect_ratio_str, reference uploads)."""
+    headless.apply_settings(app, row.get("preset"))
+    if row.get("product"):
+        app["product"] = row["product"]
+        app["prod_name"] = row["product"]
+    refs = [headless.open_reference(ref) for ref in row["refs"]]
+    mode = row["mode"]
+    if mode == "campaign":
+        app.update(wear_product=bool(refs), campaign_ref_files=refs)
+    elif mode == "product":
+        app.update(use_prod_ref=bool(refs), prod_ref_files=refs, prod_ref_count=len(refs))
+    else:
+        app["ad_ref_files"] = refs
+    headless.apply_settings(app, overrides=row["overrides"])
+
+    if mode == "campaign":
+        prompt, _ = app["build_prompt_local"]()
+        aspect_ratio = app["aspect_ratio"]
+    elif mode == "product":
+        prompt = app["build_product_only_prompt"]()
+        aspect_ratio = app["prod_ar"]
+    else:
+        prompt = app["build_ad_creative_prompt"]()
+        aspect_ratio = app["AD_FORMAT_ASPECT_RATIOS"].get(app["ad_format"], "1:1")
+    return prompt, aspect_ratio, refs or None
+
+
+class Index:
+    """Append-only results index (JSONL); also the checkpoint for re-runs."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def done(self):
+        finished = set()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["status"] == "ok":
+                        finished.add((entry["id"], entry["slot"]))
+        return finished
+
+    def append(self, entry):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _init_worker(apps):
+    _local.app = apps.get()
+    _local.baseline = dict(_local.app)
+
+
+def render(row, slot, out_dir, dry_run):
+    """Build the row's prompt and generate image #slot; returns an index entry."""
+    app = _local.app
+    app.clear()
+    app.update(_local.baseline)
+    recorder = app["st"]
+    recorder.reset()
+    entry = {"id": row["id"], "slot": slot, "mode": row["mode"], "preset": row.get("preset")}
+    started = time.time()
+    try:
+        prompt, aspect_ratio, refs = apply_row(app, row)
+        entry.update(prompt=prompt, aspect_ratio=aspect_ratio, model_quality=app["model_quality"])
+        if dry_run:
+            entry["status"] = "dry-run"
+            return entry
+        img_bytes, mime_type = app["smart_generate_image"](
+            prompt, headless.gemini_api_key(app),
+            reference_images=refs, aspect_ratio_str=aspect_ratio, cache_slot=slot,
+        )
+        if not img_bytes:
+            raise RuntimeError(recorder.errors[-1] if recorder.errors else "Gemini returned no image")
+        path = out_dir / f"{row['id']}_{slot + 1}.{result_cache.MIME_EXT.get(mime_type, 'png')}"
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_bytes(img_bytes)
+        os.replace(tmp, path)
+        entry.update(status="ok", path=str(path), mime=mime_type)
+    except Exception as e:
+        entry.update(status="failed", error=str(e))
+    entry["seconds"] = round(time.time() - started, 1)
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a manifest of campaign / product / ad creatives headless.")
+    parser.add_argument("manifest", help="JSONL or CSV manifest")
+    parser.add_argument("--out", default="renders", help="output directory (default: renders)")
+    parser.add_argument("--parallel", type=int, default=2, help="images generated at once (default 2)")
+    parser.add_argument("--dry-run", action="store_true", help="build and print the prompts, generate nothing")
+    args = parser.parse_args()
+
+    rows = load_manifest(args.manifest)
+    parallel = max(1, args.parallel)
+    apps = queue.SimpleQueue()
+    for _ in range(parallel):
+        app = headless.load_app()
+        app["st"] = headless.ErrorRecorder(app["st"])
+        apps.put(app)
+
+    problems = validate(rows, app)
+    if problems:
+        sys.exit("Manifest errors:\n  " + "\n  ".join(problems))
+    if not args.dry_run:
+        headless.gemini_api_key(app)  # fail now, not on every image
+
+    out_dir = Path(args.out)
+    image_dir = out_dir / "images"
+    image_dir.mkdir(parents=True, exist_ok=True)
+    index = Index(out_dir / "index.jsonl")
+    finished = set() if args.dry_run else index.done()
+    tasks = [(row, slot) for row in rows for slot in range(row["count"])
+             if (row["id"], slot) not in finished]
+    print(f"{len(tasks)} image(s) to render ({len(finished)} already done), {parallel} in parallel", flush=True)
+
+    started = time.time()
+    ok = failed = 0
+    with ThreadPoolExecutor(max_workers=parallel, initializer=_init_worker, initargs=(apps,)) as pool:
+        futures = [pool.submit(render, row, slot, image_dir, args.dry_run) for row, slot in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            label = f"{entry['id']} #{entry['slot'] + 1}"
+            if entry["status"] == "dry-run":
+                print(f"--- {label} ({entry['mode']}, {entry['aspect_ratio']})\n{entry['prompt']}\n", flush=True)
+                continue
+            index.append(entry)
+            if entry["status"] == "ok":
+                ok += 1
+            else:
+                failed += 1
+            rate = ok / (time.time() - started) * 3600
+            status = "ok" if entry["status"] == "ok" else f"FAILED: {entry['error']}"
+            print(f"[{done}/{len(tasks)}] {label} {status} ({entry['seconds']:.0f}s) — {rate:.0f} images/hour", flush=True)
+
+    if not args.dry_run:
+        elapsed = time.time() - started
+        print(f"Done: {ok} ok, {failed} failed in {elapsed / 60:.1f} min "
+              f"({ok / max(elapsed, 1e-9) * 3600:.0f} images/hour). Index: {index.path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
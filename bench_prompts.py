@@ -0,0 +1,215 @@
+"""Benchmark for the prompt builders — speed, allocations and output stability.
+
+    python bench_prompts.py --save      # record a baseline
+    python bench_prompts.py             # compare against it; exit 1 on regression
+
+Drives build_prompt_local, build_video_prompt, build_product_only_prompt,
+build_ad_creative_prompt and build_carousel_prompts on a headless copy of the
+app (headless.py) over a case set of every preset in presets.json plus a
+generated option grid: each selectbox / radio / select_slider option of
+main.py (read from its source) once, and a seeded sample of random
+combinations of them.
+
+Per builder it reports ops/sec (best of --rounds), allocated KiB per call
+(tracemalloc peak) and a digest of all outputs. A regression is ops/sec
+below or allocations above the baseline by more than --tolerance, or a
+changed digest (a refactor must not change a single prompt), or a case
+raising that did not raise in the baseline. Raising cases are left out of
+the timing and allocation figures, so an early exception can't pass for a
+speed-up. Timings are machine-specific, so the default baseline
+lives in the local cache dir.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import headless
+
+BUILDERS = ("build_prompt_local", "build_video_prompt", "build_product_only_prompt",
+            "build_ad_creative_prompt", "build_carousel_prompts")
+CHOICE_WIDGETS = ("selectbox", "radio", "select_slider")
+CACHE_ROOT = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+DEFAULT_BASELINE = CACHE_ROOT / "bench_prompts_baseline.json"
+
+
+def widget_options(path=headless.APP_PATH):
+    """{global name: [options]} for every `name = st.<choice widget>(label, [literal options])` in main.py."""
+    options = {}
+    for node in ast.walk(ast.parse(Path(path).read_text(encoding="utf-8"))):
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name) and isinstance(node.value, ast.Call)):
+            continue
+        func = node.value.func
+        if not (isinstance(func, ast.Attribute) and func.attr in CHOICE_WIDGETS
+                and isinstance(func.value, ast.Name) and func.value.id == "st"):
+            continue
+        arg = node.value.args[1] if len(node.value.args) > 1 else next(
+            (kw.value for kw in node.value.keywords if kw.arg == "options"), None)
+        try:
+            values = ast.literal_eval(arg) if arg is not None else None
+        except ValueError:
+            continue  # options computed at runtime
+        if isinstance(values, (list, tuple)) and values:
+            options.setdefault(node.targets[0].id, [])
+            options[node.targets[0].id] += [v for v in values if v not in options[node.targets[0].id]]
+    return options
+
+
+def build_cases(app, samples=200, seed=0):
+    """(label, settings) pairs: every preset, every option once, then random combinations."""
+    options = {name: values for name, values in widget_options().items() if name in app}
+    cases = [(f"preset:{name}", dict(values)) for name, values in app["PRESETS"].items()]
+    for name, values in options.items():
+        cases += [(f"{name}={value!r}", {name: value}) for value in values]
+    rng = random.Random(seed)
+    names = sorted(options)
+    for i in range(samples):
+        preset = rng.choice([None, *app["PRESETS"]])
+        settings = dict(app["PRESETS"][preset]) if preset else {}
+        settings.update({name: rng.choice(options[name]) for name in rng.sample(names, min(12, len(names)))})
+        cases.append((f"combo#{i}", settings))
+    return cases
+
+
+def _call(app, builder, args):
+    return app[builder](*args)
+
+
+def bench_builder(app, builder, cases, rounds):
+    """Run one builder over all cases; returns its result dict."""
+    baseline_ns = dict(app)
+    prepared = []
+    for label, settings in cases:
+        app.clear()
+        app.update(baseline_ns)
+        app.update(settings)
+        app["product"] = app["product"] or "Goldkette mit Diamant-Anhänger"
+        app["prod_name"] = app["prod_name"] or app["product"]
+        args = ()
+        if builder == "build_video_prompt":
+            # Its input is the image prompt — built here so it is not part of the timing
+            try:
+                args = (app["build_prompt_local"]()[0],)
+            except Exception:
+                args = ("",)
+        prepared.append((label, dict(app), args))
+    app.clear()
+    app.update(baseline_ns)
+
+    digest = hashlib.sha256()
+    errors = {}  # label -> "ExceptionType: message"
+    passing = []
+    for label, namespace, args in prepared:
+        app.clear()
+        app.update(namespace)
+        try:
+            digest.update(json.dumps(_call(app, builder, args), ensure_ascii=False).encode("utf-8"))
+        except Exception as e:
+            errors[label] = f"{type(e).__name__}: {e}"
+        else:
+            passing.append((namespace, args))
+
+    # Only cases that ran to the end are timed — the builders are deterministic, so they won't raise now
+    best = float("inf")
+    for _ in range(rounds):
+        elapsed = 0.0
+        for namespace, args in passing:
+            app.clear()
+            app.update(namespace)
+            start = time.perf_counter()
+            _call(app, builder, args)
+            elapsed += time.perf_counter() - start
+        best = min(best, elapsed)
+
+    peak_total = 0
+    tracemalloc.start()
+    try:
+        for namespace, args in passing:
+            app.clear()
+            app.update(namespace)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            _call(app, builder, args)
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    app.clear()
+    app.update(baseline_ns)
+    return {
+        "ops_per_sec": len(passing) / best if passing else 0.0,
+        "kib_per_call": peak_total / len(passing) / 1024 if passing else 0.0,
+        "digest": digest.hexdigest(),
+        "errors": errors,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages (empty if none)."""
+    problems = []
+    for builder, result in results.items():
+        base = baseline.get(builder)
+        if base is None:
+            continue
+        new_errors = [label for label in result["errors"] if label not in base["errors"]]
+        if new_errors:
+            shown = ", ".join(new_errors[:3]) + (f" (+{len(new_errors) - 3} more)" if len(new_errors) > 3 else "")
+            problems.append(f"{builder}: {len(new_errors)} case(s) raise that did not before: {shown}")
+        if result["digest"] != base["digest"]:
+            problems.append(f"{builder}: output changed (digest {base['digest'][:12]} → {result['digest'][:12]})")
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            problems.append(f"{builder}: {result['ops_per_sec']:.0f} ops/sec, baseline {base['ops_per_sec']:.0f}")
+        if result["kib_per_call"] > base["kib_per_call"] * (1 + tolerance):
+            problems.append(f"{builder}: {result['kib_per_call']:.1f} KiB/call, baseline {base['kib_per_call']:.1f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prompt builders.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds, best one counts (default 5)")
+    parser.add_argument("--samples", type=int, default=200, help="random option combinations (default 200)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown / allocation growth before failing (default 0.25)")
+    args = parser.parse_args()
+
+    app = headless.load_app()
+    cases = build_cases(app, args.samples)
+    print(f"{len(cases)} cases per builder, best of {args.rounds} rounds\n")
+    print(f"{'builder':<28} {'ops/sec':>10} {'KiB/call':>10}  digest")
+
+    results = {}
+    for builder in BUILDERS:
+        result = bench_builder(app, builder, cases, args.rounds)
+        results[builder] = result
+        print(f"{builder:<28} {result['ops_per_sec']:>10.0f} {result['kib_per_call']:>10.1f}  {result['digest'][:12]}")
+        for label, error in list(result["errors"].items())[:5]:
+            print(f"    ⚠ {label}: {error}")
+        if len(result["errors"]) > 5:
+            print(f"    ⚠ … {len(result['errors']) - 5} more errors")
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline} — run with --save first.")
+        return
+    problems = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    if problems:
+        print("\nREGRESSION:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
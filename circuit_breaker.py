@@ -0,0 +1,129 @@
+"""Process-wide circuit breaker per model name.
+
+closed    → requests flow; outcomes are kept in a rolling time window.
+open      → the error rate in the window crossed the threshold; the model is
+            skipped immediately until the cool-down has passed.
+half-open → after the cool-down exactly one probe request is let through;
+            success closes the breaker, failure opens it again.
+
+Only overload-type failures count (429 / 5xx / timeouts) — a bad prompt
+or a 400 says nothing about the model's health.
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+WINDOW_SECONDS = 120       # rolling window for the error rate
+MIN_REQUESTS = 3           # don't judge a model on fewer outcomes than this
+ERROR_RATE_THRESHOLD = 0.5
+COOLDOWN_SECONDS = 60      # how long an open breaker skips the model
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request to a model whose breaker is open."""
+
+    def __init__(self, model, retry_in):
+        super().__init__(f"Circuit open for {model} (retry in {retry_in:.0f}s)")
+        self.model = model
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Breaker for one model. Thread-safe; shared by all sessions."""
+
+    def __init__(self, name, window=WINDOW_SECONDS, min_requests=MIN_REQUESTS,
+                 threshold=ERROR_RATE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque()  # (monotonic time, ok)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through."""
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self):
+        """May a request be sent now? Moves open → half-open after the cool-down."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: a single probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, ok):
+        """Record the outcome of one request."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                if ok:
+                    self.state = CLOSED
+                else:
+                    self.state = OPEN
+                    self.opened_at = now
+                return
+            self._outcomes.append((now, ok))
+            self._trim(now)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_requests:
+                failures = sum(1 for _, outcome_ok in self._outcomes if not outcome_ok)
+                if failures / len(self._outcomes) >= self.threshold:
+                    self.state = OPEN
+                    self.opened_at = now
+
+    def error_rate(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            if not self._outcomes:
+                return 0.0
+            return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get(model):
+    """Breaker for a model name (created on first use)."""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(model)
+        return breaker
+
+
+def is_open(model):
+    """True while the model is being skipped (open and still cooling down)."""
+    breaker = get(model)
+    return breaker.state == OPEN and breaker.retry_in() > 0
+
+
+def open_models():
+    """[(model, seconds until probe)] for every currently open breaker."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [(b.name, b.retry_in()) for b in breakers if b.state == OPEN and b.retry_in() > 0]
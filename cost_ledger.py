@@ -0,0 +1,181 @@
+"""Cost ledger: estimated spend of every paid API call, with session and daily caps.
+
+Every Gemini image, Veo and GPT call that the API accepted is recorded with its
+estimated list price (see the price tables below — estimates, not the invoice).
+The ledger is a SQLite file next to the job queue, so the app, worker.py and
+batch.py processes all count against the same daily total.
+
+Caps are checked before a generation is dispatched: reserve() books the
+generation's estimate inside one write-locked transaction and fails with
+BudgetExceeded if it would cross a cap. The reservation counts towards the
+totals until release() — parallel runs cannot overshoot a cap together.
+A call recorded against a reservation moves its cost out of the reservation,
+so a generation in flight is never counted twice (estimate + actual).
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+CACHE_ROOT = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+DB_PATH = Path(os.environ.get("NANO_BANANA_COST_DB", CACHE_ROOT / "costs.sqlite3"))
+
+# Default caps in USD (0 = no cap); the app's sidebar and st.secrets can override them
+SESSION_BUDGET = float(os.environ.get("NANO_BANANA_SESSION_BUDGET", 0))
+DAILY_BUDGET = float(os.environ.get("NANO_BANANA_DAILY_BUDGET", 0))
+
+# USD per image — Flash ~$0.04, Pro ~$0.14 (1K/2K) to ~$0.24 (4K)
+FLASH_IMAGE_PRICE = 0.04
+PRO_IMAGE_PRICES = {"1K": 0.14, "2K": 0.14, "4K": 0.24}
+# USD per second of video
+VEO_PRICES_PER_SECOND = {"veo-3.0": 0.75, "veo-3.1": 0.40, "veo-2.0": 0.35}
+VEO_DEFAULT_SECONDS = 8
+# USD per GPT-4o polish call (~1.5k tokens in, ~0.5k out)
+GPT_POLISH_PRICE = 0.01
+
+RESERVATION_TTL = 900  # a reservation older than this belongs to a crashed process — ignored
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    model TEXT NOT NULL,
+    cost REAL NOT NULL,
+    reserved INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_day ON entries (day, session_id);
+"""
+
+_local = threading.local()
+
+
+class BudgetExceeded(Exception):
+    """Raised by reserve() when a call would cross the session or daily cap."""
+
+    def __init__(self, scope, spent, estimate, cap):
+        self.scope = scope  # "session" or "day"
+        self.spent = spent
+        self.estimate = estimate
+        self.cap = cap
+        super().__init__(f"{scope} budget: ${spent:.2f} spent + ${estimate:.2f} > cap ${cap:.2f}")
+
+
+def _connect():
+    """One connection per thread (sqlite3 connections must not be shared)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def image_price(model, image_size=None):
+    if "pro" in (model or "").lower():
+        return PRO_IMAGE_PRICES.get(image_size or "1K", PRO_IMAGE_PRICES["1K"])
+    return FLASH_IMAGE_PRICE
+
+
+def veo_price(model, seconds=None):
+    per_second = next((price for prefix, price in VEO_PRICES_PER_SECOND.items() if prefix in (model or "")),
+                      max(VEO_PRICES_PER_SECOND.values()))
+    return per_second * (seconds or VEO_DEFAULT_SECONDS)
+
+
+def current():
+    """Reservation bound to this thread (see bind()), or None."""
+    return getattr(_local, "reservation", None)
+
+
+def bind(reservation_id):
+    """Make reservation_id the one this thread's paid calls are recorded against (None unbinds)."""
+    _local.reservation = reservation_id
+
+
+def record(session_id, kind, model, cost, reservation=None):
+    """Book one paid call (kind: "image", "video" or "polish").
+
+    reservation: id from reserve() that covered this call — the cost is taken out of it in
+    the same transaction, so the call is not counted twice until release().
+    """
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if reservation is not None:
+            conn.execute("UPDATE entries SET cost = MAX(0, cost - ?) WHERE id = ? AND reserved = 1",
+                         (cost, reservation))
+        conn.execute(
+            "INSERT INTO entries (created_at, day, session_id, kind, model, cost) VALUES (?, ?, ?, ?, ?, ?)",
+            (now, date.fromtimestamp(now).isoformat(), session_id, kind, model, cost),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _totals(conn, session_id):
+    live = "(reserved = 0 OR created_at > ?)"
+    fresh_after = time.time() - RESERVATION_TTL
+    session_total = conn.execute(f"SELECT COALESCE(SUM(cost), 0) FROM entries WHERE session_id = ? AND {live}",
+                                 (session_id, fresh_after)).fetchone()[0]
+    day_total = conn.execute(f"SELECT COALESCE(SUM(cost), 0) FROM entries WHERE day = ? AND {live}",
+                             (date.today().isoformat(), fresh_after)).fetchone()[0]
+    return session_total, day_total
+
+
+def totals(session_id):
+    """(session total, total of today across all sessions) in USD, including open reservations."""
+    return _totals(_connect(), session_id)
+
+
+def check(session_id, estimate, session_cap=None, daily_cap=None, conn=None):
+    """Raise BudgetExceeded if estimate more would cross a cap (None / 0 = no cap)."""
+    session_total, day_total = _totals(conn or _connect(), session_id)
+    if session_cap and session_total + estimate > session_cap + 1e-9:
+        raise BudgetExceeded("session", session_total, estimate, session_cap)
+    if daily_cap and day_total + estimate > daily_cap + 1e-9:
+        raise BudgetExceeded("day", day_total, estimate, daily_cap)
+
+
+def reserve(session_id, estimate, session_cap=None, daily_cap=None):
+    """Check the caps and hold estimate until release(); returns the reservation id."""
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        check(session_id, estimate, session_cap, daily_cap, conn=conn)
+        cursor = conn.execute(
+            "INSERT INTO entries (created_at, day, session_id, kind, model, cost, reserved) "
+            "VALUES (?, ?, ?, 'reservation', '', ?, 1)",
+            (now, date.fromtimestamp(now).isoformat(), session_id, estimate),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.lastrowid
+
+
+def release(reservation_id):
+    conn = _connect()
+    conn.execute("DELETE FROM entries WHERE id = ? AND reserved = 1", (reservation_id,))
+    # Reservations left behind by crashed processes
+    conn.execute("DELETE FROM entries WHERE reserved = 1 AND created_at < ?", (time.time() - RESERVATION_TTL,))
+
+
+def breakdown(session_id):
+    """Today's booked spend of this session: [(kind, model, calls, USD)]."""
+    return _connect().execute(
+        "SELECT kind, model, COUNT(*), SUM(cost) FROM entries WHERE session_id = ? AND day = ? AND reserved = 0 "
+        "GROUP BY kind, model ORDER BY SUM(cost) DESC",
+        (session_id, date.today().isoformat()),
+    ).fetchall()
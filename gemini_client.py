@@ -0,0 +1,163 @@
+"""Shared HTTP plumbing for the Gemini / Veo REST calls.
+
+Lives outside main.py on purpose: Streamlit re-executes the app script on
+every rerun, but imported modules stay in memory — so everything in here is
+process-wide and shared by all sessions and threads.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import timings
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+# Point at a stand-in (python mock_server.py) with GEMINI_BASE_URL=http://127.0.0.1:8700/v1beta
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+# Connection pool sizing — one host (generativelanguage.googleapis.com), but
+# several sessions / parallel generations may hit it at the same time.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# Split timeouts: connecting should be fast, reading may take minutes (Pro / 2K).
+CONNECT_TIMEOUT = 10
+
+# How long a discovered image model stays valid before /models is asked again
+MODEL_CACHE_TTL = 30 * 60
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled keep-alive session (created lazily, thread-safe)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                    max_retries=0,  # retries are handled by the callers
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                _session = session
+    return _session
+
+
+def split_timeout(read_timeout):
+    """Build a (connect, read) timeout tuple for requests."""
+    return (CONNECT_TIMEOUT, read_timeout)
+
+
+def http_get(url, read_timeout=30, **kwargs):
+    """GET through the pooled session."""
+    return _request("GET", url, read_timeout, kwargs)
+
+
+def http_post(url, read_timeout=180, **kwargs):
+    """POST through the pooled session.
+
+    Inside a timings trace the body is streamed through an UploadTimer, so the
+    call splits into "upload" (until the last byte is sent) and "server_wait"
+    (until the response headers arrive).
+    """
+    if "json" in kwargs:
+        # Serialized here so the body size is known for the metrics
+        kwargs["data"] = json.dumps(kwargs.pop("json")).encode("utf-8")
+        kwargs["headers"] = {"Content-Type": "application/json", **(kwargs.get("headers") or {})}
+    upload = None
+    if timings.current() is not None and kwargs.get("data") is not None:
+        upload = kwargs["data"] = timings.UploadTimer(kwargs["data"])
+    return _request("POST", url, read_timeout, kwargs, upload)
+
+
+def _request(method, url, read_timeout, kwargs, upload=None):
+    """Send one request; records timings spans and metrics for it."""
+    started = time.perf_counter()
+    response = None
+    code = None
+    try:
+        response = get_session().request(method, url, timeout=split_timeout(read_timeout), **kwargs)
+        code = response.status_code
+        return response
+    except Exception as e:
+        code = type(e).__name__
+        raise
+    finally:
+        answered = time.perf_counter()
+        if upload is not None:
+            sent = upload.sent_at or started
+            timings.add("upload", sent - started, start=started)
+            timings.add("server_wait", answered - sent, start=sent)
+        body = kwargs.get("data")
+        received = len(response.content) if response is not None and not kwargs.get("stream") else 0
+        metrics.observe_http(method, url, code, answered - started,
+                             bytes_sent=len(body) if hasattr(body, "__len__") else 0, bytes_received=received)
+
+
+def key_fingerprint(api_key):
+    """Stable, non-reversible id for an API key (never keep raw keys as cache keys)."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class TTLCache:
+    """Small thread-safe dict with per-entry expiry."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    def invalidate(self, predicate=None):
+        """Drop all entries, or only those whose key matches predicate(key)."""
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if predicate(k)]:
+                    del self._data[key]
+
+
+# (key fingerprint, prefer_pro) -> model name picked by find_gemini_image_model
+_model_cache = TTLCache(MODEL_CACHE_TTL)
+
+
+def get_cached_model(api_key, prefer_pro):
+    """Return the cached image model for this key/quality, or None."""
+    return _model_cache.get((key_fingerprint(api_key), bool(prefer_pro)))
+
+
+def cache_model(api_key, prefer_pro, model_name):
+    """Remember the image model picked for this key/quality."""
+    _model_cache.set((key_fingerprint(api_key), bool(prefer_pro)), model_name)
+
+
+def invalidate_model_cache(api_key):
+    """Forget discovered models for this key (e.g. after a 404)."""
+    fingerprint = key_fingerprint(api_key)
+    _model_cache.invalidate(lambda key: key[0] == fingerprint)
@@ -0,0 +1,131 @@
+"""Run the app's prompt builders and generation functions outside `streamlit run`.
+
+main.py is a Streamlit script: its widgets *are* the configuration, and the
+builders / generators read them as module globals. Executed without a
+Streamlit server ("bare mode") every widget returns its default value, buttons
+return False and st.* output calls do nothing — so executing the script once
+yields a namespace with every function plus default settings. A preset from
+presets.json and explicit overrides are then simply written over those globals.
+
+Used by the job-queue workers (worker.py) and the batch CLI (batch.py).
+"""
+import copy
+import io
+import os
+from pathlib import Path
+
+import streamlit as st
+from streamlit import config as streamlit_config
+from streamlit import logger as streamlit_logger
+
+APP_PATH = Path(__file__).resolve().parent / "main.py"
+
+# Section toggles switched on while loading, so the widget globals of every
+# prompt builder (campaign, video, product-only, ad creative) exist
+SECTION_TOGGLES = ("Video-Prompt aktivieren", "Product-Only Prompt aktivieren", "Ad Creative Modus aktivieren")
+
+
+def load_app():
+    """Execute main.py headless and return its globals (functions + default widget values)."""
+    # Bare mode logs a warning for every st.* call — nobody is watching here
+    # (load the config first — parsing it would reset the level)
+    streamlit_config.get_config_options()
+    streamlit_logger.set_log_level("error")
+    namespace = {"__name__": "nano_banana_headless", "__file__": str(APP_PATH)}
+    checkbox = st.checkbox
+
+    def _checkbox(label, *args, **kwargs):
+        return True if label in SECTION_TOGGLES else checkbox(label, *args, **kwargs)
+
+    st.checkbox = _checkbox
+    try:
+        exec(compile(APP_PATH.read_text(encoding="utf-8"), str(APP_PATH), "exec"), namespace)
+    finally:
+        st.checkbox = checkbox
+    return namespace
+
+
+def apply_settings(app, preset=None, overrides=None):
+    """Write a preset (name from presets.json) and/or overrides over the app's widget globals."""
+    if preset:
+        if preset not in app["PRESETS"]:
+            raise ValueError(f"Unknown preset {preset!r} — available: {', '.join(app['PRESETS'])}")
+        app.update(app["PRESETS"][preset])
+    if overrides:
+        unknown = [key for key in overrides if key not in app]
+        if unknown:
+            raise ValueError(f"Unknown setting(s): {', '.join(unknown)}")
+        app.update(overrides)
+    return app
+
+
+def gemini_api_key(app=None):
+    """API key for headless runs: GEMINI_API_KEY from the environment, else the app's secrets."""
+    key = os.environ.get("GEMINI_API_KEY")
+    if not key and app is not None:
+        key = app.get("gemini_key")
+    if not key:
+        raise RuntimeError("GEMINI_API_KEY is not set (environment or .streamlit/secrets.toml)")
+    return key
+
+
+def open_reference(path):
+    """Reference image from disk in the shape the generators expect (an upload-like buffer)."""
+    upload = io.BytesIO(Path(path).read_bytes())
+    upload.name = Path(path).name
+    return upload
+
+
+class SessionState(dict):
+    """Dict-backed stand-in for st.session_state (item and attribute access)."""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(f"st.session_state has no key {key!r}") from None
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError:
+            raise AttributeError(f"st.session_state has no key {key!r}") from None
+
+    def to_dict(self):
+        return dict(self)
+
+
+class ErrorRecorder:
+    """Stand-in for the app's `st` that keeps st.error / st.warning messages for the caller.
+
+    In bare mode those calls are no-ops, so without this a failed generation
+    would only ever report "no image". It also gives the app its own
+    session_state: the bare-mode one is process-wide, so apps rendering in
+    parallel threads would share the cached model, quality mode etc.
+    Everything else is passed through.
+    """
+
+    def __init__(self, st):
+        self._st = st
+        self.errors = []
+        # Seeded with what executing main.py put into the bare-mode state
+        self._initial_state = copy.deepcopy(st.session_state.to_dict())
+        self.session_state = SessionState(copy.deepcopy(self._initial_state))
+
+    def reset(self):
+        """Forget the previous job: recorded errors and session_state."""
+        self.errors.clear()
+        self.session_state.clear()
+        self.session_state.update(copy.deepcopy(self._initial_state))
+
+    def error(self, body, *args, **kwargs):
+        self.errors.append(str(body))
+
+    def warning(self, body, *args, **kwargs):
+        self.errors.append(str(body))
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
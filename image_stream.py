@@ -0,0 +1,129 @@
+"""Memory-lean handling of the multi-MB base64 images in Gemini responses.
+
+response.json() keeps the raw body, the decoded JSON string of the base64
+payload and finally the decoded bytes alive at once. Here the body is read in
+chunks: everything except the image's base64 string is collected into a small
+JSON "skeleton" (the data string left empty), and the base64 is decoded
+incrementally into one BytesIO, whose getvalue() hands over its buffer
+without another copy.
+
+The reverse direction (sending an image back, e.g. Hybrid Flash → Pro) is
+covered by InlineJSONBody, which base64-encodes the raw bytes on the fly while
+requests streams the request body.
+"""
+import base64
+import binascii
+import io
+import json
+import re
+
+import metrics
+import timings
+
+CHUNK_SIZE = 64 * 1024
+
+_DATA_KEY = re.compile(rb'"data"\s*:\s*"')
+
+
+def _decode_into(out, pending):
+    """Decode the 4-aligned prefix of pending into out; return the rest."""
+    usable = len(pending) - len(pending) % 4
+    if usable:
+        out.write(binascii.a2b_base64(pending[:usable]))
+    return pending[usable:]
+
+
+def decode_image_response(response, chunk_size=CHUNK_SIZE):
+    """Stream a generateContent response (requested with stream=True).
+
+    Returns (image_bytes, mime_type, data): the first inline image (or None,
+    None) plus the parsed response with every inlineData.data emptied — enough
+    for finishReason, text parts and error details.
+    """
+    with timings.span("download_decode"):
+        return _decode_image_response(response, chunk_size)
+
+
+def _decode_image_response(response, chunk_size):
+    skeleton = bytearray()
+    out = None
+    pending = b""
+    in_data = False
+    keep = False
+    scan_from = 0
+    received = 0
+    try:
+        for chunk in response.iter_content(chunk_size):
+            received += len(chunk)
+            while chunk:
+                if in_data:
+                    end = chunk.find(b'"')
+                    piece = chunk if end < 0 else chunk[:end]
+                    if keep:
+                        # The only JSON escape possible inside base64 is "\/"
+                        pending = _decode_into(out, pending + piece.replace(b"\\", b""))
+                    if end < 0:
+                        break
+                    skeleton += b'"'
+                    in_data = False
+                    keep = False
+                    chunk = chunk[end + 1:]
+                    continue
+
+                skeleton += chunk
+                match = _DATA_KEY.search(skeleton, scan_from)
+                if match is None:
+                    scan_from = max(0, len(skeleton) - 16)  # a key may straddle two chunks
+                    break
+                chunk = bytes(skeleton[match.end():])
+                del skeleton[match.end():]
+                scan_from = len(skeleton)
+                in_data = True
+                # First image only, and only real inlineData objects (no braces in between)
+                keep = out is None and skeleton.rfind(b'"inlineData"') > skeleton.rfind(b"}")
+                if keep:
+                    out = io.BytesIO()
+    finally:
+        response.close()
+        metrics.BYTES_RECEIVED.inc(received, model=metrics.model_from_url(response.url))
+
+    if pending:
+        out.write(binascii.a2b_base64(pending + b"=" * (-len(pending) % 4)))
+    data = json.loads(bytes(skeleton)) if skeleton else {}
+
+    if out is None:
+        return None, None, data
+    mime_type = "image/png"
+    for candidate in data.get("candidates", []):
+        for part in candidate.get("content", {}).get("parts", []):
+            if "inlineData" in part:
+                mime_type = part["inlineData"].get("mimeType", mime_type)
+                return out.getvalue(), mime_type, data
+    return out.getvalue(), mime_type, data
+
+
+class InlineJSONBody:
+    """Request body: payload as JSON, with placeholder replaced by base64(raw).
+
+    Iterable and sized, so requests streams it with a proper Content-Length and
+    can re-send it on retry; the base64 text never exists as a whole.
+    """
+
+    PLACEHOLDER = "__inline_image_data__"
+
+    def __init__(self, payload, raw, chunk_size=3 * 16 * 1024):
+        text = json.dumps(payload)
+        head, tail = text.split(self.PLACEHOLDER, 1)
+        self.head = head.encode("utf-8")
+        self.tail = tail.encode("utf-8")
+        self.raw = memoryview(raw)
+        self.chunk_size = chunk_size - chunk_size % 3  # keep chunks free of padding
+
+    def __len__(self):
+        return len(self.head) + 4 * ((len(self.raw) + 2) // 3) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        for start in range(0, len(self.raw), self.chunk_size):
+            yield base64.b64encode(self.raw[start:start + self.chunk_size])
+        yield self.tail
@@ -0,0 +1,193 @@
+"""Durable generation job queue (SQLite) shared by the app and worker processes.
+
+The app enqueues image / video jobs and shows them by session id; worker
+processes (worker.py) claim queued jobs, run them and store the result as a
+file under RESULTS_DIR. Everything survives browser refreshes and app
+restarts — a session re-attaches by its id (?jobs=<id> in the URL).
+
+Several workers — also on several machines sharing the volume — can drain the
+same queue: a job is claimed inside one IMMEDIATE (write-locked) transaction, and
+running jobs send heartbeats so a crashed worker's job is re-queued.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+CACHE_ROOT = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+DB_PATH = Path(os.environ.get("NANO_BANANA_JOB_DB", CACHE_ROOT / "jobs.sqlite3"))
+RESULTS_DIR = CACHE_ROOT / "results"
+REFS_DIR = CACHE_ROOT / "refs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 120    # running job without heartbeat for this long → worker is gone
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    result_path TEXT,
+    result_mime TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created_at);
+"""
+
+_local = threading.local()
+
+
+def _connect():
+    """One connection per thread (sqlite3 connections must not be shared)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def store_reference(upload):
+    """Persist an uploaded reference image for the workers; returns its path (content-addressed)."""
+    data = upload.getvalue()
+    suffix = Path(getattr(upload, "name", "") or "ref.jpg").suffix.lower() or ".jpg"
+    path = REFS_DIR / f"{hashlib.sha256(data).hexdigest()}{suffix}"
+    if not path.exists():
+        REFS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return str(path)
+
+
+def enqueue(session_id, kind, params):
+    """Add a job ("image" or "video"); returns its id."""
+    job_id = uuid.uuid4().hex[:12]
+    _connect().execute(
+        "INSERT INTO jobs (id, session_id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (job_id, session_id, kind, json.dumps(params), QUEUED, time.time()),
+    )
+    return job_id
+
+
+def get(job_id):
+    return _row_to_job(_connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def list_jobs(session_id):
+    rows = _connect().execute(
+        "SELECT * FROM jobs WHERE session_id = ? ORDER BY created_at", (session_id,)
+    ).fetchall()
+    return [_row_to_job(r) for r in rows]
+
+
+def claim(worker_id):
+    """Atomically take the oldest queued job; returns it or None."""
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+            "started_at = ?, heartbeat_at = ? WHERE id = ?",
+            (RUNNING, worker_id, now, now, row["id"]),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return get(row["id"])
+
+
+# complete() / fail() / heartbeat() only touch a job the calling worker still holds — after
+# requeue_stale() another worker may have claimed it, and that worker's outcome counts.
+
+def heartbeat(job_id, worker_id):
+    _connect().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                       (time.time(), job_id, worker_id, RUNNING))
+
+
+def complete(job_id, worker_id, result_path, result_mime):
+    """Mark the job done; False if the worker no longer holds it."""
+    return _connect().execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, result_path = ?, result_mime = ?, error = NULL "
+        "WHERE id = ? AND worker = ? AND status = ?",
+        (DONE, time.time(), result_path, result_mime, job_id, worker_id, RUNNING),
+    ).rowcount == 1
+
+
+def fail(job_id, worker_id, error):
+    """Mark the job failed; False if the worker no longer holds it."""
+    return _connect().execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ? AND worker = ? AND status = ?",
+        (FAILED, time.time(), error, job_id, worker_id, RUNNING),
+    ).rowcount == 1
+
+
+def requeue_stale():
+    """Give jobs of vanished workers back to the queue (or fail them after MAX_ATTEMPTS)."""
+    conn = _connect()
+    cutoff = time.time() - STALE_AFTER
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, error = 'Worker abgestürzt (zu viele Versuche)' "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, time.time(), RUNNING, cutoff, MAX_ATTEMPTS),
+        )
+        requeued = conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, cutoff),
+        ).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return requeued
+
+
+def delete_finished(session_id):
+    """Remove a session's finished jobs and their result files."""
+    conn = _connect()
+    rows = conn.execute("SELECT id, result_path FROM jobs WHERE session_id = ? AND status IN (?, ?)",
+                        (session_id, DONE, FAILED)).fetchall()
+    for row in rows:
+        if row["result_path"]:
+            Path(row["result_path"]).unlink(missing_ok=True)
+    conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
@@ -2,9 +2,28 @@ import streamlit as st
 import json
 import os
 import requests
-import base64
+import hashlib
+import queue
+import threading
+import time
+import gemini_client
+import reference_images as reference_images_store
+import result_cache
+import retry_policy
+import circuit_breaker
+import cost_ledger
+import image_stream
+import veo_jobs
+import job_queue
+import timings
+import metrics
+import text_overlay
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
+from functools import partial
 from jinja2 import Template
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -12,6 +31,10 @@ st.set_page_config(
     page_icon="🍌",
     layout="wide"
 )
+if __name__ == "__main__":
+    # Once per app process — /metrics for Prometheus. Not from headless runs (worker.py, batch.py),
+    # which would take the port first and shadow the app's metrics.
+    metrics.serve()
 
 # --- LOAD TEMPLATE & PRESETS ---
 # Works on both local and Streamlit Cloud
@@ -34,6 +57,9 @@ with open(SCRIPT_DIR / "presets.json", "r", encoding="utf-8") as f:
 # --- SESSION STATE ---
 if "prompt_history" not in st.session_state:
     st.session_state.prompt_history = []
+if "queue_session_id" not in st.session_state:
+    # ?jobs=<id> in the URL re-attaches to the queued jobs of an earlier session
+    st.session_state.queue_session_id = st.query_params.get("jobs") or uuid.uuid4().hex[:12]
 
 # --- CUSTOM CSS ---
 st.markdown("""
@@ -254,6 +280,45 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# --- COST LEDGER ---
+def cost_session_id():
+    """Ledger key of this session — the job-queue session id, so worker jobs count towards it too."""
+    return st.session_state.get("queue_session_id") or "headless"
+
+
+def show_spend():
+    """Running totals in the sidebar (refreshed after every paid call)."""
+    session_total, day_total = cost_ledger.totals(cost_session_id())
+    session_cap = f" / ${session_budget:.2f}" if session_budget else ""
+    day_cap = f" / ${daily_budget:.2f}" if daily_budget else ""
+    spend_slot.caption(f"💰 Session: **${session_total:.2f}**{session_cap} · Heute: **${day_total:.2f}**{day_cap}")
+
+
+def budget_message(e):
+    scope = "Session-Budget" if e.scope == "session" else "Tagesbudget"
+    return (f"💰 {scope} erreicht — bisher ${e.spent:.2f}, geplant ~${e.estimate:.2f}, "
+            f"Limit ${e.cap:.2f}. Nichts gesendet.")
+
+
+def budget_allows(estimate):
+    """Check a paid call against the session / daily caps before dispatching it; shows why if not."""
+    try:
+        cost_ledger.check(cost_session_id(), estimate, session_budget, daily_budget)
+    except cost_ledger.BudgetExceeded as e:
+        st.error(budget_message(e))
+        return False
+    return True
+
+
+def reserve_budget(estimate):
+    """Hold estimate against the caps until cost_ledger.release(); None (error shown) if it does not fit."""
+    try:
+        return cost_ledger.reserve(cost_session_id(), estimate, session_budget, daily_budget)
+    except cost_ledger.BudgetExceeded as e:
+        st.error(budget_message(e))
+        return None
+
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.markdown("## 🔑 Settings")
@@ -267,6 +332,11 @@ with st.sidebar:
         gemini_key = st.text_input("Gemini API Key", type="password", help="Für Bild-Generierung mit Gemini.")
         if not gemini_key:
             st.caption("Optional: Für direkte Bild-Generierung.")
+    # API endpoint override (e.g. the local stand-in from mock_server.py) — env var or secrets
+    if "GEMINI_BASE_URL" in st.secrets:
+        gemini_client.GEMINI_BASE_URL = st.secrets["GEMINI_BASE_URL"].rstrip("/")
+    if gemini_client.GEMINI_BASE_URL != gemini_client.DEFAULT_BASE_URL:
+        st.caption(f"🧪 API-Endpunkt: `{gemini_client.GEMINI_BASE_URL}`")
 
     # Model quality selector
     st.markdown("**🎯 Bild-Modell Qualität**")
@@ -278,8 +348,120 @@ with st.sidebar:
     )
     if "💎 Pro" in model_quality:
         st.caption("⚠️ Pro kostet ca. 4-6x mehr pro Bild, liefert aber deutlich realistischere Ergebnisse.")
+    # Pro tail latency: optionally race a backup request after a threshold
+    hedge_after = None
+    hedge_backup = "standard"
+    if "💎 Pro" in model_quality:
+        with st.expander("⏱️ Pro-Hedging (Latenz-Absicherung)"):
+            use_hedging = st.checkbox(
+                "Backup-Anfrage bei langsamer Pro-Generierung", value=False,
+                help="Braucht Pro länger als die Schwelle, wird parallel eine Backup-Anfrage gestartet. "
+                     "Das schnellere Bild gewinnt. Kann doppelte Kosten verursachen."
+            )
+            hedge_threshold = st.slider("Backup starten nach (s)", min_value=30, max_value=240, value=90, step=10,
+                                        disabled=not use_hedging)
+            hedge_backup_label = st.radio("Backup-Anfrage", ["Pro Standard-Auflösung", "Flash"], horizontal=True,
+                                          disabled=not use_hedging)
+        if use_hedging:
+            hedge_after = hedge_threshold
+            hedge_backup = "flash" if hedge_backup_label == "Flash" else "standard"
+    # Budget caps — checked before every paid call (estimated list prices, see cost_ledger.py)
+    with st.expander("💰 Budget"):
+        session_budget = st.number_input(
+            "Limit pro Session ($)", min_value=0.0, value=cost_ledger.SESSION_BUDGET, step=1.0,
+            help="Geschätzte Kosten aller Bild-, Video- und GPT-Aufrufe dieser Session. 0 = kein Limit."
+        )
+        if "DAILY_BUDGET_USD" in st.secrets:
+            daily_budget = float(st.secrets["DAILY_BUDGET_USD"])
+        else:
+            daily_budget = cost_ledger.DAILY_BUDGET
+        if daily_budget:
+            st.caption(f"Tageslimit (alle Sessions & Worker): ${daily_budget:.2f} — fest eingestellt")
+        else:
+            daily_budget = st.number_input(
+                "Limit pro Tag ($, alle Sessions)", min_value=0.0, value=0.0, step=5.0,
+                help="Gilt für alle Sessions und Worker zusammen. 0 = kein Limit. "
+                     "Fest einstellen: DAILY_BUDGET_USD in secrets oder NANO_BANANA_DAILY_BUDGET."
+            )
+    spend_slot = st.empty()
+    show_spend()
+
+    # Hybrid runs of several images: stage limits of the Flash → Pro pipeline (run_hybrid_pipeline)
+    hybrid_flash_workers = hybrid_pro_workers = 2
     if "🔀 Hybrid" in model_quality:
         st.caption("🔀 **Hybrid:** Schritt 1: Flash generiert das Bild OHNE Text (treue Produkt-Wiedergabe). Schritt 2: Pro fügt Text-Overlays hinzu + verfeinert Haut, Licht & Details (ohne Produkt zu ändern). Kosten: ~$0.18-0.28/Bild.")
+        with st.expander("🔀 Hybrid-Pipeline"):
+            st.caption("Bei mehreren Bildern generiert Flash schon das nächste Bild, während Pro das vorige verfeinert.")
+            hybrid_flash_workers = st.slider("Flash-Schritte gleichzeitig", min_value=1, max_value=5, value=2)
+            hybrid_pro_workers = st.slider(
+                "Pro-Schritte gleichzeitig", min_value=1, max_value=5, value=2,
+                help="Je Stufe höchstens so viele wie ⚡ Parallele Anfragen — insgesamt laufen bis zu Flash + Pro Anfragen."
+            )
+
+    # Hybrid step 2 alternative: set the ad texts locally instead of the Pro text pass
+    hybrid_local_text = False
+    overlay_layout = text_overlay.DEFAULT_LAYOUT
+    overlay_font_pack = text_overlay.DEFAULT_FONT_PACK
+    if "🔀 Hybrid" in model_quality:
+        with st.expander("🖋️ Hybrid-Text"):
+            hybrid_text_label = st.radio(
+                "Text rendern mit", ["💎 Pro (Text + Feinschliff)", "🖋️ Lokal (exakte Schrift, sofort)"],
+                help="Lokal: Headline, Subline, CTA und Angebot werden mit Pillow auf das Flash-Bild gesetzt — "
+                     "100% korrekt geschrieben, kein Pro-Aufruf (~$0.04 statt ~$0.18/Bild), aber ohne Pro-Feinschliff."
+            )
+            hybrid_local_text = hybrid_text_label.startswith("🖋️")
+            overlay_layout = st.selectbox("Text-Layout", list(text_overlay.LAYOUTS), disabled=not hybrid_local_text)
+            overlay_font_pack = st.selectbox("Schrift", list(text_overlay.FONT_PACKS), disabled=not hybrid_local_text)
+            if hybrid_local_text:
+                fonts = text_overlay.available_fonts(overlay_font_pack)
+                st.caption(f"Schriftdateien: {fonts['headline'] or 'eingebaut'} / {fonts['body'] or 'eingebaut'} "
+                           "— eigene .ttf/.otf in den Ordner fonts/ legen.")
+
+    # Reference image preprocessing (applied before upload to Gemini)
+    with st.expander("🖼️ Referenzbild-Optimierung"):
+        use_ref_preprocess = st.checkbox(
+            "Referenzbilder vor dem Senden optimieren", value=True,
+            help="Dreht nach EXIF, entfernt Metadaten (GPS etc.), verkleinert und komprimiert neu. Spart Upload-Zeit bei jeder Anfrage."
+        )
+        ref_max_edge = st.select_slider("Max. Kantenlänge (px)", options=[1024, 1536, 2048, 3072], value=1536,
+                                        disabled=not use_ref_preprocess)
+        ref_format = st.radio("Format", ["JPEG", "WEBP"], horizontal=True, disabled=not use_ref_preprocess)
+        ref_quality = st.slider("Qualität", min_value=60, max_value=95, value=90, disabled=not use_ref_preprocess)
+    ref_preprocess = {"max_edge": ref_max_edge, "format": ref_format, "quality": ref_quality} if use_ref_preprocess else None
+
+    # Concurrency cap for multi-image runs
+    max_parallel = st.slider(
+        "⚡ Parallele Anfragen", min_value=1, max_value=5, value=2,
+        help="Wie viele Bilder gleichzeitig bei Gemini angefragt werden. Höher = schneller, aber Gefahr von 429 (Rate-Limit). "
+             "Ausnahme: die drei 3-2-2-Varianten laufen immer gleichzeitig."
+    )
+
+    # On-disk result cache — identical requests are served without a new API call
+    force_fresh = st.checkbox(
+        "🔄 Immer neu generieren (Cache ignorieren)", value=False,
+        help="Aus: identische Anfragen (gleicher Prompt, Modell, Referenzbilder, Format) kommen kostenlos aus dem Cache. "
+             "An: jedes Mal eine neue Variation von Gemini anfordern."
+    )
+    cached_count, cached_bytes = result_cache.stats()
+    if cached_count:
+        st.caption(f"♻️ Cache: {cached_count} Bild(er), {cached_bytes / 1e6:.0f} MB")
+
+    # Models currently skipped by the circuit breaker (shared by all sessions)
+    for open_model, retry_in in circuit_breaker.open_models():
+        st.caption(f"🚧 {open_model} überlastet — wird übersprungen (nächster Test in {retry_in:.0f}s)")
+
+    # Durable job queue — campaign images and videos run in worker processes (python worker.py)
+    use_job_queue = st.checkbox(
+        "🗄️ Über Job-Queue generieren", value="jobs" in st.query_params,
+        help="Campaign-Bilder und Videos werden von Worker-Prozessen (`python worker.py`) erzeugt. "
+             "Ergebnisse überleben Reload und App-Neustart; die Session-ID in der URL verbindet wieder."
+    )
+    if use_job_queue:
+        reattach_id = st.text_input("Session-ID", value=st.session_state.queue_session_id,
+                                    help="ID einer früheren Session eintragen, um deren Jobs wieder anzuzeigen.")
+        if reattach_id.strip():
+            st.session_state.queue_session_id = reattach_id.strip()
+        st.query_params["jobs"] = st.session_state.queue_session_id
 
     st.markdown("---")
 
@@ -1513,6 +1695,16 @@ if use_ad_creative:
 
 
 # --- AD CREATIVE PROMPT BUILDER ---
+# Ad format → aspect ratio string for Gemini
+AD_FORMAT_ASPECT_RATIOS = {
+    "Facebook Feed (1:1 Quadrat)": "1:1",
+    "Facebook Feed (4:5 Hochformat)": "4:5",
+    "Instagram Story / Reels (9:16)": "9:16",
+    "Facebook Cover / Banner (16:9)": "16:9",
+    "Carousel Einzelbild (1:1)": "1:1",
+}
+
+
 def build_ad_creative_prompt():
     """Build a prompt for generating Facebook/Instagram Ad Creatives."""
 
@@ -2425,6 +2617,7 @@ def build_product_only_prompt():
     return "\n".join(cleaned).strip()
 
 
+@metrics.instrument("polish_with_gpt")
 def polish_with_gpt(raw_prompt, api_key):
     """Optional: refine the template prompt with GPT-4o."""
     from openai import OpenAI
@@ -2435,6 +2628,9 @@ Take the given structured prompt and rewrite it as a single, flowing, highly det
 Keep ALL technical details. Make it more vivid and cinematic in language.
 Do NOT add or remove any specifications — only improve the prose and flow."""
 
+    reservation = reserve_budget(cost_ledger.GPT_POLISH_PRICE)
+    if reservation is None:
+        return None
     try:
         response = client.chat.completions.create(
             model="gpt-4o",
@@ -2444,17 +2640,33 @@ Do NOT add or remove any specifications — only improve the prose and flow."""
             ],
             temperature=0.6
         )
+        cost_ledger.record(cost_session_id(), "polish", "gpt-4o", cost_ledger.GPT_POLISH_PRICE, reservation)
         return response.choices[0].message.content
     except Exception as e:
         st.error(f"GPT Polish Fehler: {e}")
         return None
+    finally:
+        cost_ledger.release(reservation)
+        show_spend()
 
 
 def find_gemini_image_model(gemini_api_key, prefer_pro=False):
-    """Find the correct Gemini model that supports image generation."""
+    """Find the correct Gemini model that supports image generation (cached process-wide per key + quality)."""
+    cached = gemini_client.get_cached_model(gemini_api_key, prefer_pro)
+    if cached:
+        return cached
+
+    model_name = _discover_gemini_image_model(gemini_api_key, prefer_pro)
+    if model_name:
+        gemini_client.cache_model(gemini_api_key, prefer_pro, model_name)
+    return model_name
+
+
+def _discover_gemini_image_model(gemini_api_key, prefer_pro=False):
+    """Fetch /models and pick the best image-capable model."""
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models?key={gemini_api_key}"
-        response = requests.get(url, timeout=30)
+        url = f"{gemini_client.GEMINI_BASE_URL}/models?key={gemini_api_key}"
+        response = gemini_client.http_get(url, read_timeout=30)
         response.raise_for_status()
         data = response.json()
 
@@ -2502,8 +2714,13 @@ def find_gemini_image_model(gemini_api_key, prefer_pro=False):
         return None
 
 
-def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None, prefer_pro=False):
-    """Generate an image using Gemini (auto-detects best model). Supports reference images and quality settings."""
+@metrics.instrument("generate_image_gemini")
+def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None, prefer_pro=False,
+                          cache_slot=0):
+    """Generate an image using Gemini (auto-detects best model). Supports reference images and quality settings.
+
+    cache_slot tells apart the N images of one multi-image run, so they stay N different results.
+    """
 
     # Detect if quality preference changed -> reset cached model
     quality_key = "pro" if prefer_pro else "flash"
@@ -2513,7 +2730,7 @@ def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, as
 
     # Find correct model
     if "gemini_model_name" not in st.session_state or not st.session_state.gemini_model_name:
-        with st.spinner("Suche bestes Gemini-Modell..."):
+        with st.spinner("Suche bestes Gemini-Modell..."), timings.span("model_discovery"):
             model_name = find_gemini_image_model(gemini_api_key, prefer_pro=prefer_pro)
             if not model_name:
                 st.error("❌ Kein Gemini-Modell mit Bildgenerierung gefunden. Prüfe deinen API Key.")
@@ -2522,12 +2739,28 @@ def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, as
             st.info(f"🤖 Verwende Modell: **{model_name}**")
 
     model = st.session_state.gemini_model_name
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={gemini_api_key}"
+    url = f"{gemini_client.GEMINI_BASE_URL}/models/{model}:generateContent?key={gemini_api_key}"
 
     # Add sharpness boost to prompt
     # Different quality instructions for Flash vs Pro
     # Pro model tends to enlarge products when told to add "extreme detail" —
     # so we focus Pro instructions on SKIN/PHOTO quality, not product prominence
+    flash_quality_boost = (
+        "\n\nIMPORTANT QUALITY INSTRUCTIONS: Generate at MAXIMUM available resolution. "
+        "The image must be tack-sharp with extreme detail when zoomed in. "
+        "Razor-sharp focus, no blur, no softness, no compression artifacts. "
+        "Every texture, pore, fabric thread, and material grain must be crisply rendered. "
+        "Professional retouching quality with pixel-perfect sharpness throughout the entire frame."
+        "\n\nPRODUCT FIDELITY — ABSOLUTE RULE: If a reference image is provided, the product in the "
+        "generated image must be a 1:1 EXACT copy. Do NOT alter, redesign, reinterpret, add to, "
+        "remove from, simplify, or change the product in ANY way. Same shape, same color, same material, "
+        "same stones, same chain, same everything. ZERO deviations allowed."
+        "\n\nTEXT SPELLING RULE: If ANY text appears in the image, it MUST be spelled 100% correctly. "
+        "Check every letter carefully. No typos, no missing letters, no swapped letters. "
+        "German text must use correct German spelling (e.g. 'Versand' not 'Vershand', "
+        "'Geschenk' not 'Geschnek', 'kostenlos' not 'kostelos'). "
+        "If unsure about a word, use simpler/shorter text instead."
+    )
     if prefer_pro:
         quality_boost = (
             "\n\nQUALITY INSTRUCTIONS (Pro Model): Generate at maximum resolution. "
@@ -2553,46 +2786,20 @@ def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, as
             "If unsure about a word, use simpler/shorter text instead."
         )
     else:
-        quality_boost = (
-            "\n\nIMPORTANT QUALITY INSTRUCTIONS: Generate at MAXIMUM available resolution. "
-            "The image must be tack-sharp with extreme detail when zoomed in. "
-            "Razor-sharp focus, no blur, no softness, no compression artifacts. "
-            "Every texture, pore, fabric thread, and material grain must be crisply rendered. "
-            "Professional retouching quality with pixel-perfect sharpness throughout the entire frame."
-            "\n\nPRODUCT FIDELITY — ABSOLUTE RULE: If a reference image is provided, the product in the "
-            "generated image must be a 1:1 EXACT copy. Do NOT alter, redesign, reinterpret, add to, "
-            "remove from, simplify, or change the product in ANY way. Same shape, same color, same material, "
-            "same stones, same chain, same everything. ZERO deviations allowed."
-            "\n\nTEXT SPELLING RULE: If ANY text appears in the image, it MUST be spelled 100% correctly. "
-            "Check every letter carefully. No typos, no missing letters, no swapped letters. "
-            "German text must use correct German spelling (e.g. 'Versand' not 'Vershand', "
-            "'Geschenk' not 'Geschnek', 'kostenlos' not 'kostelos'). "
-            "If unsure about a word, use simpler/shorter text instead."
-        )
+        quality_boost = flash_quality_boost
     enhanced_prompt = prompt_text + quality_boost
 
     # Build parts: text prompt + reference images
     parts = [{"text": enhanced_prompt}]
 
+    ref_hashes = []
     if reference_images:
-        for ref_img in reference_images:
-            img_bytes = ref_img.getvalue()
-            img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-
-            fname = ref_img.name.lower()
-            if fname.endswith(".png"):
-                mime = "image/png"
-            elif fname.endswith(".webp"):
-                mime = "image/webp"
-            else:
-                mime = "image/jpeg"
-
-            parts.append({
-                "inlineData": {
-                    "mimeType": mime,
-                    "data": img_b64
-                }
-            })
+        # Encoded once per content hash, shared across uploaders, slides and variants
+        with timings.span("ref_encoding", count=len(reference_images)):
+            for ref_img in reference_images:
+                ref_entry = reference_images_store.encode_reference(ref_img, preprocess=ref_preprocess)
+                ref_hashes.append(ref_entry["sha256"])
+                parts.append(reference_images_store.inline_part(ref_entry))
 
     # Build generation config — IMAGE only mode for better quality
     gen_config = {
@@ -2632,140 +2839,283 @@ def generate_image_gemini(prompt_text, gemini_api_key, reference_images=None, as
     # Pro model needs longer timeout (2K generation can take 3-5 min)
     request_timeout = 300 if prefer_pro else 180
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=request_timeout)
-        response.raise_for_status()
-        data = response.json()
-
-        # Extract image from response
-        candidates = data.get("candidates", [])
-        for candidate in candidates:
-            content = candidate.get("content", {})
-            parts_resp = content.get("parts", [])
-            for part in parts_resp:
-                if "inlineData" in part:
-                    img_data = part["inlineData"]["data"]
-                    mime_type = part["inlineData"].get("mimeType", "image/png")
-                    img_bytes = base64.b64decode(img_data)
-                    return img_bytes, mime_type
-
-        # Check for blocked content
-        block_reason = ""
-        for candidate in candidates:
-            if "finishReason" in candidate:
-                block_reason = candidate["finishReason"]
-
-        if block_reason:
-            st.error(f"Gemini hat kein Bild generiert. Grund: {block_reason}. Versuche den Prompt anzupassen.")
+    # Result cache — an identical request (same prompt, model, refs, format, size, slot)
+    # returns the stored image instead of another paid call
+    cache_key = result_cache.make_key(
+        enhanced_prompt, model, ref_hashes,
+        aspect_ratio=image_config.get("aspectRatio"),
+        image_size=image_config.get("imageSize"),
+        slot=cache_slot,
+    )
+    if not force_fresh:
+        with timings.span("cache_lookup"):
+            cached = result_cache.get(cache_key)
+        if cached:
+            st.caption("♻️ Identische Anfrage — Bild aus dem Cache geladen (keine API-Kosten).")
+            return cached
+
+    requested_size = image_config.get("imageSize")  # the retries below drop it from gen_config
+
+    # One time budget for the whole request: primary model, downgrades and fallbacks
+    deadline = retry_policy.Deadline(retry_policy.IMAGE_POLICY.deadline)
+    # Captured here — _post also runs on the hedge threads
+    payer, reservation = cost_session_id(), cost_ledger.current()
+
+    def _post(target_url, body, read_timeout, target_model):
+        def _notify(attempt, delay, reason):
+            st.caption(f"⏳ {target_model}: {reason} — neuer Versuch in {delay:.0f}s ({attempt + 1}/{retry_policy.IMAGE_POLICY.max_attempts})")
+        with timings.span("request", model=target_model):
+            response = retry_policy.run(
+                lambda t: gemini_client.http_post(target_url, json=body, headers=headers, read_timeout=t, stream=True),
+                retry_policy.IMAGE_POLICY, read_timeout, deadline=deadline, on_retry=_notify,
+                breaker=circuit_breaker.get(target_model),
+            )
+        # Accepted → billed, even if it ends up blocked or loses a hedge race
+        image_size = body["generationConfig"].get("imageConfig", {}).get("imageSize")
+        cost_ledger.record(payer, "image", target_model, cost_ledger.image_price(target_model, image_size),
+                           reservation)
+        return response
+
+    def _extract_image(response):
+        # Streamed: the base64 payload is decoded chunk by chunk, never held as one JSON string
+        img_bytes, mime_type, _ = image_stream.decode_image_response(response)
+        return img_bytes, mime_type
+
+    def _try_fallbacks():
+        """Overloaded / skipped primary model — try the fallbacks within the remaining budget.
+
+        Returns (bytes, mime, model, image size) like _send.
+        """
+        fallback_models = [
+            "gemini-2.5-flash-image",
+            "gemini-2.5-flash-preview-image",
+            "gemini-2.0-flash",
+        ]
+        # Remove current model from fallbacks
+        fallback_models = [m for m in fallback_models if m not in model]
+
+        for fb in fallback_models:
+            if deadline.remaining() < retry_policy.MIN_ATTEMPT_SECONDS:
+                break
+            if circuit_breaker.is_open(fb):
+                continue
+            st.warning(f"⚡ {model} überlastet — versuche Fallback: **{fb}**...")
+            fb_url = f"{gemini_client.GEMINI_BASE_URL}/models/{fb}:generateContent?key={gemini_api_key}"
+            try:
+                img_bytes, mime_type = _extract_image(_post(fb_url, payload, 180, fb))
+            except requests.exceptions.HTTPError as fb_e:
+                # Overloaded too, or not available for this key — next fallback
+                if retry_policy.is_retryable(fb_e) or fb_e.response.status_code == 404:
+                    continue
+                st.error(f"Fallback {fb} fehlgeschlagen: {fb_e}")
+                return None, None, None, None
+            except requests.exceptions.RequestException:
+                continue
+            if img_bytes:
+                metrics.FALLBACKS.inc(kind="model", model=fb)
+                st.session_state.gemini_model_name = fb
+                st.success(f"✅ Fallback erfolgreich mit **{fb}**")
+                return img_bytes, mime_type, fb, payload["generationConfig"].get("imageConfig", {}).get("imageSize")
+
+        st.error(f"Alle Modelle überlastet. Bitte in 1-2 Minuten nochmal versuchen.")
+        return None, None, None, None
+
+    def _close_response(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def _hedged_post():
+        """Race the Pro request against a backup fired after hedge_after seconds; first answer wins.
+
+        Returns (response, model, image size) of the winning request.
+        """
+        # Neither backup asks for imageSize: Flash doesn't support it, and dropping it is the Pro backup
+        backup_config = {**gen_config, "imageConfig": {
+            k: v for k, v in gen_config["imageConfig"].items() if k != "imageSize"}}
+        if hedge_backup == "flash":
+            backup_model, backup_label = "gemini-2.5-flash-image", "Flash"
+            # Flash gets its own quality instructions; the reference parts are shared
+            backup_payload = {
+                "contents": [{"parts": [{"text": prompt_text + flash_quality_boost}] + parts[1:]}],
+                "generationConfig": backup_config,
+            }
         else:
-            st.error("Gemini hat kein Bild zurückgegeben. Versuche den Prompt anzupassen.")
-        return None, None
+            backup_model, backup_label = model, "Standard-Auflösung"
+            backup_payload = {"contents": payload["contents"], "generationConfig": backup_config}
+        backup_url = f"{gemini_client.GEMINI_BASE_URL}/models/{backup_model}:generateContent?key={gemini_api_key}"
 
-    except requests.exceptions.Timeout:
-        # If Pro timed out, try again without high-res config
-        if prefer_pro:
-            st.warning("⏰ Pro-Modell Timeout bei hoher Auflösung — versuche Standard-Auflösung...")
-            if "imageSize" in gen_config.get("imageConfig", {}):
-                del gen_config["imageConfig"]["imageSize"]
-            retry_payload = {
-                "contents": [{"parts": parts}],
-                "generationConfig": gen_config,
-            }
-            try:
-                retry_resp = requests.post(url, json=retry_payload, headers=headers, timeout=180)
-                retry_resp.raise_for_status()
-                retry_data = retry_resp.json()
-                for candidate in retry_data.get("candidates", []):
-                    content = candidate.get("content", {})
-                    for part in content.get("parts", []):
-                        if "inlineData" in part:
-                            img_data = part["inlineData"]["data"]
-                            mime_type = part["inlineData"].get("mimeType", "image/png")
-                            st.success("✅ Pro-Bild generiert (Standard-Auflösung)")
-                            return base64.b64decode(img_data), mime_type
-            except:
-                pass
-        st.error("⏰ Timeout — Gemini braucht zu lange. Bitte nochmal versuchen.")
-        return None, None
-    except requests.exceptions.HTTPError as e:
-        error_detail = ""
+        ctx = get_script_run_ctx()
+        trace = timings.current()
+
+        def _init_thread():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            timings.bind(trace)  # both racers report into this generation's timings
+
+        pool = ThreadPoolExecutor(max_workers=2, initializer=_init_thread)
         try:
-            error_detail = e.response.json().get("error", {}).get("message", "")
-        except:
-            pass
-
-        # If Pro fails with 400 (bad config), retry without imageSize
-        if e.response.status_code == 400 and prefer_pro:
-            st.warning("⚠️ Pro-Modell unterstützt diese Konfiguration nicht — versuche ohne Größen-Einstellung...")
-            if "imageConfig" in gen_config:
-                gen_config["imageConfig"] = {k: v for k, v in gen_config["imageConfig"].items()
-                                             if k != "imageSize"}
-            retry_payload = {
-                "contents": [{"parts": parts}],
-                "generationConfig": gen_config,
-            }
+            primary = pool.submit(_post, url, payload, request_timeout, model)
+            done, _ = wait([primary], timeout=hedge_after)
+            if done or circuit_breaker.is_open(backup_model):
+                return primary.result(), model, requested_size
+
+            st.caption(f"⏱️ {model} braucht länger als {hedge_after}s — starte Backup ({backup_label})...")
+            backup = pool.submit(_post, backup_url, backup_payload, 180, backup_model)
+            pending = {primary, backup}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in (primary, backup):
+                    if future in done and future.exception() is None:
+                        if future is backup:
+                            metrics.FALLBACKS.inc(kind="hedge_backup", model=backup_model)
+                            st.caption(f"⚡ Backup ({backup_label}) war schneller — Pro-Anfrage verworfen.")
+                        # Release the loser's pooled connection whenever it comes back
+                        loser = backup if future is primary else primary
+                        loser.add_done_callback(_close_response)
+                        if future is backup:
+                            return future.result(), backup_model, None
+                        return future.result(), model, requested_size
+            # Both failed — surface the Pro error to the usual handling below
+            return primary.result(), model, requested_size
+        finally:
+            # Don't wait for the loser; its late response is simply dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _send():
+        """(bytes, mime, model, image size) — the model and size that actually produced the image."""
+        try:
+            if hedge_after and "imageSize" in gen_config.get("imageConfig", {}):
+                response, used_model, used_size = _hedged_post()
+            else:
+                response, used_model, used_size = _post(url, payload, request_timeout, model), model, requested_size
+
+            # Extract image from response
+            img_bytes, mime_type, data = image_stream.decode_image_response(response)
+            if img_bytes:
+                return img_bytes, mime_type, used_model, used_size
+
+            # Check for blocked content
+            block_reason = ""
+            for candidate in data.get("candidates", []):
+                if "finishReason" in candidate:
+                    block_reason = candidate["finishReason"]
+
+            metrics.IMAGE_BLOCKS.inc(model=used_model, reason=block_reason or "NO_IMAGE")
+            if block_reason:
+                st.error(f"Gemini hat kein Bild generiert. Grund: {block_reason}. Versuche den Prompt anzupassen.")
+            else:
+                st.error("Gemini hat kein Bild zurückgegeben. Versuche den Prompt anzupassen.")
+            return None, None, None, None
+
+        except circuit_breaker.CircuitOpenError as e:
+            # Recently overloaded — don't wait for another 503, go straight to the fallbacks
+            st.caption(f"🚧 {model} wird gerade übersprungen (überlastet, nächster Test in {e.retry_in:.0f}s).")
+            return _try_fallbacks()
+        except requests.exceptions.Timeout:
+            # If Pro timed out, try again without high-res config
+            if prefer_pro:
+                st.warning("⏰ Pro-Modell Timeout bei hoher Auflösung — versuche Standard-Auflösung...")
+                if "imageSize" in gen_config.get("imageConfig", {}):
+                    del gen_config["imageConfig"]["imageSize"]
+                retry_payload = {
+                    "contents": [{"parts": parts}],
+                    "generationConfig": gen_config,
+                }
+                try:
+                    img_bytes, mime_type = _extract_image(_post(url, retry_payload, 180, model))
+                    if img_bytes:
+                        metrics.FALLBACKS.inc(kind="standard_size", model=model)
+                        st.success("✅ Pro-Bild generiert (Standard-Auflösung)")
+                        return img_bytes, mime_type, model, None
+                except requests.exceptions.RequestException:
+                    pass
+            st.error("⏰ Timeout — Gemini braucht zu lange. Bitte nochmal versuchen.")
+            return None, None, None, None
+        except requests.exceptions.HTTPError as e:
+            error_detail = ""
             try:
-                retry_resp = requests.post(url, json=retry_payload, headers=headers, timeout=240)
-                retry_resp.raise_for_status()
-                retry_data = retry_resp.json()
-                for candidate in retry_data.get("candidates", []):
-                    content = candidate.get("content", {})
-                    for part in content.get("parts", []):
-                        if "inlineData" in part:
-                            img_data = part["inlineData"]["data"]
-                            mime_type = part["inlineData"].get("mimeType", "image/png")
-                            st.success("✅ Pro-Bild generiert (ohne Größen-Override)")
-                            return base64.b64decode(img_data), mime_type
-            except Exception as retry_e:
-                st.error(f"Auch Retry fehlgeschlagen: {retry_e}")
-                return None, None
-
-        if e.response.status_code == 404:
-            st.session_state.gemini_model_name = None
-            st.error(f"Modell '{model}' nicht verfügbar. Bitte nochmal klicken — suche alternatives Modell.")
-        elif e.response.status_code == 503 or e.response.status_code == 429:
-            # Model overloaded — try fallback
-            fallback_models = [
-                "gemini-2.5-flash-image",
-                "gemini-2.5-flash-preview-image",
-                "gemini-2.0-flash",
-            ]
-            # Remove current model from fallbacks
-            fallback_models = [m for m in fallback_models if m not in model]
+                error_detail = e.response.json().get("error", {}).get("message", "")
+            except ValueError:
+                pass
 
-            for fb in fallback_models:
-                st.warning(f"⚡ {model} überlastet — versuche Fallback: **{fb}**...")
-                fb_url = f"https://generativelanguage.googleapis.com/v1beta/models/{fb}:generateContent?key={gemini_api_key}"
+            # If Pro fails with 400 (bad config), retry without imageSize
+            if e.response.status_code == 400 and prefer_pro:
+                st.warning("⚠️ Pro-Modell unterstützt diese Konfiguration nicht — versuche ohne Größen-Einstellung...")
+                if "imageConfig" in gen_config:
+                    gen_config["imageConfig"] = {k: v for k, v in gen_config["imageConfig"].items()
+                                                 if k != "imageSize"}
+                retry_payload = {
+                    "contents": [{"parts": parts}],
+                    "generationConfig": gen_config,
+                }
                 try:
-                    fb_response = requests.post(fb_url, json=payload, headers=headers, timeout=180)
-                    fb_response.raise_for_status()
-                    fb_data = fb_response.json()
-
-                    for candidate in fb_data.get("candidates", []):
-                        content = candidate.get("content", {})
-                        parts_resp = content.get("parts", [])
-                        for part in parts_resp:
-                            if "inlineData" in part:
-                                img_data = part["inlineData"]["data"]
-                                mime_type = part["inlineData"].get("mimeType", "image/png")
-                                img_bytes_result = base64.b64decode(img_data)
-                                st.session_state.gemini_model_name = fb
-                                st.success(f"✅ Fallback erfolgreich mit **{fb}**")
-                                return img_bytes_result, mime_type
-                except:
-                    continue
+                    img_bytes, mime_type = _extract_image(_post(url, retry_payload, 240, model))
+                    if img_bytes:
+                        metrics.FALLBACKS.inc(kind="no_image_size", model=model)
+                        st.success("✅ Pro-Bild generiert (ohne Größen-Override)")
+                        return img_bytes, mime_type, model, None
+                except requests.exceptions.RequestException as retry_e:
+                    st.error(f"Auch Retry fehlgeschlagen: {retry_e}")
+                    return None, None, None, None
+
+            if e.response.status_code == 404:
+                st.session_state.gemini_model_name = None
+                gemini_client.invalidate_model_cache(gemini_api_key)
+                st.error(f"Modell '{model}' nicht verfügbar. Bitte nochmal klicken — suche alternatives Modell.")
+            elif retry_policy.is_retryable(e):
+                # Model still overloaded after backoff
+                return _try_fallbacks()
+            else:
+                st.error(f"Gemini API Fehler: {e}\n{error_detail}")
+            return None, None, None, None
+        except Exception as e:
+            st.error(f"Fehler bei der Bildgenerierung: {e}")
+            return None, None, None, None
 
-            st.error(f"Alle Modelle überlastet. Bitte in 1-2 Minuten nochmal versuchen.")
-        else:
-            st.error(f"Gemini API Fehler: {e}\n{error_detail}")
-        return None, None
-    except Exception as e:
-        st.error(f"Fehler bei der Bildgenerierung: {e}")
-        return None, None
+    img_bytes, mime_type, used_model, used_size = _send()
+    # Only what the requested model produced at the requested size belongs under this key —
+    # a fallback or downsized image must not be served to the next identical request
+    if img_bytes and used_model == model and used_size == requested_size:
+        result_cache.put(cache_key, img_bytes, mime_type)
+    return img_bytes, mime_type
 
 
-def generate_image_hybrid(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None):
+@metrics.instrument("generate_image_hybrid")
+def generate_image_hybrid(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None, cache_slot=0):
     """Hybrid mode: Flash generates product-faithful image WITHOUT text, Pro adds text + refinement."""
+    with timings.span("hybrid_step1"):
+        flash = _hybrid_flash_step(prompt_text, gemini_api_key, reference_images, aspect_ratio_str, cache_slot)
+    if flash is None:
+        return None, None
+    with timings.span("hybrid_step2"):
+        return _hybrid_second_step(flash, gemini_api_key, aspect_ratio_str)
+
+
+def _hybrid_second_step(flash, gemini_api_key, aspect_ratio_str):
+    """Hybrid step 2 as chosen in the sidebar: Pro text pass + refinement, or the local text overlay."""
+    if hybrid_local_text:
+        return _hybrid_overlay_text_locally(*flash)
+    return _hybrid_refine_with_pro(*flash, gemini_api_key, aspect_ratio_str)
+
+
+def _hybrid_overlay_text_locally(flash_bytes, flash_mime, text_lines_for_pro):
+    """Hybrid step 2 without Pro: the text elements split off the prompt are set onto the Flash image."""
+    elements = text_overlay.elements_from_prompt_lines(text_lines_for_pro)
+    if not any(elements.values()):
+        st.info("🖋️ Keine Text-Elemente im Prompt — das Flash-Bild ist das Ergebnis.")
+        return flash_bytes, flash_mime
+    try:
+        with timings.span("text_overlay"):
+            img_bytes, mime_type = text_overlay.composite(flash_bytes, elements, layout=overlay_layout,
+                                                          font_pack=overlay_font_pack)
+    except (OSError, ValueError) as e:
+        st.warning(f"⚠️ Lokaler Text-Satz fehlgeschlagen ({e}) — verwende Flash-Bild.")
+        return flash_bytes, flash_mime
+    st.success("✅ Hybrid fertig! Flash (Bild) → lokaler Text-Satz (exakte Schreibweise)")
+    return img_bytes, mime_type
+
+
+def _hybrid_flash_step(prompt_text, gemini_api_key, reference_images, aspect_ratio_str, cache_slot):
+    """Hybrid step 1: Flash renders the scene without text. Returns (bytes, mime, text lines for Pro) or None."""
 
     # --- Extract text elements from the prompt so Flash doesn't render them ---
     # We strip all text overlay instructions for Flash, then give them to Pro
@@ -2804,31 +3154,30 @@ def generate_image_hybrid(prompt_text, gemini_api_key, reference_images=None, as
         flash_prompt, gemini_api_key,
         reference_images=reference_images,
         aspect_ratio_str=aspect_ratio_str,
-        prefer_pro=False  # Force Flash
+        prefer_pro=False,  # Force Flash
+        cache_slot=cache_slot,
     )
 
     if not flash_bytes:
         st.error("Hybrid abgebrochen — Flash konnte kein Bild generieren.")
-        return None, None
+        return None
 
     st.success("✅ Schritt 1 fertig — Flash-Bild generiert (ohne Text).")
     st.image(flash_bytes, caption="Flash-Basis ohne Text (Pro fügt Text + Feinschliff hinzu...)", width=300)
+    return flash_bytes, flash_mime, text_lines_for_pro
 
+
+def _hybrid_refine_with_pro(flash_bytes, flash_mime, text_lines_for_pro, gemini_api_key, aspect_ratio_str):
+    """Hybrid step 2: Pro renders the text onto the Flash image and refines it; falls back to the Flash image."""
     # Step 2: Send Flash image to Pro for TEXT RENDERING + refinement
     st.info("🔀 **Hybrid Schritt 2/2:** Pro fügt Text hinzu + verfeinert Haut, Licht & Details...")
 
-    # Reset model cache to force Pro
-    old_model = st.session_state.get("gemini_model_name")
-    old_quality = st.session_state.get("gemini_quality_mode")
-    st.session_state.gemini_model_name = None
-    st.session_state.gemini_quality_mode = "pro"
-
-    # Find Pro model
+    # Find Pro model — looked up directly, the session's Flash model stays as it is
+    # (step 1 of the next image may be running at the same time, see run_hybrid_pipeline)
     pro_model = find_gemini_image_model(gemini_api_key, prefer_pro=True)
     if not pro_model or "pro" not in pro_model.lower():
         st.warning("⚠️ Pro-Modell nicht verfügbar — verwende Flash-Bild als Ergebnis.")
-        st.session_state.gemini_model_name = old_model
-        st.session_state.gemini_quality_mode = old_quality
+        metrics.FALLBACKS.inc(kind="hybrid_flash_only", model=pro_model or "")
         return flash_bytes, flash_mime
 
     # Build Pro refinement + text rendering prompt
@@ -2870,15 +3219,13 @@ def generate_image_hybrid(prompt_text, gemini_api_key, reference_images=None, as
         "- ONLY add text overlays + improve skin/lighting/colors/background quality\n"
     )
 
-    # Build API request with Flash image as input
-    flash_b64 = base64.b64encode(flash_bytes).decode("utf-8")
-
+    # Build API request with Flash image as input — base64-encoded on the fly while sending
     parts = [
         {"text": refine_prompt},
         {
             "inlineData": {
                 "mimeType": flash_mime or "image/png",
-                "data": flash_b64
+                "data": image_stream.InlineJSONBody.PLACEHOLDER
             }
         }
     ]
@@ -2898,67 +3245,301 @@ def generate_image_hybrid(prompt_text, gemini_api_key, reference_images=None, as
     if image_config:
         gen_config["imageConfig"] = image_config
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{pro_model}:generateContent?key={gemini_api_key}"
+    url = f"{gemini_client.GEMINI_BASE_URL}/models/{pro_model}:generateContent?key={gemini_api_key}"
     payload = {
         "contents": [{"parts": parts}],
         "generationConfig": gen_config,
     }
     headers = {"Content-Type": "application/json"}
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=300)
-        response.raise_for_status()
-        data = response.json()
+    # Same Flash base + same refinement → same Pro result; keyed on the Flash image's hash
+    cache_key = result_cache.make_key(
+        refine_prompt, pro_model, [hashlib.sha256(flash_bytes).hexdigest()],
+        aspect_ratio=image_config.get("aspectRatio"),
+    )
+    if not force_fresh:
+        with timings.span("cache_lookup"):
+            cached = result_cache.get(cache_key)
+        if cached:
+            st.success(f"♻️ Hybrid fertig — Pro-Ergebnis aus dem Cache (**{pro_model}**)")
+            return cached
 
-        for candidate in data.get("candidates", []):
-            content = candidate.get("content", {})
-            for part in content.get("parts", []):
-                if "inlineData" in part:
-                    img_data = part["inlineData"]["data"]
-                    mime_type = part["inlineData"].get("mimeType", "image/png")
-                    pro_bytes = base64.b64decode(img_data)
-                    st.success(f"✅ Hybrid fertig! Flash (Bild) → Pro (Text + Feinschliff) via **{pro_model}**")
+    body = image_stream.InlineJSONBody(payload, flash_bytes)
 
-                    # Restore model cache
-                    st.session_state.gemini_model_name = old_model
-                    st.session_state.gemini_quality_mode = old_quality
-                    return pro_bytes, mime_type
+    try:
+        with timings.span("request", model=pro_model):
+            response = retry_policy.run(
+                lambda t: gemini_client.http_post(url, data=body, headers=headers, read_timeout=t, stream=True),
+                retry_policy.IMAGE_POLICY, 300,
+                on_retry=lambda attempt, delay, reason: st.caption(
+                    f"⏳ {pro_model}: {reason} — neuer Versuch in {delay:.0f}s"),
+                breaker=circuit_breaker.get(pro_model),
+            )
+        cost_ledger.record(cost_session_id(), "image", pro_model, cost_ledger.image_price(pro_model),
+                           cost_ledger.current())
+        pro_bytes, mime_type, data = image_stream.decode_image_response(response)
+
+        if pro_bytes:
+            result_cache.put(cache_key, pro_bytes, mime_type)
+            st.success(f"✅ Hybrid fertig! Flash (Bild) → Pro (Text + Feinschliff) via **{pro_model}**")
+            return pro_bytes, mime_type
 
         # Pro didn't return an image — fall back to Flash result
+        reasons = [c["finishReason"] for c in data.get("candidates", []) if "finishReason" in c]
+        metrics.IMAGE_BLOCKS.inc(model=pro_model, reason=reasons[-1] if reasons else "NO_IMAGE")
+        metrics.FALLBACKS.inc(kind="hybrid_flash_only", model=pro_model)
         st.warning("⚠️ Pro hat kein verfeinertes Bild zurückgegeben — verwende Flash-Bild.")
-        st.session_state.gemini_model_name = old_model
-        st.session_state.gemini_quality_mode = old_quality
         return flash_bytes, flash_mime
 
     except Exception as e:
+        metrics.FALLBACKS.inc(kind="hybrid_flash_only", model=pro_model)
         st.warning(f"⚠️ Pro-Verfeinerung fehlgeschlagen ({e}) — verwende Flash-Bild.")
-        st.session_state.gemini_model_name = old_model
-        st.session_state.gemini_quality_mode = old_quality
         return flash_bytes, flash_mime
 
 
-def smart_generate_image(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None):
-    """Routes to the correct generation mode based on model_quality setting."""
+def queue_settings():
+    """Sidebar generation settings handed to job-queue workers along with each image job."""
+    return {
+        "model_quality": model_quality,
+        "ref_preprocess": ref_preprocess,
+        "force_fresh": force_fresh,
+        "hedge_after": hedge_after,
+        "hedge_backup": hedge_backup,
+        "hybrid_local_text": hybrid_local_text,
+        "overlay_layout": overlay_layout,
+        "overlay_font_pack": overlay_font_pack,
+    }
+
+
+def describe_ref_upload(ref_files):
+    """Encode reference images up front (warms the shared store) and summarize the upload size."""
+    entries = [reference_images_store.encode_reference(f, preprocess=ref_preprocess) for f in ref_files]
+    savings = reference_images_store.describe_savings(entries)
+    return f" — optimiert: {savings}" if savings else ""
+
+
+def image_estimate():
+    """Estimated USD of one smart_generate_image call with the current model settings."""
+    flash = cost_ledger.image_price("flash")
+    pro = cost_ledger.image_price("pro", "2K")
     if "🔀 Hybrid" in model_quality:
-        return generate_image_hybrid(
-            prompt_text, gemini_api_key,
-            reference_images=reference_images,
-            aspect_ratio_str=aspect_ratio_str
-        )
-    else:
-        return generate_image_gemini(
-            prompt_text, gemini_api_key,
-            reference_images=reference_images,
-            aspect_ratio_str=aspect_ratio_str,
-            prefer_pro=("💎 Pro" in model_quality)
-        )
+        return flash if hybrid_local_text else flash + cost_ledger.image_price("pro")
+    if "💎 Pro" in model_quality:
+        # A hedged request may be paid twice
+        backup = (flash if hedge_backup == "flash" else cost_ledger.image_price("pro")) if hedge_after else 0
+        return pro + backup
+    return flash
+
 
+def reserve_image_budget():
+    """Reserve one image's estimate against the budget caps; None (error shown) if it does not fit."""
+    return reserve_budget(image_estimate())
 
-def generate_video_veo(prompt_text, gemini_api_key):
-    """Generate a video using Veo via the Gemini API. Returns video bytes or None."""
-    import time as _time
 
-    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+def smart_generate_image(prompt_text, gemini_api_key, reference_images=None, aspect_ratio_str=None, cache_slot=0,
+                         trace=None):
+    """Routes to the correct generation mode based on model_quality setting.
+
+    trace: optional timings.Trace that receives the per-phase spans (also appended to timings.LOG_PATH).
+    The estimated cost is reserved against the budget caps first — over a cap, nothing is sent.
+    """
+    reservation = reserve_image_budget()
+    if reservation is None:
+        return None, None
+    cost_ledger.bind(reservation)  # the paid calls below are booked out of it
+    try:
+        with timings.recording(trace or timings.Trace(), mode=model_quality, aspect_ratio=aspect_ratio_str,
+                               refs=len(reference_images or []), slot=cache_slot) as trace:
+            if "🔀 Hybrid" in model_quality:
+                result = generate_image_hybrid(
+                    prompt_text, gemini_api_key,
+                    reference_images=reference_images,
+                    aspect_ratio_str=aspect_ratio_str,
+                    cache_slot=cache_slot,
+                )
+            else:
+                result = generate_image_gemini(
+                    prompt_text, gemini_api_key,
+                    reference_images=reference_images,
+                    aspect_ratio_str=aspect_ratio_str,
+                    prefer_pro=("💎 Pro" in model_quality),
+                    cache_slot=cache_slot,
+                )
+            trace.meta["ok"] = bool(result and result[0])
+    finally:
+        cost_ledger.bind(None)
+        cost_ledger.release(reservation)
+        show_spend()
+    return result
+
+
+TIMING_PHASES = {
+    "model_discovery": "Modell-Suche",
+    "ref_encoding": "Referenzbilder kodieren",
+    "cache_lookup": "Cache-Abfrage",
+    "request": "Anfrage",
+    "upload": "Upload",
+    "server_wait": "Warten auf Server",
+    "download_decode": "Download & Dekodieren",
+    "backoff": "Retry-Pause",
+    "hybrid_step1": "Hybrid Schritt 1 (Flash)",
+    "hybrid_step2": "Hybrid Schritt 2 (Pro / Text)",
+    "text_overlay": "Text-Satz (lokal)",
+}
+
+
+def show_timings(img):
+    """Expandable per-phase timings of a generated image (if it was recorded)."""
+    trace = img.get("timings")
+    if not trace:
+        return
+    with st.expander(f"⏱️ Timings — {trace['total']:.1f}s"):
+        lines = []
+        for span in trace["spans"]:
+            label = TIMING_PHASES.get(span["phase"], span["phase"])
+            detail = span.get("model") or span.get("reason") or ""
+            lines.append(f"{'    ' * span['depth']}- {label}{f' ({detail})' if detail else ''}: **{span['seconds']:.2f}s**")
+        st.markdown("\n".join(lines))
+
+
+def run_parallel(jobs, max_workers):
+    """Run generation jobs with bounded concurrency. Yields (key, result) as soon as each job finishes.
+
+    jobs: list of (key, callable) pairs. The worker threads get the current script
+    context attached, so st.* calls inside the generation functions keep working.
+    A run that would not fit the budget caps as a whole is not started (every result None).
+    """
+    if not jobs:
+        return
+    if not budget_allows(image_estimate() * len(jobs)):
+        for key, _ in jobs:
+            yield key, None
+        return
+    if "🔀 Hybrid" in model_quality and len(jobs) > 1 and all(
+            isinstance(fn, partial) and fn.func is smart_generate_image for _, fn in jobs):
+        yield from run_hybrid_pipeline(jobs, min(hybrid_flash_workers, max_workers),
+                                       min(hybrid_pro_workers, max_workers))
+        return
+    ctx = get_script_run_ctx()
+
+    def _attach_ctx():
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+    workers = max(1, min(max_workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, initializer=_attach_ctx) as pool:
+        futures = {pool.submit(fn): key for key, fn in jobs}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                st.error(f"Fehler bei paralleler Generierung: {e}")
+                result = None
+            yield key, result
+
+
+def run_hybrid_pipeline(jobs, flash_workers, pro_workers):
+    """Hybrid images as a two-stage pipeline: Flash renders image N+1 while Pro refines image N.
+
+    jobs: (key, partial(smart_generate_image, ...)) pairs as for run_parallel. A pool of
+    flash_workers runs step 1 and hands each Flash image over a queue to pro_workers threads
+    running step 2. Yields (key, result) as each image finishes. Budget reservation, timings and metrics
+    per image are the same as for a smart_generate_image call.
+    """
+    ctx = get_script_run_ctx()
+    handoff = queue.Queue()   # Flash → Pro: (index, item) or None to stop a Pro thread
+    finished = queue.Queue()  # (index, result)
+
+    def _attach_ctx():
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+    def _finish(index, item, result):
+        item["trace"].meta["ok"] = bool(result and result[0])
+        timings.finish(item["trace"])
+        metrics.observe_generation("generate_image_hybrid", "ok" if result and result[0] else "failed",
+                                   time.perf_counter() - item["started"])
+        cost_ledger.release(item["reservation"])
+        show_spend()
+        finished.put((index, result))
+
+    def _flash_stage(index, fn):
+        prompt_text, gemini_api_key = fn.args
+        kwargs = fn.keywords
+        item = None
+        try:
+            reservation = reserve_image_budget()
+            if reservation is None:
+                finished.put((index, (None, None)))
+                return
+            trace = kwargs.get("trace") or timings.Trace()
+            trace.meta.update(mode=model_quality, aspect_ratio=kwargs.get("aspect_ratio_str"),
+                              refs=len(kwargs.get("reference_images") or []), slot=kwargs.get("cache_slot", 0),
+                              pipeline=True)
+            item = {"trace": trace, "reservation": reservation, "started": time.perf_counter(),
+                    "api_key": gemini_api_key, "aspect_ratio": kwargs.get("aspect_ratio_str")}
+            timings.bind(trace)
+            cost_ledger.bind(reservation)
+            with timings.span("hybrid_step1"):
+                item["flash"] = _hybrid_flash_step(prompt_text, gemini_api_key, kwargs.get("reference_images"),
+                                                   kwargs.get("aspect_ratio_str"), kwargs.get("cache_slot", 0))
+        except Exception as e:
+            st.error(f"Fehler bei der Bildgenerierung: {e}")
+            if item is None:
+                finished.put((index, (None, None)))
+                return
+            item["flash"] = None
+        finally:
+            timings.bind(None)
+            cost_ledger.bind(None)
+        if item["flash"] is None:
+            _finish(index, item, (None, None))
+        else:
+            handoff.put((index, item))
+
+    def _pro_stage():
+        while True:
+            entry = handoff.get()
+            if entry is None:
+                return
+            index, item = entry
+            flash_bytes, flash_mime, _ = item["flash"]
+            result = (flash_bytes, flash_mime)  # what step 2 falls back to anyway
+            timings.bind(item["trace"])
+            cost_ledger.bind(item["reservation"])
+            try:
+                with timings.span("hybrid_step2"):
+                    result = _hybrid_second_step(item["flash"], item["api_key"], item["aspect_ratio"])
+            except Exception as e:
+                st.warning(f"⚠️ Pro-Verfeinerung fehlgeschlagen ({e}) — verwende Flash-Bild.")
+            finally:
+                timings.bind(None)
+                cost_ledger.bind(None)
+                _finish(index, item, result)
+
+    pro_threads = [threading.Thread(target=_pro_stage, name=f"hybrid-pro-{n}", daemon=True)
+                   for n in range(max(1, pro_workers))]
+    for thread in pro_threads:
+        add_script_run_ctx(thread, ctx)
+        thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, flash_workers), initializer=_attach_ctx) as flash_pool:
+            for index, (_, fn) in enumerate(jobs):
+                flash_pool.submit(_flash_stage, index, fn)
+            for _ in jobs:
+                index, result = finished.get()
+                yield jobs[index][0], result
+    finally:
+        for _ in pro_threads:
+            handoff.put(None)
+
+
+@metrics.instrument("generate_video_veo")
+def generate_video_veo(prompt_text, gemini_api_key, duration=None):
+    """Submit a Veo video generation via the Gemini API. Returns a veo_jobs.VeoJob handle or None.
+
+    duration (seconds, as chosen in the UI) only selects the latency history used for polling and ETA.
+    """
+    BASE_URL = gemini_client.GEMINI_BASE_URL
     headers = {
         "Content-Type": "application/json",
         "x-goog-api-key": gemini_api_key,
@@ -2973,134 +3554,89 @@ def generate_video_veo(prompt_text, gemini_api_key):
 
     operation_name = None
     used_model = None
+    # Shared budget: an overloaded model must not eat the time of the next one
+    submit_deadline = retry_policy.Deadline(retry_policy.VEO_SUBMIT_POLICY.deadline)
 
+    def _notify_retry(attempt, delay, reason):
+        st.caption(f"⏳ Veo: {reason} — neuer Versuch in {delay:.0f}s ({attempt + 1}/{retry_policy.VEO_SUBMIT_POLICY.max_attempts})")
+
+    # Known-good model + parameters for this key go first; the rest is only probed if it fails
+    known = veo_jobs.known_model(gemini_api_key)
+    candidates = []
+    if known:
+        candidates.append((known["model"], known["params"]))
     for model in veo_models:
-        url = f"{BASE_URL}/models/{model}:predictLongRunning"
-        payload = {
-            "instances": [{"prompt": prompt_text}],
-            "parameters": {
-                "personGeneration": "allow_all",
+        if not known or model != known["model"]:
+            # generateAudio only supported on veo-3.0 (until the API tells us otherwise)
+            candidates.append((model, {"generateAudio": True} if "3.0" in model else {}))
+
+    first_model = candidates[0][0]
+    # No durationSeconds is sent — Veo renders its default length, which is what gets billed
+    reservation = reserve_budget(cost_ledger.veo_price(first_model))
+    if reservation is None:
+        return None
+    try:
+        while candidates:
+            model, params = candidates.pop(0)
+            url = f"{BASE_URL}/models/{model}:predictLongRunning"
+            payload = {
+                "instances": [{"prompt": prompt_text}],
+                "parameters": {
+                    "personGeneration": "allow_all",
+                    **params,
+                }
             }
-        }
-        # generateAudio only supported on veo-3.0
-        if "3.0" in model:
-            payload["parameters"]["generateAudio"] = True
 
-        try:
-            resp = requests.post(url, json=payload, headers=headers, timeout=60)
-            if resp.status_code == 404:
-                continue
-            if resp.status_code == 503:
+            try:
+                resp = retry_policy.run(
+                    lambda t: gemini_client.http_post(url, json=payload, headers=headers, read_timeout=t),
+                    retry_policy.VEO_SUBMIT_POLICY, 60, deadline=submit_deadline, on_retry=_notify_retry,
+                    breaker=circuit_breaker.get(model),
+                )
+                data = resp.json()
+                operation_name = data.get("name")
+                used_model = model
+                cost_ledger.record(cost_session_id(), "video", model, cost_ledger.veo_price(model), reservation)
+                if not known or (model, params) != (known["model"], known["params"]):
+                    veo_jobs.remember_model(gemini_api_key, model, params)
+                break
+            except requests.exceptions.HTTPError as e:
+                if known and model == known["model"]:
+                    # The remembered model stopped working — forget it and probe the others
+                    veo_jobs.forget_model(gemini_api_key)
+                # Not available for this key, or still overloaded after backoff — next model
+                if e.response.status_code == 404 or retry_policy.is_retryable(e):
+                    continue
+                error_detail = ""
+                try:
+                    error_detail = e.response.json().get("error", {}).get("message", "")
+                except ValueError:
+                    pass
+                # Parameter not supported by this model — same model again without it
+                if e.response.status_code == 400 and params.get("generateAudio") and "audio" in error_detail.lower():
+                    candidates.insert(0, (model, {k: v for k, v in params.items() if k != "generateAudio"}))
+                    continue
+                st.error(f"Veo API Fehler ({model}): {e}\n{error_detail}")
+                return None
+            except circuit_breaker.CircuitOpenError as e:
+                st.caption(f"🚧 {model} wird gerade übersprungen (überlastet, nächster Test in {e.retry_in:.0f}s).")
                 continue
-            resp.raise_for_status()
-            data = resp.json()
-            operation_name = data.get("name")
-            used_model = model
-            break
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code in [404, 503]:
+            except requests.exceptions.RequestException:
                 continue
-            error_detail = ""
-            try:
-                error_detail = e.response.json().get("error", {}).get("message", "")
-            except:
-                pass
-            st.error(f"Veo API Fehler ({model}): {e}\n{error_detail}")
-            return None
-        except Exception:
-            continue
+    finally:
+        cost_ledger.release(reservation)
+        show_spend()
 
     if not operation_name:
         st.error("❌ Kein Veo-Modell verfügbar. Prüfe API Key und Billing.")
         return None
 
+    if used_model != first_model:
+        metrics.FALLBACKS.inc(kind="veo_model", model=used_model)
     st.info(f"🤖 Verwende: **{used_model}** — Operation: `{operation_name}`")
 
-    # Poll for completion — use x-goog-api-key header
-    poll_headers = {"x-goog-api-key": gemini_api_key}
-    poll_url = f"{BASE_URL}/{operation_name}"
-
-    progress_bar = st.progress(0, text="⏳ Video wird generiert...")
-    status_text = st.empty()
-    max_wait = 600  # 10 minutes
-    elapsed = 0
-    poll_interval = 10
-
-    while elapsed < max_wait:
-        _time.sleep(poll_interval)
-        elapsed += poll_interval
-        pct = min(elapsed / max_wait, 0.95)
-        progress_bar.progress(pct, text=f"⏳ Video wird generiert... ({elapsed}s / max {max_wait}s)")
-
-        try:
-            poll_resp = requests.get(poll_url, headers=poll_headers, timeout=30)
-            poll_resp.raise_for_status()
-            poll_data = poll_resp.json()
-
-            is_done = poll_data.get("done", False)
-            status_text.caption(f"Status: done={is_done} | Keys: {list(poll_data.keys())}")
-
-            if is_done:
-                progress_bar.progress(1.0, text="✅ Video fertig!")
-
-                # Extract video from response
-                response_obj = poll_data.get("response", {})
-
-                # Try multiple known response structures
-                video_samples = None
-
-                # Structure 1: response.generateVideoResponse.generatedSamples
-                gvr = response_obj.get("generateVideoResponse", {})
-                if gvr:
-                    video_samples = gvr.get("generatedSamples", [])
-
-                # Structure 2: response.generatedSamples
-                if not video_samples:
-                    video_samples = response_obj.get("generatedSamples", [])
-
-                # Structure 3: response.videos (Vertex style)
-                if not video_samples:
-                    video_samples = response_obj.get("videos", [])
-
-                if video_samples:
-                    sample = video_samples[0]
-                    video_obj = sample.get("video", sample)
-
-                    # Base64 encoded
-                    if "bytesBase64Encoded" in video_obj:
-                        video_bytes = base64.b64decode(video_obj["bytesBase64Encoded"])
-                        return video_bytes
-
-                    # URI to download
-                    uri = video_obj.get("uri") or video_obj.get("gcsUri")
-                    if uri:
-                        status_text.caption(f"Downloading video from: {uri[:80]}...")
-                        vid_resp = requests.get(uri, timeout=120)
-                        vid_resp.raise_for_status()
-                        return vid_resp.content
-
-                # Debug: show full response structure
-                st.warning(f"Video fertig, aber unbekanntes Format. Response-Keys: {list(response_obj.keys())}")
-                st.json(poll_data)
-                return None
-
-            # Check for error in response
-            if "error" in poll_data:
-                err = poll_data["error"]
-                st.error(f"Veo Fehler: {err.get('message', str(err))}")
-                progress_bar.progress(1.0, text="❌ Fehler")
-                return None
-
-        except requests.exceptions.HTTPError as e:
-            status_text.caption(f"Poll-Fehler ({elapsed}s): {e} — versuche weiter...")
-            continue
-        except Exception as e:
-            status_text.caption(f"Poll-Fehler ({elapsed}s): {e} — versuche weiter...")
-            continue
-
-    progress_bar.progress(1.0, text="⏰ Timeout")
-    st.error("Video-Generierung hat zu lange gedauert (>10 Min). Das kann bei hoher Nachfrage passieren. Bitte nochmal versuchen.")
-    return None
+    # Polling runs in the background — the page picks up the status on rerun
+    return veo_jobs.start(operation_name, used_model, gemini_api_key, duration)
 
 
 # --- OUTPUT ---
@@ -3117,6 +3653,8 @@ if "generated_images" not in st.session_state:
     st.session_state.generated_images = []
 if "generated_videos" not in st.session_state:
     st.session_state.generated_videos = []
+if "veo_job_ids" not in st.session_state:
+    st.session_state.veo_job_ids = []
 
 # --- GENERATION MODE SELECTOR ---
 st.markdown('<div class="section-card"><h3>🚀 Generieren</h3></div>', unsafe_allow_html=True)
@@ -3164,6 +3702,7 @@ if st.button(btn_label):
                 with st.spinner("Baue Video-Prompt..."):
                     final_video_prompt = build_video_prompt(raw_prompt)
                 st.session_state.last_video_prompt = final_video_prompt
+                st.session_state.last_video_duration = video_duration
                 st.success("✅ Veo3 Video-Prompt generiert!")
                 st.markdown("### 🎬 Veo3 Video-Prompt")
                 st.code(final_video_prompt, language="text")
@@ -3236,22 +3775,56 @@ if st.session_state.last_image_prompt:
         if st.button("🚀 JETZT ERSTELLEN MIT GEMINI", disabled=not gemini_key):
             # Collect campaign reference images if any
             ref_imgs = campaign_ref_files if wear_product and campaign_ref_files else None
-            if ref_imgs:
-                st.info(f"📸 {len(ref_imgs)} Referenzbild(er) werden mitgesendet...")
-            for i in range(num_images):
-                pro_hint = " ⚠️ Pro: 2-4 Min!" if "💎 Pro" in model_quality else (" 🔀 Hybrid: 2 Schritte" if "🔀 Hybrid" in model_quality else "")
-                with st.spinner(f"Gemini generiert Bild {i+1}/{num_images}...{pro_hint}"):
-                    img_bytes, mime_type = smart_generate_image(
-                        st.session_state.last_image_prompt, gemini_key,
-                        reference_images=ref_imgs, aspect_ratio_str=aspect_ratio,
-                    )
-                if img_bytes:
-                    st.session_state.generated_images.append({
-                        "bytes": img_bytes,
-                        "mime": mime_type,
-                        "type": "campaign",
-                        "time": datetime.now().strftime("%H:%M:%S"),
+            if use_job_queue:
+                ref_paths = [job_queue.store_reference(f) for f in ref_imgs or []]
+                for i in range(num_images):
+                    job_queue.enqueue(st.session_state.queue_session_id, "image", {
+                        "prompt": st.session_state.last_image_prompt,
+                        "aspect_ratio": aspect_ratio,
+                        "cache_slot": i,
+                        "ref_paths": ref_paths,
+                        "settings": queue_settings(),
                     })
+                st.success(f"🗄️ {num_images} Bild-Job(s) in der Queue — Ergebnisse erscheinen unten unter 📦 Job-Queue.")
+            else:
+                if ref_imgs:
+                    st.info(f"📸 {len(ref_imgs)} Referenzbild(er) werden mitgesendet...{describe_ref_upload(ref_imgs)}")
+                pro_hint = " ⚠️ Pro: 2-4 Min!" if "💎 Pro" in model_quality else (" 🔀 Hybrid: 2 Schritte" if "🔀 Hybrid" in model_quality else "")
+
+                # One live slot per image — filled as soon as that image arrives
+                slot_cols = st.columns(min(num_images, 4))
+                slots = [slot_cols[i % 4].empty() for i in range(num_images)]
+                for i, slot in enumerate(slots):
+                    slot.info(f"⏳ Bild {i+1}/{num_images} wird generiert...")
+
+                traces = [timings.Trace() for _ in range(num_images)]
+                jobs = [
+                    (i, partial(smart_generate_image,
+                                st.session_state.last_image_prompt, gemini_key,
+                                reference_images=ref_imgs, aspect_ratio_str=aspect_ratio, cache_slot=i,
+                                trace=traces[i]))
+                    for i in range(num_images)
+                ]
+                finished = []
+                with st.spinner(f"Gemini generiert {num_images} Bild(er), max. {max_parallel} gleichzeitig...{pro_hint}"):
+                    for i, result in run_parallel(jobs, max_parallel):
+                        img_bytes, mime_type = result if result else (None, None)
+                        if img_bytes:
+                            st.session_state.generated_images.append({
+                                "bytes": img_bytes,
+                                "mime": mime_type,
+                                "type": "campaign",
+                                "time": datetime.now().strftime("%H:%M:%S"),
+                                "timings": traces[i].as_dict(),
+                            })
+                            slots[i].image(img_bytes, caption=f"Bild {i+1}/{num_images} ✅", use_container_width=True)
+                            finished.append(i)
+                        else:
+                            slots[i].error(f"❌ Bild {i+1}/{num_images} fehlgeschlagen")
+
+                # Finished images now live in the gallery below — drop their live previews
+                for i in finished:
+                    slots[i].empty()
 
     # Show generated images
     if st.session_state.generated_images:
@@ -3270,6 +3843,7 @@ if st.session_state.last_image_prompt:
                         mime=img["mime"],
                         key=f"dl_campaign_{idx}_{img['time']}"
                     )
+                    show_timings(img)
 
             if st.button("🗑️ Generierte Campaign-Bilder löschen"):
                 st.session_state.generated_images = [img for img in st.session_state.generated_images if img["type"] != "campaign"]
@@ -3284,36 +3858,130 @@ if st.session_state.last_video_prompt:
         st.warning("⚠️ Gemini API Key fehlt! Veo nutzt den gleichen API Key.")
 
     if st.button("🎬 VIDEO JETZT ERSTELLEN MIT VEO", disabled=not gemini_key):
-        with st.spinner("Veo generiert Video... (kann 1-5 Min. dauern)"):
-            video_bytes = generate_video_veo(
-                st.session_state.last_video_prompt, gemini_key
-            )
-        if video_bytes:
-            st.session_state.generated_videos.append({
-                "bytes": video_bytes,
-                "type": "campaign",
-                "time": datetime.now().strftime("%H:%M:%S"),
+        if use_job_queue:
+            job_queue.enqueue(st.session_state.queue_session_id, "video", {
+                "prompt": st.session_state.last_video_prompt,
+                "duration": st.session_state.get("last_video_duration"),
             })
+            st.success("🗄️ Video-Job in der Queue — Ergebnis erscheint unten unter 📦 Job-Queue.")
+        else:
+            with st.spinner("Veo-Auftrag wird gesendet..."):
+                veo_job = generate_video_veo(
+                    st.session_state.last_video_prompt, gemini_key,
+                    duration=st.session_state.get("last_video_duration"),
+                )
+            if veo_job:
+                st.session_state.veo_job_ids.append(veo_job.id)
+                st.success("🎬 Video wird im Hintergrund generiert (1-5 Min.) — du kannst währenddessen weiterarbeiten.")
+
+    # Running Veo jobs — refreshes itself every few seconds while anything is rendering
+    veo_rendering = any(
+        job is not None and job.status == veo_jobs.RUNNING
+        for job in map(veo_jobs.get, st.session_state.veo_job_ids)
+    )
+
+    @st.fragment(run_every=5 if veo_rendering else None)
+    def veo_job_status():
+        for job_id in list(st.session_state.veo_job_ids):
+            job = veo_jobs.get(job_id)
+            if job is None:
+                st.warning("⚠️ Video-Auftrag nicht mehr gefunden (Server neu gestartet?).")
+                st.session_state.veo_job_ids.remove(job_id)
+            elif job.status == veo_jobs.RUNNING:
+                st.progress(job.progress, text=f"🎬 {job.model}: {job.message}")
+            elif job.status == veo_jobs.DONE:
+                st.session_state.generated_videos.append({
+                    "path": job.video_path,
+                    "type": "campaign",
+                    "time": datetime.fromtimestamp(job.finished_at).strftime("%H:%M:%S"),
+                })
+                st.session_state.veo_job_ids.remove(job_id)
+                veo_jobs.discard(job_id)
+                st.rerun()
+            else:
+                st.error(job.error)
+                if job.raw_response:
+                    st.json(job.raw_response)
+                if st.button("✖ Ausblenden", key=f"dismiss_veo_{job_id}"):
+                    st.session_state.veo_job_ids.remove(job_id)
+                    veo_jobs.discard(job_id)
+                    st.rerun()
+
+    veo_job_status()
 
     # Show generated videos
     campaign_vids = [v for v in st.session_state.generated_videos if v["type"] == "campaign"]
     if campaign_vids:
         st.markdown("### 🎥 Generierte Videos")
         for idx, vid in enumerate(campaign_vids):
-            st.video(vid["bytes"], format="video/mp4")
+            # Videos live on disk (veo_jobs.VIDEO_DIR) — only the path is kept in the session
+            if not os.path.exists(vid["path"]):
+                st.warning(f"⚠️ Video #{idx+1} ist nicht mehr verfügbar (Datei abgelaufen).")
+                continue
+            st.video(vid["path"], format="video/mp4")
             st.download_button(
                 label=f"💾 Video #{idx+1} speichern (.mp4)",
-                data=vid["bytes"],
+                data=partial(Path(vid["path"]).read_bytes),  # read only when clicked
                 file_name=f"nano_banana_video_{idx+1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4",
                 mime="video/mp4",
                 key=f"dl_video_{idx}_{vid['time']}"
             )
 
         if st.button("🗑️ Generierte Videos löschen"):
+            for vid in campaign_vids:
+                Path(vid["path"]).unlink(missing_ok=True)
             st.session_state.generated_videos = [v for v in st.session_state.generated_videos if v["type"] != "campaign"]
             st.rerun()
 
 
+# --- JOB QUEUE ---
+# Jobs of this session (or a re-attached one) — results come straight from the worker's files
+queue_jobs = job_queue.list_jobs(st.session_state.queue_session_id)
+if queue_jobs:
+    st.markdown("---")
+    st.markdown("### 📦 Job-Queue")
+    st.caption(f"Session-ID `{st.session_state.queue_session_id}` — Ergebnisse bleiben nach Reload erhalten. "
+               "Worker starten: `python worker.py`")
+    queue_pending = any(job["status"] in (job_queue.QUEUED, job_queue.RUNNING) for job in queue_jobs)
+
+    @st.fragment(run_every=5 if queue_pending else None)
+    def job_queue_panel():
+        jobs = job_queue.list_jobs(st.session_state.queue_session_id)
+        if queue_pending and not any(job["status"] in (job_queue.QUEUED, job_queue.RUNNING) for job in jobs):
+            st.rerun()  # all finished — full rerun stops the auto-refresh
+        cols = st.columns(min(len(jobs), 4))
+        for idx, job in enumerate(jobs):
+            with cols[idx % 4]:
+                label = f"{'🖼️' if job['kind'] == 'image' else '🎬'} Job `{job['id']}`"
+                if job["status"] == job_queue.QUEUED:
+                    st.info(f"{label}\n\n⏳ Wartet auf einen Worker...")
+                elif job["status"] == job_queue.RUNNING:
+                    st.info(f"{label}\n\n⚙️ Läuft seit {time.time() - job['started_at']:.0f}s")
+                elif job["status"] == job_queue.FAILED:
+                    st.error(f"{label}\n\n❌ {job['error']}")
+                elif not os.path.exists(job["result_path"]):
+                    st.warning(f"{label}\n\n⚠️ Ergebnisdatei nicht mehr vorhanden.")
+                else:
+                    finished = datetime.fromtimestamp(job["finished_at"]).strftime("%H:%M:%S")
+                    if job["kind"] == "image":
+                        st.image(job["result_path"], caption=f"{label} — {finished}", use_container_width=True)
+                    else:
+                        st.video(job["result_path"], format="video/mp4")
+                    st.download_button(
+                        label="💾 Speichern",
+                        data=partial(Path(job["result_path"]).read_bytes),  # read only when clicked
+                        file_name=f"nano_banana_job_{job['id']}{Path(job['result_path']).suffix}",
+                        mime=job["result_mime"],
+                        key=f"dl_job_{job['id']}"
+                    )
+
+    job_queue_panel()
+
+    if st.button("🗑️ Abgeschlossene Jobs entfernen"):
+        job_queue.delete_finished(st.session_state.queue_session_id)
+        st.rerun()
+
+
 # --- PRODUCT ONLY BUTTON ---
 if use_product_only:
     st.markdown("---")
@@ -3368,12 +4036,13 @@ if use_product_only:
                 # Collect product reference images if any
                 prod_refs = prod_ref_files if use_prod_ref and prod_ref_files else None
                 if prod_refs:
-                    st.info(f"📸 {len(prod_refs)} Referenzbild(er) werden mitgesendet...")
+                    st.info(f"📸 {len(prod_refs)} Referenzbild(er) werden mitgesendet...{describe_ref_upload(prod_refs)}")
                 for i in range(num_prod_images):
+                    trace = timings.Trace()
                     with st.spinner(f"Gemini generiert Product-Bild {i+1}/{num_prod_images}..."):
                         img_bytes, mime_type = smart_generate_image(
                             st.session_state.last_product_prompt, gemini_key,
-                            reference_images=prod_refs, aspect_ratio_str=prod_ar
+                            reference_images=prod_refs, aspect_ratio_str=prod_ar, cache_slot=i, trace=trace
                         )
                     if img_bytes:
                         st.session_state.generated_images.append({
@@ -3381,6 +4050,7 @@ if use_product_only:
                             "mime": mime_type,
                             "type": "product",
                             "time": datetime.now().strftime("%H:%M:%S"),
+                            "timings": trace.as_dict(),
                         })
 
         # Show product images
@@ -3399,6 +4069,7 @@ if use_product_only:
                         mime=img["mime"],
                         key=f"dl_product_{idx}_{img['time']}"
                     )
+                    show_timings(img)
 
             if st.button("🗑️ Generierte Product-Bilder löschen"):
                 st.session_state.generated_images = [img for img in st.session_state.generated_images if img["type"] != "product"]
@@ -3429,6 +4100,7 @@ if use_ad_creative:
                 carousel_prompts = build_carousel_prompts()
 
             st.session_state.last_carousel_prompts = carousel_prompts
+            st.session_state.carousel_failed_slides = []  # slide numbers of the old prompt set
             st.session_state.last_ad_prompt = None  # Clear single mode
             st.success(f"✅ {len(carousel_prompts)} Carousel-Slide Prompts generiert!")
 
@@ -3449,6 +4121,7 @@ if use_ad_creative:
 
             st.session_state.last_ad_prompt = ad_prompt
             st.session_state.last_carousel_prompts = None  # Clear carousel mode
+            st.session_state.carousel_failed_slides = []
             st.success("✅ Ad Creative Prompt generiert!")
             st.markdown("### 🎯 Ad Creative Prompt")
             st.code(ad_prompt, language="text")
@@ -3576,28 +4249,39 @@ Zielgruppe: {brief_persona}.
             if st.button("🚀 AD CREATIVE JETZT ERSTELLEN", disabled=not gemini_key):
                 ad_refs = ad_ref_files if use_ad_creative and ad_ref_files else None
                 if ad_refs:
-                    st.info(f"📸 {len(ad_refs)} Referenzbild(er) werden mitgesendet...")
+                    st.info(f"📸 {len(ad_refs)} Referenzbild(er) werden mitgesendet...{describe_ref_upload(ad_refs)}")
 
                 # Map ad format to aspect ratio string for Gemini
-                ad_ar_map = {
-                    "Facebook Feed (1:1 Quadrat)": "1:1",
-                    "Facebook Feed (4:5 Hochformat)": "4:5",
-                    "Instagram Story / Reels (9:16)": "9:16",
-                    "Facebook Cover / Banner (16:9)": "16:9",
-                    "Carousel Einzelbild (1:1)": "1:1",
-                }
-                ad_ar_str = ad_ar_map.get(ad_format, "1:1")
+                ad_ar_str = AD_FORMAT_ASPECT_RATIOS.get(ad_format, "1:1")
 
                 # 3-2-2 Mode: generate from all 3 variant prompts
                 if use_322 and st.session_state.get("ad_322_prompts"):
                     prompts_to_gen = [(p["name"], p["prompt"]) for p in st.session_state["ad_322_prompts"]]
-                    st.info(f"🔬 3-2-2 Modus: Generiere {len(prompts_to_gen)} visuell unterschiedliche Varianten...")
-                    for idx, (name, var_prompt) in enumerate(prompts_to_gen):
-                        with st.spinner(f"{name} ({idx+1}/{len(prompts_to_gen)})..."):
-                            img_bytes, mime_type = smart_generate_image(
-                                var_prompt, gemini_key,
-                                reference_images=ad_refs, aspect_ratio_str=ad_ar_str,
-                            )
+                    st.info(f"🔬 3-2-2 Modus: Generiere {len(prompts_to_gen)} visuell unterschiedliche Varianten gleichzeitig...")
+
+                    # One progress slot per variant — a failed variant doesn't hold up the others
+                    variant_cols = st.columns(len(prompts_to_gen))
+                    variant_slots = [col.empty() for col in variant_cols]
+                    variant_started = {}
+                    variant_traces = [timings.Trace() for _ in prompts_to_gen]
+                    for idx, (name, _) in enumerate(prompts_to_gen):
+                        variant_slots[idx].info(f"⏳ {name} — in der Warteschlange...")
+
+                    def _generate_variant(idx, name, var_prompt):
+                        variant_started[idx] = time.time()
+                        variant_slots[idx].info(f"🎨 {name} — wird generiert...")
+                        return smart_generate_image(
+                            var_prompt, gemini_key,
+                            reference_images=ad_refs, aspect_ratio_str=ad_ar_str, trace=variant_traces[idx],
+                        )
+
+                    jobs = [(idx, partial(_generate_variant, idx, name, var_prompt))
+                            for idx, (name, var_prompt) in enumerate(prompts_to_gen)]
+                    # The three variants are one package — always submitted together, even above max_parallel
+                    for idx, result in run_parallel(jobs, max(len(jobs), max_parallel)):
+                        name = prompts_to_gen[idx][0]
+                        took = time.time() - variant_started.get(idx, time.time())
+                        img_bytes, mime_type = result if result else (None, None)
                         if img_bytes:
                             st.session_state.generated_images.append({
                                 "bytes": img_bytes,
@@ -3605,14 +4289,19 @@ Zielgruppe: {brief_persona}.
                                 "type": "ad_creative",
                                 "variant": name,
                                 "time": datetime.now().strftime("%H:%M:%S"),
+                                "timings": variant_traces[idx].as_dict(),
                             })
+                            variant_slots[idx].success(f"✅ {name} — fertig nach {took:.0f}s")
+                        else:
+                            variant_slots[idx].error(f"❌ {name} — fehlgeschlagen nach {took:.0f}s")
                 else:
                     # Standard mode
                     for i in range(num_ad_images):
+                        trace = timings.Trace()
                         with st.spinner(f"Gemini generiert Ad Creative {i+1}/{num_ad_images}..."):
                             img_bytes, mime_type = smart_generate_image(
                                 st.session_state.last_ad_prompt, gemini_key,
-                                reference_images=ad_refs, aspect_ratio_str=ad_ar_str,
+                                reference_images=ad_refs, aspect_ratio_str=ad_ar_str, cache_slot=i, trace=trace,
                             )
                         if img_bytes:
                             st.session_state.generated_images.append({
@@ -3620,6 +4309,7 @@ Zielgruppe: {brief_persona}.
                                 "mime": mime_type,
                                 "type": "ad_creative",
                                 "time": datetime.now().strftime("%H:%M:%S"),
+                                "timings": trace.as_dict(),
                             })
 
         # Show ad creative images
@@ -3630,7 +4320,8 @@ Zielgruppe: {brief_persona}.
             cols = st.columns(min(len(ad_imgs), 4))
             for idx, img in enumerate(ad_imgs):
                 with cols[idx % 4]:
-                    st.image(img["bytes"], caption=f"Ad Creative #{idx+1} — {img['time']}", use_container_width=True)
+                    ad_caption = img.get("variant") or f"Ad Creative #{idx+1}"
+                    st.image(img["bytes"], caption=f"{ad_caption} — {img['time']}", use_container_width=True)
                     ext = "png" if "png" in img["mime"] else "jpg"
                     st.download_button(
                         label=f"💾 Ad #{idx+1} speichern",
@@ -3639,6 +4330,7 @@ Zielgruppe: {brief_persona}.
                         mime=img["mime"],
                         key=f"dl_ad_{idx}_{img['time']}"
                     )
+                    show_timings(img)
 
             if st.button("🗑️ Generierte Ad Creatives löschen"):
                 st.session_state.generated_images = [img for img in st.session_state.generated_images if img["type"] != "ad_creative"]
@@ -3648,41 +4340,83 @@ Zielgruppe: {brief_persona}.
     if st.session_state.get("last_carousel_prompts"):
         st.markdown("---")
         st.markdown("### 🎠 Carousel mit Gemini generieren")
-        st.caption(f"📌 {len(st.session_state.last_carousel_prompts)} Slides werden nacheinander generiert. Alle im 1:1 Format (Carousel-Standard).")
+        carousel_parallel = st.checkbox("⚡ Parallel-Modus (alle Slides gleichzeitig)", value=True, key="carousel_parallel",
+                                        help=f"Schickt alle Slides gleichzeitig an Gemini (max. {max_parallel} parallel, siehe Sidebar).")
+        slide_mode_text = "gleichzeitig" if carousel_parallel else "nacheinander"
+        st.caption(f"📌 {len(st.session_state.last_carousel_prompts)} Slides werden {slide_mode_text} generiert. Alle im 1:1 Format (Carousel-Standard).")
+
+        if "carousel_failed_slides" not in st.session_state:
+            st.session_state.carousel_failed_slides = []
 
         if not gemini_key:
             st.warning("⚠️ Gemini API Key fehlt!")
 
+        # Which slides to (re)generate this run — all, or only the ones that failed last time
+        slides_to_gen = []
         if st.button("🚀 CAROUSEL JETZT ERSTELLEN", disabled=not gemini_key):
+            slides_to_gen = list(range(1, len(st.session_state.last_carousel_prompts) + 1))
+        elif st.session_state.pop("carousel_retry_failed", False):
+            slides_to_gen = [n for n in st.session_state.carousel_failed_slides
+                             if n <= len(st.session_state.last_carousel_prompts)]
+
+        if slides_to_gen:
             ad_refs = ad_ref_files if use_ad_creative and ad_ref_files else None
             if ad_refs:
-                st.info(f"📸 {len(ad_refs)} Referenzbild(er) werden bei jeder Slide mitgesendet...")
-
-            carousel_progress = st.progress(0, text="🎠 Carousel wird generiert...")
+                st.info(f"📸 {len(ad_refs)} Referenzbild(er) werden bei jeder Slide mitgesendet...{describe_ref_upload(ad_refs)}")
 
-            for i, slide_prompt in enumerate(st.session_state.last_carousel_prompts):
-                pct = (i + 1) / len(st.session_state.last_carousel_prompts)
-                carousel_progress.progress(pct * 0.95, text=f"🎠 Slide {i+1}/{len(st.session_state.last_carousel_prompts)}...")
+            pro_hint = " (Pro)" if "💎 Pro" in model_quality else (" (Hybrid)" if "🔀 Hybrid" in model_quality else "")
+            carousel_progress = st.progress(0, text=f"🎠 Carousel wird generiert{pro_hint}...")
 
-                pro_hint = " (Pro)" if "💎 Pro" in model_quality else (" (Hybrid)" if "🔀 Hybrid" in model_quality else "")
-                with st.spinner(f"Gemini generiert Slide {i+1}{pro_hint}..."):
-                    img_bytes, mime_type = smart_generate_image(
-                        slide_prompt, gemini_key,
-                        reference_images=ad_refs, aspect_ratio_str="1:1",
-                    )
+            slide_traces = {n: timings.Trace() for n in slides_to_gen}
+            jobs = [
+                (n, partial(smart_generate_image,
+                            st.session_state.last_carousel_prompts[n - 1], gemini_key,
+                            reference_images=ad_refs, aspect_ratio_str="1:1", trace=slide_traces[n]))
+                for n in slides_to_gen
+            ]
+            failed = []
+            done = 0
+            for slide_num, result in run_parallel(jobs, max_parallel if carousel_parallel else 1):
+                img_bytes, mime_type = result if result else (None, None)
                 if img_bytes:
+                    # A slide generated again replaces its earlier image
+                    st.session_state.generated_images = [
+                        img for img in st.session_state.generated_images
+                        if not (img["type"] == "carousel" and img.get("slide") == slide_num)
+                    ]
                     st.session_state.generated_images.append({
                         "bytes": img_bytes,
                         "mime": mime_type,
                         "type": "carousel",
-                        "slide": i + 1,
+                        "slide": slide_num,
                         "time": datetime.now().strftime("%H:%M:%S"),
+                        "timings": slide_traces[slide_num].as_dict(),
                     })
-
-            carousel_progress.progress(1.0, text="✅ Carousel fertig!")
-
-        # Show carousel images
-        carousel_imgs = [img for img in st.session_state.generated_images if img["type"] == "carousel"]
+                else:
+                    failed.append(slide_num)
+                done += 1
+                carousel_progress.progress(done / len(jobs) * 0.95,
+                                           text=f"🎠 {done}/{len(jobs)} Slides fertig (zuletzt: Slide {slide_num})...")
+
+            st.session_state.carousel_failed_slides = sorted(failed)
+            if failed:
+                carousel_progress.progress(1.0, text=f"⚠️ Carousel fertig — {len(failed)} Slide(s) fehlgeschlagen")
+            else:
+                carousel_progress.progress(1.0, text="✅ Carousel fertig!")
+
+        # Retry only what failed — the click is picked up at the top of the next run
+        if st.session_state.carousel_failed_slides:
+            failed_list = ", ".join(str(n) for n in st.session_state.carousel_failed_slides)
+            st.warning(f"Slide(s) {failed_list} fehlgeschlagen.")
+            st.button(f"🔁 Nur fehlgeschlagene Slides neu generieren ({failed_list})",
+                      disabled=not gemini_key,
+                      on_click=lambda: st.session_state.update(carousel_retry_failed=True))
+
+        # Show carousel images (ordered by slide, not by arrival)
+        carousel_imgs = sorted(
+            [img for img in st.session_state.generated_images if img["type"] == "carousel"],
+            key=lambda img: img.get("slide", 0)
+        )
         if carousel_imgs:
             st.markdown("### 🎠 Carousel Slides")
             st.caption("💡 Lade alle Slides herunter und erstelle damit eine Carousel Ad im Facebook Ads Manager.")
@@ -3699,7 +4433,9 @@ Zielgruppe: {brief_persona}.
                         mime=img["mime"],
                         key=f"dl_carousel_{idx}_{img['time']}"
                     )
+                    show_timings(img)
 
             if st.button("🗑️ Carousel-Slides löschen"):
                 st.session_state.generated_images = [img for img in st.session_state.generated_images if img["type"] != "carousel"]
+                st.session_state.carousel_failed_slides = []
                 st.rerun()
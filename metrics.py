@@ -0,0 +1,243 @@
+"""Process-wide metrics: counters and histograms, exported as Prometheus text.
+
+Everything here is module state, so all Streamlit sessions (and the admin
+page under pages/) share one registry. serve() exposes it on a local port —
+set NANO_BANANA_METRICS_PORT (default 9464; 0 turns it off).
+
+Instrumented:
+    HTTP layer (gemini_client)  requests per model / method / status, bytes, server latency
+    generation functions        calls, outcome and latency via @instrument
+    image responses             finishReason blocks, fallback activations
+    Veo jobs (veo_jobs)         render outcome and duration
+"""
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("NANO_BANANA_METRICS_PORT", 9464))
+
+# Seconds — from a cached image to a slow 2K Pro render / Veo job
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 90, 120, 180, 240, 300, 600)
+RECENT_SAMPLES = 1024  # per label set, for exact percentiles on the admin page
+
+_MODEL_IN_URL = re.compile(r"/models/([^/:?]+)")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, str(labels.get(name, ""))) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """[(labels dict, value)] for every label set seen so far."""
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_text(key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Bucketed observations with labels, plus a window of recent samples for percentiles."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key → [bucket counts, sum, count, recent]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=RECENT_SAMPLES)]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3].append(value)
+
+    def percentiles(self, quantiles=(50, 90, 99)):
+        """[(labels dict, count, {q: seconds})] over the recent window (nearest rank)."""
+        with self._lock:
+            series = [(dict(key), s[2], sorted(s[3])) for key, s in self._series.items()]
+        result = []
+        for labels, count, recent in series:
+            values = {q: recent[min(len(recent) - 1, max(0, -(-q * len(recent) // 100) - 1))]
+                      for q in quantiles} if recent else {}
+            result.append((labels, count, values))
+        return result
+
+    def expose(self):
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(key)} {count}")
+        return lines
+
+
+HTTP_REQUESTS = Counter("nano_banana_http_requests_total",
+                        "HTTP requests to the Gemini / Veo API by model, method and status code.",
+                        ("model", "method", "code"))
+HTTP_SECONDS = Histogram("nano_banana_http_response_seconds",
+                         "Time until the API answered (response headers), by model.", ("model",))
+BYTES_SENT = Counter("nano_banana_http_bytes_sent_total", "Request body bytes sent, by model.", ("model",))
+BYTES_RECEIVED = Counter("nano_banana_http_bytes_received_total", "Response bytes received, by model.", ("model",))
+GENERATIONS = Counter("nano_banana_generations_total",
+                      "Calls of the generation functions by outcome (ok / failed / error).",
+                      ("function", "outcome"))
+GENERATION_SECONDS = Histogram("nano_banana_generation_seconds",
+                               "Wall time of the generation functions.", ("function",))
+IMAGE_BLOCKS = Counter("nano_banana_image_blocks_total",
+                       "Responses without an image, by model and finishReason.", ("model", "reason"))
+FALLBACKS = Counter("nano_banana_fallbacks_total",
+                    "Fallback activations (other model, smaller size, hedge backup, Flash-only hybrid).",
+                    ("kind", "model"))
+VEO_JOBS = Counter("nano_banana_veo_jobs_total", "Finished Veo jobs by model and status.", ("model", "status"))
+VEO_SECONDS = Histogram("nano_banana_veo_job_seconds", "Veo submit-to-finish time, by model.", ("model",))
+
+REGISTRY = (HTTP_REQUESTS, HTTP_SECONDS, BYTES_SENT, BYTES_RECEIVED, GENERATIONS, GENERATION_SECONDS,
+            IMAGE_BLOCKS, FALLBACKS, VEO_JOBS, VEO_SECONDS)
+
+
+def model_from_url(url):
+    match = _MODEL_IN_URL.search(url or "")
+    return match.group(1) if match else "other"
+
+
+def observe_http(method, url, code, seconds, bytes_sent=0, bytes_received=0):
+    """One HTTP attempt; code is the status or the exception class name."""
+    model = model_from_url(url)
+    HTTP_REQUESTS.inc(model=model, method=method, code=code)
+    HTTP_SECONDS.observe(seconds, model=model)
+    if bytes_sent:
+        BYTES_SENT.inc(bytes_sent, model=model)
+    if bytes_received:
+        BYTES_RECEIVED.inc(bytes_received, model=model)
+
+
+def _outcome(result):
+    if isinstance(result, tuple):
+        return "ok" if result and result[0] else "failed"
+    return "ok" if result else "failed"
+
+
+def observe_generation(function_name, outcome, seconds):
+    """One generation that was not run through an @instrument-ed function (e.g. a pipelined Hybrid image)."""
+    GENERATIONS.inc(function=function_name, outcome=outcome)
+    GENERATION_SECONDS.observe(seconds, function=function_name)
+
+
+def instrument(function_name):
+    """Decorator: count calls by outcome (falsy / (None, …) result = failed) and time them."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                observe_generation(function_name, outcome, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines += metric.expose()
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+    """Start the /metrics endpoint once per process; returns the port, or None if off / unavailable."""
+    global _server, _server_error
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                # e.g. a second app process or a worker on the same machine — keep running without
+                _server_error = e
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server.server_port if _server else None
+
+
+def server_error():
+    return _server_error
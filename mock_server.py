@@ -0,0 +1,333 @@
+"""Local stand-in for the Gemini / Veo REST API — benchmarks and tests without a key or spend.
+
+    python mock_server.py --port 8700 --flash-latency lognormal:8,0.4 --error-rate 0.05
+    GEMINI_BASE_URL=http://127.0.0.1:8700/v1beta streamlit run main.py
+
+Implements what the app calls:
+    GET  /v1beta/models                                   model list
+    POST /v1beta/models/{model}:generateContent           synthetic image in the requested
+                                                          aspectRatio (imageSize "2K" → 2048 px)
+    POST /v1beta/models/{model}:predictLongRunning        starts a fake Veo operation
+    GET  /v1beta/models/{model}/operations/{id}           operation status / result
+    GET  /v1beta/files/{id}:download                      "video" bytes (Range supported)
+    GET  /_stats                                          request counts per route and status
+
+Latencies are distributions ("fixed:2", "uniform:1,4", "normal:8,2",
+"lognormal:8,0.4" — median and sigma), separately for Flash, Pro, Veo and
+/models. Errors are drawn per request: --error-rate with --error-status
+(429 and 503 carry Retry-After), --block-rate answers IMAGE_SAFETY without
+an image, --unavailable answers 404 for the listed models. Any API key is
+accepted. The "video" is random bytes, not a playable MP4.
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from PIL import Image, ImageDraw
+
+IMAGE_MODELS = ("gemini-2.5-flash-image", "gemini-3-pro-image-preview")
+VEO_MODELS = ("veo-3.0-generate-preview", "veo-3.1-generate-preview", "veo-2.0-generate-001")
+
+ASPECT_RATIOS = {"1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"}
+
+
+class Latency:
+    """A latency distribution parsed from "kind:a,b" (seconds)."""
+
+    def __init__(self, spec):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        samplers = {
+            "fixed": lambda r, a: a[0],
+            "uniform": lambda r, a: r.uniform(a[0], a[1]),
+            "normal": lambda r, a: r.gauss(a[0], a[1]),
+            "lognormal": lambda r, a: r.lognormvariate(math.log(a[0]), a[1]),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution {spec!r} — use {', '.join(samplers)}")
+        self._sample = samplers[kind]
+        self.spec = spec
+
+    def sample(self, rng):
+        return max(0.0, self._sample(rng, self.args))
+
+
+class MockConfig:
+    """Behaviour of the stand-in server; all rates are probabilities per request."""
+
+    def __init__(self, flash_latency="uniform:1,3", pro_latency="uniform:4,10", veo_latency="uniform:20,40",
+                 models_latency="fixed:0.05", error_rate=0.0, error_status=(429, 503), retry_after=2,
+                 block_rate=0.0, unavailable=(), video_bytes=2 * 1024 * 1024, seed=None):
+        self.flash_latency = Latency(flash_latency)
+        self.pro_latency = Latency(pro_latency)
+        self.veo_latency = Latency(veo_latency)
+        self.models_latency = Latency(models_latency)
+        self.error_rate = error_rate
+        self.error_status = tuple(error_status)
+        self.retry_after = retry_after
+        self.block_rate = block_rate
+        self.unavailable = set(unavailable)
+        self.video_bytes = video_bytes
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def draw(self, fn):
+        with self.rng_lock:
+            return fn(self.rng)
+
+
+def synthetic_image(aspect_ratio, long_edge, label):
+    """PNG of the given aspect ratio: a gradient in a colour derived from label, with the label drawn on."""
+    w_ratio, h_ratio = (int(x) for x in aspect_ratio.split(":"))
+    if w_ratio >= h_ratio:
+        width, height = long_edge, round(long_edge * h_ratio / w_ratio)
+    else:
+        width, height = round(long_edge * w_ratio / h_ratio), long_edge
+    seed = abs(hash(label)) % 360
+    top = Image.new("HSV", (1, 2), 0)
+    top.putpixel((0, 0), (seed * 255 // 360, 160, 230))
+    top.putpixel((0, 1), ((seed * 255 // 360 + 40) % 256, 200, 90))
+    image = top.convert("RGB").resize((width, height), Image.BILINEAR)
+    ImageDraw.Draw(image).text((20, 20), f"MOCK {aspect_ratio} {width}x{height}\n{label}", fill=(255, 255, 255))
+    buf = io.BytesIO()
+    image.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.operations = {}   # id → (ready_at, model)
+        self.videos = {}       # id → bytes
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, *args):
+        pass
+
+    # --- helpers ---
+    def _send_json(self, status, obj, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.stats[f"{self.command} {self._route} {status}"] += 1
+
+    def _error(self, status, message, status_text):
+        headers = {}
+        if status in (429, 503):
+            headers["Retry-After"] = str(self.state.config.retry_after)
+        self._send_json(status, {"error": {"code": status, "message": message, "status": status_text}}, headers)
+
+    def _maybe_fail(self, model):
+        """Injected faults shared by every model call; True if an error was sent."""
+        config = self.state.config
+        if model in config.unavailable:
+            self._error(404, f"models/{model} is not found", "NOT_FOUND")
+            return True
+        if config.error_rate and config.draw(lambda r: r.random()) < config.error_rate:
+            status = config.draw(lambda r: r.choice(config.error_status))
+            text = {429: "RESOURCE_EXHAUSTED", 503: "UNAVAILABLE"}.get(status, "INTERNAL")
+            self._error(status, "Injected error from mock_server", text)
+            return True
+        return False
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    # --- routes ---
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/_stats":
+            self._route = "stats"
+            with self.state.lock:
+                stats = dict(self.state.stats)
+            return self._send_json(200, stats)
+        if path.endswith("/models"):
+            self._route = "models"
+            time.sleep(self.state.config.draw(self.state.config.models_latency.sample))
+            models = [{"name": f"models/{m}", "supportedGenerationMethods": ["generateContent"]} for m in IMAGE_MODELS]
+            models += [{"name": f"models/{m}", "supportedGenerationMethods": ["predictLongRunning"]} for m in VEO_MODELS]
+            models = [m for m in models if m["name"][7:] not in self.state.config.unavailable]
+            return self._send_json(200, {"models": models})
+        match = re.search(r"/models/([^/]+)/operations/([^/]+)$", path)
+        if match:
+            self._route = "operation"
+            return self._operation(match.group(1), match.group(2))
+        match = re.search(r"/files/([^/:]+):download$", path)
+        if match:
+            self._route = "download"
+            return self._download(match.group(1))
+        self._route = "unknown"
+        self._error(404, f"Unknown path {path}", "NOT_FOUND")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        match = re.search(r"/models/([^/:]+):(generateContent|predictLongRunning)$", path)
+        if not match:
+            self._route = "unknown"
+            return self._error(404, f"Unknown path {path}", "NOT_FOUND")
+        model, method = match.groups()
+        self._route = method
+        payload = self._read_json()
+        if method == "generateContent":
+            return self._generate_content(model, payload)
+        return self._predict_long_running(model, payload)
+
+    def _generate_content(self, model, payload):
+        config = self.state.config
+        latency = config.pro_latency if "pro" in model else config.flash_latency
+        time.sleep(config.draw(latency.sample))
+        if self._maybe_fail(model):
+            return
+        if config.block_rate and config.draw(lambda r: r.random()) < config.block_rate:
+            return self._send_json(200, {"candidates": [{"finishReason": "IMAGE_SAFETY", "content": {"parts": []}}]})
+
+        image_config = payload.get("generationConfig", {}).get("imageConfig", {})
+        aspect_ratio = image_config.get("aspectRatio", "1:1")
+        if aspect_ratio not in ASPECT_RATIOS:
+            return self._error(400, f"Unsupported aspect ratio {aspect_ratio}", "INVALID_ARGUMENT")
+        long_edge = 2048 if image_config.get("imageSize") == "2K" else 1024
+        prompt = " ".join(part.get("text", "") for content in payload.get("contents", [])
+                          for part in content.get("parts", []))
+        image = synthetic_image(aspect_ratio, long_edge, f"{model} · {len(prompt)} chars")
+        self._send_json(200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [
+                    {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(image).decode("ascii")}},
+                ]},
+                "finishReason": "STOP",
+            }],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": 1290},
+            "modelVersion": model,
+        })
+
+    def _predict_long_running(self, model, payload):
+        config = self.state.config
+        time.sleep(config.draw(config.models_latency.sample))
+        if self._maybe_fail(model):
+            return
+        op_id = uuid.uuid4().hex[:16]
+        with self.state.lock:
+            self.state.operations[op_id] = (time.time() + config.draw(config.veo_latency.sample), model)
+        self._send_json(200, {"name": f"models/{model}/operations/{op_id}"})
+
+    def _operation(self, model, op_id):
+        with self.state.lock:
+            op = self.state.operations.get(op_id)
+        if op is None:
+            return self._error(404, f"Operation {op_id} not found", "NOT_FOUND")
+        ready_at, _ = op
+        name = f"models/{model}/operations/{op_id}"
+        if time.time() < ready_at:
+            return self._send_json(200, {"name": name, "done": False})
+        with self.state.lock:
+            if op_id not in self.state.videos:
+                self.state.videos[op_id] = self.state.config.draw(
+                    lambda r: r.randbytes(self.state.config.video_bytes))
+        host = self.headers.get("Host", "127.0.0.1")
+        uri = f"http://{host}/v1beta/files/{op_id}:download?alt=media"
+        self._send_json(200, {"name": name, "done": True, "response": {
+            "@type": "type.googleapis.com/google.ai.generativelanguage.v1beta.PredictLongRunningResponse",
+            "generateVideoResponse": {"generatedSamples": [{"video": {"uri": uri}}]},
+        }})
+
+    def _download(self, op_id):
+        data = self.state.videos.get(op_id)
+        if data is None:
+            return self._error(404, f"File {op_id} not found", "NOT_FOUND")
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+        body = data[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.stats[f"GET download {206 if start else 200}"] += 1
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The app closes streamed responses early (errors, cancelled hedges) — not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def make_server(config=None, host="127.0.0.1", port=0):
+    """Build (not start) a server; port 0 picks a free port. Base URL: f"http://{host}:{server.server_port}/v1beta"."""
+    handler = type("MockHandler", (Handler,), {"state": MockState(config or MockConfig())})
+    return MockServer((host, port), handler)
+
+
+def start_background(config=None, host="127.0.0.1", port=0):
+    """Run a server in a daemon thread; returns (server, base_url). Stop with server.shutdown()."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Gemini / Veo stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--flash-latency", default="uniform:1,3", help="Flash generateContent latency")
+    parser.add_argument("--pro-latency", default="uniform:4,10", help="Pro generateContent latency")
+    parser.add_argument("--veo-latency", default="uniform:20,40", help="time until a Veo operation is done")
+    parser.add_argument("--models-latency", default="fixed:0.05", help="/models and Veo submit latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of model calls that fail")
+    parser.add_argument("--error-status", default="429,503", help="statuses drawn for injected errors")
+    parser.add_argument("--retry-after", type=int, default=2, help="Retry-After seconds on 429 / 503")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="share of images answered with IMAGE_SAFETY")
+    parser.add_argument("--unavailable", default="", help="comma-separated models answering 404")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        flash_latency=args.flash_latency, pro_latency=args.pro_latency, veo_latency=args.veo_latency,
+        models_latency=args.models_latency, error_rate=args.error_rate,
+        error_status=[int(s) for s in args.error_status.split(",") if s],
+        retry_after=args.retry_after, block_rate=args.block_rate,
+        unavailable=[m for m in args.unavailable.split(",") if m], seed=args.seed,
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"Mock Gemini/Veo API on http://{args.host}:{server.server_port}/v1beta — "
+          f"set GEMINI_BASE_URL to point the app at it", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import streamlit as st
+
+import metrics
+
+st.set_page_config(page_title="Nano Banana — Metriken", page_icon="📊", layout="wide")
+
+st.title("📊 Metriken")
+st.caption("Alle Sessions dieses App-Prozesses seit dem Start. Worker-Prozesse (worker.py, batch.py) zählen separat.")
+
+port = metrics.serve()
+if port:
+    st.caption(f"Prometheus-Endpoint: `http://127.0.0.1:{port}/metrics`")
+elif metrics.server_error():
+    st.caption(f"⚠️ Prometheus-Endpoint nicht gestartet: {metrics.server_error()}")
+else:
+    st.caption("Prometheus-Endpoint deaktiviert (NANO_BANANA_METRICS_PORT=0).")
+
+
+def _ms(seconds):
+    return f"{seconds:.1f}s" if seconds is not None else "—"
+
+
+def _mb(num_bytes):
+    return f"{num_bytes / 1024 / 1024:.1f} MB"
+
+
+@st.fragment(run_every=10)
+def metrics_overview():
+    requests_by_model = {}
+    for labels, value in metrics.HTTP_REQUESTS.samples():
+        row = requests_by_model.setdefault(labels["model"], {"Anfragen": 0, "429": 0, "503": 0, "Andere Fehler": 0})
+        row["Anfragen"] += value
+        code = labels["code"]
+        if code in ("429", "503"):
+            row[code] += value
+        elif not code.startswith("2"):
+            row["Andere Fehler"] += value
+
+    generations = {}
+    for labels, value in metrics.GENERATIONS.samples():
+        generations.setdefault(labels["function"], {"ok": 0, "failed": 0, "error": 0})[labels["outcome"]] += value
+
+    total_requests = sum(row["Anfragen"] for row in requests_by_model.values())
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("API-Anfragen", total_requests)
+    col2.metric("429 (Rate Limit)", sum(row["429"] for row in requests_by_model.values()))
+    col3.metric("503 (Überlastet)", sum(row["503"] for row in requests_by_model.values()))
+    col4.metric("Blockierte Bilder", sum(value for _, value in metrics.IMAGE_BLOCKS.samples()))
+    col5.metric("Fallbacks", sum(value for _, value in metrics.FALLBACKS.samples()))
+
+    st.markdown("#### Generierungen")
+    latency = {labels["function"]: (count, values) for labels, count, values in metrics.GENERATION_SECONDS.percentiles()}
+    rows = []
+    for function, outcomes in sorted(generations.items()):
+        _, values = latency.get(function, (0, {}))
+        rows.append({"Funktion": function, "OK": outcomes["ok"], "Ohne Ergebnis": outcomes["failed"],
+                     "Exception": outcomes["error"], "p50": _ms(values.get(50)), "p90": _ms(values.get(90)),
+                     "p99": _ms(values.get(99))})
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.caption("Noch keine Generierungen.")
+
+    st.markdown("#### API-Anfragen pro Modell")
+    latency = {labels["model"]: values for labels, _, values in metrics.HTTP_SECONDS.percentiles()}
+    sent = {labels["model"]: value for labels, value in metrics.BYTES_SENT.samples()}
+    received = {labels["model"]: value for labels, value in metrics.BYTES_RECEIVED.samples()}
+    rows = []
+    for model in sorted(set(requests_by_model) | set(received)):
+        values = latency.get(model, {})
+        rows.append({"Modell": model, **requests_by_model.get(model, {}),
+                     "Antwort p50": _ms(values.get(50)), "p90": _ms(values.get(90)), "p99": _ms(values.get(99)),
+                     "Gesendet": _mb(sent.get(model, 0)), "Empfangen": _mb(received.get(model, 0))})
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.caption("Noch keine API-Anfragen.")
+
+    col_blocks, col_fallbacks = st.columns(2)
+    with col_blocks:
+        st.markdown("#### Blockierte Bilder (finishReason)")
+        rows = [{"Modell": labels["model"], "Grund": labels["reason"], "Anzahl": value}
+                for labels, value in metrics.IMAGE_BLOCKS.samples()]
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Keine.")
+    with col_fallbacks:
+        st.markdown("#### Fallbacks")
+        rows = [{"Art": labels["kind"], "Modell": labels["model"], "Anzahl": value}
+                for labels, value in metrics.FALLBACKS.samples()]
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Keine.")
+
+    st.markdown("#### Veo-Jobs")
+    durations = {labels["model"]: values for labels, _, values in metrics.VEO_SECONDS.percentiles()}
+    rows = [{"Modell": labels["model"], "Status": labels["status"], "Anzahl": value,
+             "Dauer p50": _ms(durations.get(labels["model"], {}).get(50)),
+             "p90": _ms(durations.get(labels["model"], {}).get(90))}
+            for labels, value in metrics.VEO_JOBS.samples()]
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.caption("Noch keine abgeschlossenen Veo-Jobs.")
+
+    with st.expander("Prometheus-Rohdaten"):
+        st.code(metrics.render(), language="text")
+
+
+metrics_overview()
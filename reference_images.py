@@ -0,0 +1,151 @@
+"""Encoded reference-image store shared by all uploaders (campaign, product, ad).
+
+Uploads are keyed by the SHA-256 of their content, so the same photo is read,
+preprocessed and base64-encoded once per process — no matter how many images,
+slides or 3-2-2 variants it is sent with, or which uploader it came from.
+"""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+# Upper bound for the base64 payloads kept in memory (LRU beyond that)
+MAX_STORE_BYTES = 256 * 1024 * 1024
+
+# Preprocessing defaults — long edge in px, output format, encoder quality
+DEFAULT_PREPROCESS = {"max_edge": 1536, "format": "JPEG", "quality": 90}
+PREPROCESS_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+_store = OrderedDict()  # (sha256, mime, preprocess settings) -> entry dict
+_store_bytes = 0
+_store_lock = threading.Lock()
+
+
+def guess_mime(filename):
+    """MIME type from the upload's file name (same rules the app always used)."""
+    fname = (filename or "").lower()
+    if fname.endswith(".png"):
+        return "image/png"
+    if fname.endswith(".webp"):
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _read_view(upload):
+    """Zero-copy view of the upload's bytes where possible."""
+    if hasattr(upload, "getbuffer"):
+        return upload.getbuffer()
+    if hasattr(upload, "getvalue"):
+        return memoryview(upload.getvalue())
+    return memoryview(upload)
+
+
+def preprocess_image(data, max_edge=1536, format="JPEG", quality=90):
+    """Apply EXIF orientation, strip metadata, downscale and re-encode.
+
+    Returns (bytes, mime), or None if Pillow is missing, the image can't be
+    decoded, or re-encoding would not help (already small, upright and compact).
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            orientation = src.getexif().get(0x0112, 1)
+            icc_profile = src.info.get("icc_profile")  # kept: product colours depend on it
+            source_mode = src.mode
+            img = ImageOps.exif_transpose(src)
+    except Exception:
+        return None
+
+    resized = max(img.size) > max_edge
+    if resized:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    # JPEG has no alpha — flatten transparent PNGs onto white
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        if format == "JPEG":
+            flat = Image.new("RGB", img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel("A"))
+            img = flat
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    save_kwargs = {"quality": quality}
+    # A CMYK / greyscale profile doesn't describe the converted pixels — those are then plain sRGB
+    if icc_profile and img.mode == source_mode:
+        save_kwargs["icc_profile"] = icc_profile
+    if format == "JPEG":
+        save_kwargs.update(optimize=True, progressive=True)
+
+    out = io.BytesIO()
+    img.save(out, format, **save_kwargs)  # no exif= → EXIF/GPS metadata is dropped
+    processed = out.getvalue()
+
+    if not resized and orientation == 1 and len(processed) >= len(data):
+        return None
+    return processed, PREPROCESS_MIME[format]
+
+
+def encode_reference(upload, preprocess=None):
+    """Return {"sha256", "mimeType", "data", "original_bytes", "sent_bytes"} for an upload.
+
+    preprocess: None to send the file as-is, or a dict like DEFAULT_PREPROCESS.
+    Each (content, settings) combination is processed and encoded only once.
+    """
+    global _store_bytes
+    mime = guess_mime(getattr(upload, "name", ""))
+    settings = tuple(sorted(preprocess.items())) if preprocess else None
+    view = _read_view(upload)
+    try:
+        digest = hashlib.sha256(view).hexdigest()
+        key = (digest, mime, settings)
+        with _store_lock:
+            entry = _store.get(key)
+            if entry is not None:
+                _store.move_to_end(key)
+                return entry
+
+        original_bytes = view.nbytes
+        processed = preprocess_image(view.tobytes(), **preprocess) if preprocess else None
+        if processed:
+            payload, mime = processed
+        else:
+            payload = view
+        entry = {
+            "sha256": digest,
+            "mimeType": mime,
+            "data": base64.b64encode(payload).decode("ascii"),
+            "original_bytes": original_bytes,
+            "sent_bytes": len(payload) if processed else original_bytes,
+        }
+        del payload
+    finally:
+        view.release()
+
+    with _store_lock:
+        if key not in _store:
+            _store[key] = entry
+            _store_bytes += len(entry["data"])
+            while _store_bytes > MAX_STORE_BYTES and len(_store) > 1:
+                _, evicted = _store.popitem(last=False)
+                _store_bytes -= len(evicted["data"])
+        return _store[key]
+
+
+def inline_part(entry):
+    """Gemini request part for an encoded reference."""
+    return {"inlineData": {"mimeType": entry["mimeType"], "data": entry["data"]}}
+
+
+def describe_savings(entries):
+    """Human-readable size summary for a list of encoded references, e.g. '38.2 MB → 1.9 MB (−95%)'."""
+    before = sum(e["original_bytes"] for e in entries)
+    after = sum(e["sent_bytes"] for e in entries)
+    if not before or after >= before:
+        return ""
+    return f"{before / 1e6:.1f} MB → {after / 1e6:.1f} MB (−{(before - after) * 100 // before}%)"
@@ -0,0 +1,108 @@
+"""Content-addressed on-disk cache for generated images.
+
+Key = SHA-256 over everything that determines the Gemini output (final
+prompt, model, reference-image hashes, aspect ratio, imageSize and the
+variation slot). Files are written atomically and evicted least-recently-used
+once the cache grows beyond MAX_CACHE_BYTES — a hit refreshes the file's mtime.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache")) / "images"
+MAX_CACHE_BYTES = int(os.environ.get("NANO_BANANA_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+MIME_EXT = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+EXT_MIME = {ext: mime for mime, ext in MIME_EXT.items()}
+
+_evict_lock = threading.Lock()
+
+
+def make_key(prompt, model, ref_hashes=(), aspect_ratio=None, image_size=None, slot=0):
+    """Hash of every input that changes the generated image."""
+    material = json.dumps({
+        "prompt": prompt,
+        "model": model,
+        "refs": list(ref_hashes),
+        "aspect_ratio": aspect_ratio,
+        "image_size": image_size,
+        "slot": slot,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _find(key):
+    for ext in EXT_MIME:
+        path = CACHE_DIR / f"{key}.{ext}"
+        if path.exists():
+            return path
+    return None
+
+
+def get(key):
+    """Return (bytes, mime) for a cached image, or None."""
+    path = _find(key)
+    if path is None:
+        return None
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # LRU: mark as recently used
+    except OSError:
+        return None
+    return data, EXT_MIME[path.suffix[1:]]
+
+
+def put(key, data, mime):
+    """Store an image under key (atomic write), then evict beyond the size limit."""
+    ext = MIME_EXT.get(mime, "png")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_DIR / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, CACHE_DIR / f"{key}.{ext}")
+    except OSError:
+        return  # a cache must never break generation
+    evict()
+
+
+def evict(max_bytes=None):
+    """Delete least-recently-used images until the cache fits into max_bytes."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    with _evict_lock:
+        files = []
+        total = 0
+        for path in CACHE_DIR.glob("*.*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+
+def stats():
+    """(number of images, total bytes) currently cached."""
+    count = 0
+    total = 0
+    for path in CACHE_DIR.glob("*.*"):
+        if path.name.startswith("."):
+            continue
+        try:
+            total += path.stat().st_size
+            count += 1
+        except OSError:
+            pass
+    return count, total
@@ -0,0 +1,160 @@
+"""One retry policy for every Gemini / Veo HTTP call.
+
+Exponential backoff with jitter, Retry-After (header or Google RetryInfo)
+honoured, a per-call attempt limit and a shared deadline budget, so a chain
+of fallback models can never take longer than the budget in total.
+Responses and exceptions are classified as retryable or fatal; fatal ones
+are raised immediately, retryable ones are raised once the budget is spent.
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import circuit_breaker
+import timings
+
+# Overload / transient server states worth another attempt
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Never start an attempt with less read time left than this
+MIN_ATTEMPT_SECONDS = 5
+
+
+class RetryPolicy:
+    """Attempts, backoff curve and total time budget for one kind of request."""
+
+    def __init__(self, max_attempts=3, base_delay=2.0, max_delay=30.0, deadline=300.0, retry_read_timeouts=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        # A read timeout on a multi-minute generation means "too slow", not "try again"
+        self.retry_read_timeouts = retry_read_timeouts
+
+    def backoff(self, attempt):
+        """Delay before attempt+1: exponential, capped, with equal jitter."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+# Image generation: slow reads are handled by the caller (downgrade to standard size)
+IMAGE_POLICY = RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=20.0, deadline=480.0, retry_read_timeouts=False)
+# Veo submission and status polling: short requests, retry freely
+VEO_SUBMIT_POLICY = RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=20.0, deadline=180.0)
+VEO_POLL_POLICY = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=15.0, deadline=60.0)
+
+
+class Deadline:
+    """Time budget shared by several calls (e.g. a primary model and its fallbacks)."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def parse_retry_after(response):
+    """Seconds the server asked us to wait, or None.
+
+    Reads the Retry-After header (seconds or HTTP date) and, failing that,
+    google.rpc.RetryInfo.retryDelay (e.g. "23s") from the JSON error body.
+    """
+    if response is None:
+        return None
+    header = response.headers.get("Retry-After")
+    if header:
+        header = header.strip()
+        if header.isdigit():
+            return float(header)
+        try:
+            return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except ValueError:
+        return None
+    for detail in details:
+        if isinstance(detail, dict) and detail.get("@type", "").endswith("RetryInfo"):
+            delay = str(detail.get("retryDelay", "")).rstrip("s")
+            try:
+                return float(delay)
+            except ValueError:
+                return None
+    return None
+
+
+def is_retryable(error, policy=None):
+    """Classify an exception raised by requests (or by raise_for_status)."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.Timeout):
+        return policy is None or policy.retry_read_timeouts
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+def run(send, policy, read_timeout, deadline=None, on_retry=None, breaker=None):
+    """Call send(read_timeout) until it returns a successful response.
+
+    send: callable taking the read timeout for this attempt (capped by the
+        remaining budget) and returning a requests.Response.
+    deadline: optional shared Deadline; defaults to a fresh policy.deadline.
+    on_retry: optional callable(attempt, delay, reason) shown before waiting.
+    breaker: optional circuit_breaker.CircuitBreaker — every attempt's outcome
+        is recorded, and CircuitOpenError is raised instead of sending while
+        it is open (also between retries).
+
+    Returns the response. Raises HTTPError for fatal statuses at once, and the
+    last error once attempts or budget are used up.
+    """
+    deadline = deadline or Deadline(policy.deadline)
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline.remaining()
+        if remaining < MIN_ATTEMPT_SECONDS:
+            raise requests.exceptions.Timeout(f"Retry budget of {policy.deadline:.0f}s exhausted")
+
+        if breaker is not None and not breaker.allow():
+            raise circuit_breaker.CircuitOpenError(breaker.name, breaker.retry_in())
+
+        retry_after = None
+        try:
+            response = send(min(read_timeout, remaining))
+            response.raise_for_status()
+            if breaker is not None:
+                breaker.record(True)
+            return response
+        except requests.exceptions.RequestException as e:
+            if breaker is not None:
+                # Overload-type failures count against the model; a 400 does not
+                breaker.record(not is_retryable(e))
+            if not is_retryable(e, policy) or attempt >= policy.max_attempts:
+                raise
+            error = e
+            if isinstance(e, requests.exceptions.HTTPError):
+                retry_after = parse_retry_after(e.response)
+                reason = f"HTTP {e.response.status_code}"
+                # Streamed responses hold their connection until closed — free it before waiting
+                e.response.close()
+            else:
+                reason = type(e).__name__
+        except Exception:
+            if breaker is not None:
+                # Still an outcome — otherwise a half-open probe would stay in flight forever
+                breaker.record(False)
+            raise
+
+        delay = retry_after if retry_after is not None else policy.backoff(attempt)
+        # Waiting past the budget is pointless — give the caller the error now
+        if delay + MIN_ATTEMPT_SECONDS > deadline.remaining():
+            raise error
+        if on_retry:
+            on_retry(attempt, delay, reason)
+        with timings.span("backoff", reason=reason):
+            time.sleep(delay)
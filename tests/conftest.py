@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The app's modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Module-level paths (cache, job queue, cost ledger) are resolved at import time —
+# point them at a throwaway directory before any test imports them
+os.environ["NANO_BANANA_CACHE_DIR"] = tempfile.mkdtemp(prefix="nano-banana-tests-")
+os.environ["NANO_BANANA_METRICS_PORT"] = "0"
@@ -0,0 +1,127 @@
+import pytest
+import requests
+
+import circuit_breaker
+import retry_policy
+from test_retry_policy import FAST, response, sender
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry_policy.time, "sleep", lambda seconds: None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the breaker module."""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def tripped(cooldown=60):
+    breaker = circuit_breaker.CircuitBreaker("m", min_requests=3, threshold=0.5, cooldown=cooldown)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == circuit_breaker.OPEN
+    return breaker
+
+
+def test_stays_closed_below_min_requests():
+    breaker = circuit_breaker.CircuitBreaker("m", min_requests=3)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_opens_at_error_rate_threshold():
+    breaker = circuit_breaker.CircuitBreaker("m", min_requests=3, threshold=0.5)
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.OPEN
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = circuit_breaker.CircuitBreaker("m", window=60, min_requests=3, threshold=0.5)
+    breaker.record(False)
+    breaker.record(False)
+    clock[0] += 61
+    breaker.record(True)
+    assert breaker.error_rate() == 0.0
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_open_skips_until_cooldown_then_lets_one_probe_through(clock):
+    breaker = tripped(cooldown=60)
+    assert not breaker.allow()
+    assert breaker.retry_in() == 60
+
+    clock[0] += 60
+    assert breaker.allow()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.allow()  # only one probe at a time
+
+
+def test_successful_probe_closes(clock):
+    breaker = tripped()
+    clock[0] += 60
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.error_rate() == 0.0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = tripped()
+    clock[0] += 60
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == circuit_breaker.OPEN
+    assert not breaker.allow()
+    clock[0] += 60
+    assert breaker.allow()
+
+
+def test_run_raises_circuit_open_without_sending():
+    breaker = tripped()
+    send = sender(response(200))
+    with pytest.raises(circuit_breaker.CircuitOpenError) as excinfo:
+        retry_policy.run(send, FAST, 30, breaker=breaker)
+    assert send.calls == []
+    assert excinfo.value.retry_in > 0
+
+
+def test_run_records_every_outcome_and_400_does_not_count():
+    breaker = circuit_breaker.CircuitBreaker("m", min_requests=3, threshold=0.5)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.HTTPError):
+            retry_policy.run(sender(response(400)), FAST, 30, breaker=breaker)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        retry_policy.run(sender(response(503), response(503), response(503)), FAST, 30, breaker=breaker)
+    assert breaker.state == circuit_breaker.OPEN
+
+
+@pytest.mark.parametrize("error", [ValueError("bad body"), OSError("disk full")])
+def test_probe_raising_other_exception_does_not_stay_in_flight(clock, error):
+    breaker = tripped()
+    clock[0] += 60
+    with pytest.raises(type(error)):
+        retry_policy.run(sender(error), FAST, 30, breaker=breaker)
+
+    assert breaker.state == circuit_breaker.OPEN
+    clock[0] += 60
+    assert breaker.allow()
+
+
+def test_probe_through_run_closes_on_success(clock):
+    breaker = tripped()
+    clock[0] += 60
+    assert retry_policy.run(sender(response(200)), FAST, 30, breaker=breaker).status_code == 200
+    assert breaker.state == circuit_breaker.CLOSED
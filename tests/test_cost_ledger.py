@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+import cost_ledger
+
+
+@pytest.fixture(autouse=True)
+def ledger_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(cost_ledger, "DB_PATH", tmp_path / "costs.sqlite3")
+    monkeypatch.setattr(cost_ledger, "_local", threading.local())
+
+
+def test_prices():
+    assert cost_ledger.image_price("gemini-2.5-flash-image") == cost_ledger.FLASH_IMAGE_PRICE
+    assert cost_ledger.image_price("gemini-3-pro-image-preview", "4K") == cost_ledger.PRO_IMAGE_PRICES["4K"]
+    assert cost_ledger.image_price("gemini-3-pro-image-preview") == cost_ledger.PRO_IMAGE_PRICES["1K"]
+    assert cost_ledger.veo_price("veo-3.1-generate-preview", 4) == pytest.approx(4 * 0.40)
+    # Unknown Veo model → the most expensive rate, never an underestimate
+    assert cost_ledger.veo_price("veo-9") == max(cost_ledger.VEO_PRICES_PER_SECOND.values()) * 8
+
+
+def test_totals_per_session_and_day():
+    cost_ledger.record("s1", "image", "pro", 0.14)
+    cost_ledger.record("s1", "polish", "gpt-4o", 0.01)
+    cost_ledger.record("s2", "image", "flash", 0.04)
+
+    assert cost_ledger.totals("s1") == pytest.approx((0.15, 0.19))
+    assert cost_ledger.totals("s2") == pytest.approx((0.04, 0.19))
+    assert cost_ledger.breakdown("s1") == [("image", "pro", 1, 0.14), ("polish", "gpt-4o", 1, 0.01)]
+
+
+def test_session_cap():
+    cost_ledger.record("s1", "image", "pro", 0.28)
+    cost_ledger.check("s1", 0.14, session_cap=0.42)  # exactly at the cap is fine
+
+    with pytest.raises(cost_ledger.BudgetExceeded) as excinfo:
+        cost_ledger.check("s1", 0.15, session_cap=0.42)
+    assert (excinfo.value.scope, excinfo.value.spent, excinfo.value.cap) == ("session", pytest.approx(0.28), 0.42)
+
+    cost_ledger.check("s2", 0.15, session_cap=0.42)  # other sessions have their own
+
+
+def test_daily_cap_counts_every_session():
+    cost_ledger.record("s1", "image", "pro", 0.50)
+    cost_ledger.record("s2", "image", "pro", 0.40)
+
+    with pytest.raises(cost_ledger.BudgetExceeded) as excinfo:
+        cost_ledger.check("s3", 0.14, daily_cap=1.0)
+    assert excinfo.value.scope == "day"
+
+
+def test_no_cap_means_unlimited():
+    cost_ledger.record("s1", "video", "veo-3.0", 100.0)
+    cost_ledger.check("s1", 100.0, session_cap=0, daily_cap=None)
+
+
+def test_reservations_count_until_released():
+    first = cost_ledger.reserve("s1", 0.14, session_cap=0.30)
+    second = cost_ledger.reserve("s1", 0.14, session_cap=0.30)
+    with pytest.raises(cost_ledger.BudgetExceeded):
+        cost_ledger.reserve("s1", 0.14, session_cap=0.30)
+
+    cost_ledger.release(first)
+    cost_ledger.release(second)
+    assert cost_ledger.totals("s1") == (0, 0)
+    assert cost_ledger.breakdown("s1") == []
+
+
+def test_parallel_reservations_cannot_overshoot_the_cap():
+    granted = []
+    lock = threading.Lock()
+
+    def _reserve():
+        try:
+            reservation = cost_ledger.reserve("s1", 0.14, session_cap=0.70)
+        except cost_ledger.BudgetExceeded:
+            return
+        with lock:
+            granted.append(reservation)
+
+    threads = [threading.Thread(target=_reserve) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(granted) == 5
+
+
+def test_stale_reservations_are_ignored_and_cleaned_up(monkeypatch):
+    stale = cost_ledger.reserve("s1", 0.50, session_cap=0.60)
+    monkeypatch.setattr(cost_ledger, "RESERVATION_TTL", -1)  # every reservation is now "old"
+
+    cost_ledger.check("s1", 0.50, session_cap=0.60)
+
+    fresh = cost_ledger.reserve("s1", 0.10)
+    cost_ledger.release(fresh)
+    count = cost_ledger._connect().execute("SELECT COUNT(*) FROM entries WHERE id = ?", (stale,)).fetchone()[0]
+    assert count == 0
+
+
+def test_recording_against_a_reservation_does_not_count_twice():
+    reservation = cost_ledger.reserve("s1", 0.18, session_cap=0.36)
+    cost_ledger.record("s1", "image", "gemini-2.5-flash-image", 0.04, reservation)
+    assert cost_ledger.totals("s1") == pytest.approx((0.18, 0.18))  # 0.04 booked + 0.14 still held
+
+    cost_ledger.reserve("s1", 0.18, session_cap=0.36)  # fits: the first image is not counted twice
+    cost_ledger.record("s1", "image", "gemini-3-pro-image-preview", 0.14, reservation)
+    cost_ledger.release(reservation)
+    assert cost_ledger.totals("s1") == pytest.approx((0.36, 0.36))
+    assert [row[:3] for row in cost_ledger.breakdown("s1")] == [
+        ("image", "gemini-3-pro-image-preview", 1), ("image", "gemini-2.5-flash-image", 1)]
+
+
+def test_costs_beyond_the_estimate_still_count():
+    reservation = cost_ledger.reserve("s1", 0.04)
+    cost_ledger.record("s1", "image", "gemini-3-pro-image-preview", 0.14, reservation)
+    assert cost_ledger.totals("s1") == pytest.approx((0.14, 0.14))
+
+
+def test_bound_reservation_is_per_thread():
+    cost_ledger.bind(7)
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(cost_ledger.current()))
+    thread.start()
+    thread.join()
+    assert (cost_ledger.current(), seen) == (7, [None])
+    cost_ledger.bind(None)
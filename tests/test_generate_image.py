@@ -0,0 +1,116 @@
+"""generate_image_gemini against the local stand-in server (mock_server.py), run headless."""
+import threading
+import time
+
+import pytest
+
+import circuit_breaker
+import cost_ledger
+import gemini_client
+import headless
+import mock_server
+import result_cache
+
+
+@pytest.fixture(scope="module")
+def loaded_app():
+    app = headless.load_app()
+    app["st"] = headless.ErrorRecorder(app["st"])
+    return app, dict(app)
+
+
+@pytest.fixture
+def app(loaded_app, tmp_path, monkeypatch):
+    app, baseline = loaded_app
+    app.clear()
+    app.update(baseline)
+    app["st"].reset()
+    app.update(force_fresh=False, model_quality="💎 Pro", hedge_after=0)
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path / "images")
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(cost_ledger, "DB_PATH", tmp_path / "costs.sqlite3")
+    monkeypatch.setattr(cost_ledger, "_local", threading.local())
+    return app
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    servers = []
+
+    def _serve(**config):
+        server, base_url = mock_server.start_background(mock_server.MockConfig(seed=1, **config))
+        servers.append(server)
+        monkeypatch.setattr(gemini_client, "GEMINI_BASE_URL", base_url)
+        return server
+
+    yield _serve
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """(model, generationConfig, prompt text) of every generateContent request."""
+    requests_sent = []
+    http_post = gemini_client.http_post
+
+    def _spy(url, **kwargs):
+        if ":generateContent" in url:
+            body = kwargs["json"]
+            model = url.split("/models/")[1].split(":")[0]
+            requests_sent.append((model, body["generationConfig"], body["contents"][0]["parts"][0]["text"]))
+        return http_post(url, **kwargs)
+
+    monkeypatch.setattr(gemini_client, "http_post", _spy)
+    return requests_sent
+
+
+def _generate(app):
+    return app["generate_image_gemini"]("a gold necklace", "test-key", aspect_ratio_str="9:16", prefer_pro=True)
+
+
+def test_primary_result_is_cached(app, serve, sent):
+    serve(pro_latency="fixed:0.05")
+
+    img_bytes, _ = _generate(app)
+    assert img_bytes
+    assert result_cache.stats()[0] == 1
+
+    assert _generate(app)[0] == img_bytes
+    assert len(sent) == 1
+
+
+def test_fallback_result_is_not_cached_under_the_pro_key(app, serve, sent):
+    serve(flash_latency="fixed:0.05")
+    pro_model = app["find_gemini_image_model"]("test-key", prefer_pro=True)
+    breaker = circuit_breaker.get(pro_model)
+    for _ in range(breaker.min_requests):
+        breaker.record(False)
+
+    img_bytes, _ = _generate(app)
+
+    assert img_bytes
+    assert [model for model, _, _ in sent] == ["gemini-2.5-flash-image"]
+    assert result_cache.stats() == (0, 0)
+
+
+def test_flash_hedge_backup_gets_its_own_payload_and_is_not_cached(app, serve, sent):
+    serve(pro_latency="fixed:1", flash_latency="fixed:0.05")
+    app.update(hedge_after=0.3, hedge_backup="flash")
+
+    img_bytes, _ = _generate(app)
+
+    assert img_bytes
+    (pro_model, pro_config, pro_prompt), (backup_model, backup_config, backup_prompt) = sent
+    assert pro_config["imageConfig"] == {"aspectRatio": "9:16", "imageSize": "2K"}
+    assert backup_model == "gemini-2.5-flash-image"
+    assert backup_config["imageConfig"] == {"aspectRatio": "9:16"}
+    assert "Pro Model" in pro_prompt and "Pro Model" not in backup_prompt
+    assert result_cache.stats() == (0, 0)
+
+    # The losing Pro leg is still billed once its response arrives
+    deadline = time.monotonic() + 5
+    while len(cost_ledger.breakdown(app["cost_session_id"]())) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    booked = {model for _, model, _, _ in cost_ledger.breakdown(app["cost_session_id"]())}
+    assert booked == {pro_model, backup_model}
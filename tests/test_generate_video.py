@@ -0,0 +1,129 @@
+"""Veo submission and download against the local stand-in server (mock_server.py), run headless."""
+import threading
+
+import pytest
+import requests
+
+import circuit_breaker
+import cost_ledger
+import gemini_client
+import headless
+import mock_server
+import veo_jobs
+
+KEY = "test-key"
+
+
+@pytest.fixture(scope="module")
+def loaded_app():
+    app = headless.load_app()
+    app["st"] = headless.ErrorRecorder(app["st"])
+    return app, dict(app)
+
+
+@pytest.fixture
+def app(loaded_app, tmp_path, monkeypatch):
+    app, baseline = loaded_app
+    app.clear()
+    app.update(baseline)
+    app["st"].reset()
+    app.update(session_budget=0, daily_budget=0)
+    monkeypatch.setattr(cost_ledger, "DB_PATH", tmp_path / "costs.sqlite3")
+    monkeypatch.setattr(cost_ledger, "_local", threading.local())
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(veo_jobs, "MODEL_RECORD_FILE", tmp_path / "veo_models.json")
+    monkeypatch.setattr(veo_jobs, "_model_records", None)
+    # Submission only — no background polling thread
+    monkeypatch.setattr(veo_jobs, "start", lambda operation_name, model, api_key, duration: (operation_name, model))
+    return app
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    servers = []
+
+    def _serve(**config):
+        config.setdefault("models_latency", "fixed:0")
+        server, base_url = mock_server.start_background(mock_server.MockConfig(seed=1, **config))
+        servers.append(server)
+        monkeypatch.setattr(gemini_client, "GEMINI_BASE_URL", base_url)
+        return server, base_url
+
+    yield _serve
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """Model of every predictLongRunning request."""
+    models = []
+    http_post = gemini_client.http_post
+
+    def _spy(url, **kwargs):
+        if ":predictLongRunning" in url:
+            models.append(url.split("/models/")[1].split(":")[0])
+        return http_post(url, **kwargs)
+
+    monkeypatch.setattr(gemini_client, "http_post", _spy)
+    return models
+
+
+def test_working_model_is_remembered_and_tried_first(app, serve, submitted):
+    serve(unavailable=("veo-3.0-generate-preview",))
+
+    _, model = app["generate_video_veo"]("a sunrise", KEY)
+    assert model == "veo-3.1-generate-preview"
+    assert submitted == ["veo-3.0-generate-preview", "veo-3.1-generate-preview"]
+    assert veo_jobs.known_model(KEY)["model"] == model
+
+    submitted.clear()
+    app["generate_video_veo"]("a sunset", KEY)
+    assert submitted == ["veo-3.1-generate-preview"]
+
+
+def test_remembered_model_that_stops_working_is_replaced(app, serve, submitted):
+    veo_jobs.remember_model(KEY, "veo-3.1-generate-preview", {})
+    serve(unavailable=("veo-3.1-generate-preview",))
+
+    _, model = app["generate_video_veo"]("a sunrise", KEY)
+
+    assert submitted == ["veo-3.1-generate-preview", "veo-3.0-generate-preview"]
+    assert model == "veo-3.0-generate-preview"
+    known = veo_jobs.known_model(KEY)
+    assert (known["model"], known["params"]) == (model, {"generateAudio": True})
+
+
+def test_dropped_download_resumes_with_a_range_request(serve, tmp_path, monkeypatch):
+    server, base_url = serve()
+    video = bytes(range(256)) * 40
+    server.RequestHandlerClass.state.videos["clip"] = video
+    monkeypatch.setattr(veo_jobs, "DOWNLOAD_CHUNK", 1000)
+    monkeypatch.setattr(veo_jobs.time, "sleep", lambda seconds: None)
+
+    # The first response breaks off after one chunk, like a dropped connection
+    http_get = gemini_client.http_get
+    calls = []
+
+    def _flaky_get(url, **kwargs):
+        resp = http_get(url, **kwargs)
+        calls.append(kwargs["headers"].get("Range"))
+        if len(calls) == 1:
+            chunks = resp.iter_content
+
+            def _cut_off(chunk_size):
+                yield next(chunks(chunk_size))
+                raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+            resp.iter_content = _cut_off
+        return resp
+
+    monkeypatch.setattr(gemini_client, "http_get", _flaky_get)
+    dest = veo_jobs.download_to_file(f"{base_url}/files/clip:download?alt=media", tmp_path / "clip.mp4")
+
+    assert dest.read_bytes() == video
+    assert calls == [None, "bytes=1000-"]
+    stats = requests.get(f"{base_url.rsplit('/', 1)[0]}/_stats").json()
+    assert stats["GET download 200"] == 1
+    assert stats["GET download 206"] == 1
+    assert not (tmp_path / "clip.mp4.part").exists()
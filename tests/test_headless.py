@@ -0,0 +1,50 @@
+import copy
+
+import pytest
+import streamlit as st
+
+import headless
+
+
+def test_session_state_item_and_attribute_access():
+    state = headless.SessionState(a=1)
+    state.b = 2
+    assert state["b"] == 2
+    assert state.a == 1
+    assert "a" in state and state.get("missing") is None
+    del state.a
+    assert "a" not in state
+    with pytest.raises(AttributeError):
+        state.a
+    assert state.to_dict() == {"b": 2}
+
+
+def test_recorders_have_their_own_session_state():
+    first = headless.ErrorRecorder(st)
+    second = headless.ErrorRecorder(st)
+
+    first.session_state.gemini_model_name = "gemini-3-pro-image-preview"
+
+    assert "gemini_model_name" not in second.session_state
+    assert "gemini_model_name" not in st.session_state
+
+
+def test_reset_restores_the_initial_state():
+    recorder = headless.ErrorRecorder(st)
+    initial = copy.deepcopy(recorder.session_state.to_dict())
+    recorder.session_state.gemini_quality_mode = "pro"
+    recorder.session_state.setdefault("prompt_history", []).append("prompt")
+    recorder.error("boom")
+
+    recorder.reset()
+
+    assert recorder.session_state == initial
+    assert recorder.errors == []
+
+
+def test_errors_and_warnings_are_recorded():
+    recorder = headless.ErrorRecorder(st)
+    recorder.error("❌ no model")
+    recorder.warning("⚡ fallback")
+    assert recorder.errors == ["❌ no model", "⚡ fallback"]
+    assert recorder.markdown is st.markdown
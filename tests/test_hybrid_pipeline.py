@@ -0,0 +1,118 @@
+"""run_hybrid_pipeline with stubbed Flash / step-2 stages (main.py run headless)."""
+import threading
+import time
+from functools import partial
+
+import pytest
+
+import cost_ledger
+import headless
+
+
+@pytest.fixture(scope="module")
+def loaded_app():
+    app = headless.load_app()
+    app["st"] = headless.ErrorRecorder(app["st"])
+    return app, dict(app)
+
+
+@pytest.fixture
+def app(loaded_app, tmp_path, monkeypatch):
+    app, baseline = loaded_app
+    app.clear()
+    app.update(baseline)
+    app["st"].reset()
+    app.update(model_quality="🔀 Hybrid", hybrid_local_text=False, session_budget=0, daily_budget=0)
+    monkeypatch.setattr(cost_ledger, "DB_PATH", tmp_path / "costs.sqlite3")
+    monkeypatch.setattr(cost_ledger, "_local", threading.local())
+    return app
+
+
+def jobs_for(app, prompts):
+    return [(slot, partial(app["smart_generate_image"], prompt, "test-key", cache_slot=slot))
+            for slot, prompt in enumerate(prompts)]
+
+
+def run(app, prompts, flash_workers=2, pro_workers=2):
+    return list(app["run_hybrid_pipeline"](jobs_for(app, prompts), flash_workers, pro_workers))
+
+
+def stub_stages(app, flash=None, second=None):
+    """Flash returns (b"flash:<prompt>", mime, lines); step 2 returns (b"pro:<prompt>", mime)."""
+    def _flash(prompt_text, gemini_api_key, reference_images, aspect_ratio_str, cache_slot):
+        if flash:
+            return flash(prompt_text)
+        return f"flash:{prompt_text}".encode(), "image/png", ['HEADLINE TEXT ON IMAGE: "Hi"']
+
+    def _second(flash_result, gemini_api_key, aspect_ratio_str):
+        if second:
+            second(flash_result)
+        return flash_result[0].replace(b"flash:", b"pro:"), "image/png"
+
+    app["_hybrid_flash_step"] = _flash
+    app["_hybrid_second_step"] = _second
+
+
+def pro_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("hybrid-pro-")]
+
+
+def test_every_flash_image_is_refined_by_step_two(app):
+    stub_stages(app)
+    results = dict(run(app, ["a", "b", "c", "d"]))
+    assert results == {slot: (f"pro:{prompt}".encode(), "image/png") for slot, prompt in enumerate("abcd")}
+
+
+def test_results_are_yielded_as_they_finish(app):
+    def _slow_first(flash_result):
+        if flash_result[0] == b"flash:slow":
+            time.sleep(0.5)
+
+    stub_stages(app, second=_slow_first)
+    order = [slot for slot, _ in run(app, ["slow", "b", "c"], flash_workers=3, pro_workers=3)]
+    assert sorted(order) == [0, 1, 2]
+    assert order[-1] == 0  # the slow Pro step holds back no other slot
+
+
+def test_pro_threads_stop_when_the_run_is_over(app):
+    stub_stages(app)
+    run(app, ["a", "b"], pro_workers=3)
+    deadline = time.monotonic() + 2
+    while pro_threads() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pro_threads() == []
+
+
+def test_failures_release_their_reservations(app):
+    def _flash(prompt_text):
+        if prompt_text == "flash-raises":
+            raise RuntimeError("boom")
+        if prompt_text == "flash-empty":
+            return None
+        return f"flash:{prompt_text}".encode(), "image/png", []
+
+    def _second(flash_result):
+        if flash_result[0] == b"flash:pro-raises":
+            raise RuntimeError("pro down")
+
+    stub_stages(app, flash=_flash, second=_second)
+    results = dict(run(app, ["flash-raises", "flash-empty", "pro-raises", "ok"]))
+
+    assert results[0] == (None, None)
+    assert results[1] == (None, None)
+    assert results[2] == (b"flash:pro-raises", "image/png")  # step 2 failed → the Flash image
+    assert results[3] == (b"pro:ok", "image/png")
+    assert cost_ledger.totals(app["cost_session_id"]()) == (0, 0)
+
+
+def test_over_budget_jobs_are_not_started(app):
+    flash_calls = []
+    # The first image is still in step 2 (its reservation held) when the second one reserves
+    stub_stages(app, flash=lambda prompt: flash_calls.append(prompt) or (b"flash:x", "image/png", []),
+                second=lambda flash_result: time.sleep(0.3))
+    app["session_budget"] = app["image_estimate"]() * 1.5
+
+    results = dict(run(app, ["a", "b"], flash_workers=1))
+
+    assert sorted(results.values(), key=str) == [(None, None), (b"pro:x", "image/png")]
+    assert len(flash_calls) == 1
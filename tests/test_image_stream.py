@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+
+import pytest
+
+import image_stream
+
+
+class StreamedResponse:
+    """Just enough of a requests.Response (stream=True) for the decoder."""
+
+    def __init__(self, body, url="http://test/v1beta/models/gemini-2.5-flash-image:generateContent"):
+        self.body = body
+        self.url = url
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def image_response(*images, text=None):
+    parts = [{"text": text}] if text else []
+    parts += [{"inlineData": {"mimeType": mime, "data": base64.b64encode(raw).decode()}} for raw, mime in images]
+    return {"candidates": [{"content": {"parts": parts}, "finishReason": "STOP"}]}
+
+
+IMAGE = os.urandom(10_000) + b"\xff\xfe\xfd"  # length not a multiple of 3 → padded base64
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 4096, 1 << 20])
+def test_decodes_across_any_chunk_boundary(chunk_size):
+    body = json.dumps(image_response((IMAGE, "image/jpeg"), text="Here you go")).encode()
+    response = StreamedResponse(body)
+
+    img_bytes, mime_type, data = image_stream.decode_image_response(response, chunk_size=chunk_size)
+
+    assert img_bytes == IMAGE
+    assert mime_type == "image/jpeg"
+    assert response.closed
+    part = data["candidates"][0]["content"]["parts"][1]
+    assert part["inlineData"]["data"] == ""
+    assert data["candidates"][0]["finishReason"] == "STOP"
+    assert data["candidates"][0]["content"]["parts"][0]["text"] == "Here you go"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_escaped_slashes_in_base64(chunk_size):
+    raw = bytes(range(256)) * 8  # produces plenty of "/" in base64
+    body = json.dumps(image_response((raw, "image/png"))).replace("/", "\\/").encode()
+    assert b"\\/" in body
+
+    img_bytes, _, _ = image_stream.decode_image_response(StreamedResponse(body), chunk_size=chunk_size)
+
+    assert img_bytes == raw
+
+
+def test_first_image_wins():
+    body = json.dumps(image_response((b"first", "image/png"), (b"second", "image/webp"))).encode()
+
+    img_bytes, mime_type, data = image_stream.decode_image_response(StreamedResponse(body), chunk_size=3)
+
+    assert (img_bytes, mime_type) == (b"first", "image/png")
+    assert len(data["candidates"][0]["content"]["parts"]) == 2
+
+
+def test_data_key_outside_inline_data_is_not_an_image():
+    payload = {"candidates": [{"content": {"parts": [{"functionCall": {"args": {"data": "aGVsbG8="}}}]}}]}
+
+    img_bytes, mime_type, data = image_stream.decode_image_response(
+        StreamedResponse(json.dumps(payload).encode()), chunk_size=4)
+
+    assert (img_bytes, mime_type) == (None, None)
+    assert "candidates" in data
+
+
+def test_blocked_response_without_image():
+    payload = {"candidates": [{"finishReason": "IMAGE_SAFETY"}], "promptFeedback": {"blockReason": "OTHER"}}
+
+    img_bytes, mime_type, data = image_stream.decode_image_response(StreamedResponse(json.dumps(payload).encode()))
+
+    assert (img_bytes, mime_type) == (None, None)
+    assert data == payload
+
+
+def test_inline_json_body_matches_json_dumps():
+    raw = os.urandom(100_001)
+    payload = {"contents": [{"parts": [{"text": "make it pop"},
+                                       {"inlineData": {"mimeType": "image/png",
+                                                       "data": image_stream.InlineJSONBody.PLACEHOLDER}}]}]}
+    body = image_stream.InlineJSONBody(payload, raw, chunk_size=1000)
+
+    sent = b"".join(body)
+
+    expected = json.loads(json.dumps(payload).replace(image_stream.InlineJSONBody.PLACEHOLDER,
+                                                      base64.b64encode(raw).decode()))
+    assert json.loads(sent) == expected
+    assert len(body) == len(sent)
+    assert b"".join(body) == sent  # re-iterable for retries
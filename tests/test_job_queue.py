@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import job_queue
+
+
+@pytest.fixture(autouse=True)
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "DB_PATH", tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(job_queue, "_local", threading.local())
+
+
+def _make_stale(job_id):
+    job_queue._connect().execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_claims_oldest_first_and_only_once():
+    first = job_queue.enqueue("s1", "image", {"prompt": "a"})
+    second = job_queue.enqueue("s1", "video", {"prompt": "b"})
+
+    claimed = job_queue.claim("w1")
+    assert claimed["id"] == first
+    assert claimed["status"] == job_queue.RUNNING
+    assert claimed["params"] == {"prompt": "a"}
+    assert job_queue.claim("w2")["id"] == second
+    assert job_queue.claim("w3") is None
+
+
+def test_parallel_workers_never_claim_the_same_job():
+    job_ids = {job_queue.enqueue("s1", "image", {"n": n}) for n in range(20)}
+    claimed = []
+
+    def _drain(worker_id):
+        while (job := job_queue.claim(worker_id)) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=_drain, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_complete_and_fail():
+    done = job_queue.enqueue("s1", "image", {})
+    failed = job_queue.enqueue("s1", "image", {})
+    job_queue.claim("w1")
+    job_queue.claim("w1")
+    assert job_queue.complete(done, "w1", "/results/x.png", "image/png")
+    assert job_queue.fail(failed, "w1", "no image")
+
+    jobs = {job["id"]: job for job in job_queue.list_jobs("s1")}
+    assert (jobs[done]["status"], jobs[done]["result_path"]) == (job_queue.DONE, "/results/x.png")
+    assert (jobs[failed]["status"], jobs[failed]["error"]) == (job_queue.FAILED, "no image")
+    assert job_queue.list_jobs("other") == []
+
+
+def test_stale_job_is_requeued_and_failed_after_max_attempts():
+    job_id = job_queue.enqueue("s1", "image", {})
+    for attempt in range(1, job_queue.MAX_ATTEMPTS):
+        assert job_queue.claim("w1")["attempts"] == attempt
+        _make_stale(job_id)
+        assert job_queue.requeue_stale() == 1
+        assert job_queue.get(job_id)["status"] == job_queue.QUEUED
+
+    job_queue.claim("w1")
+    _make_stale(job_id)
+    job_queue.requeue_stale()
+    assert job_queue.get(job_id)["status"] == job_queue.FAILED
+
+
+def test_heartbeat_keeps_a_running_job():
+    job_id = job_queue.enqueue("s1", "image", {})
+    job_queue.claim("w1")
+    job_queue.heartbeat(job_id, "w1")
+    assert job_queue.requeue_stale() == 0
+    assert job_queue.get(job_id)["status"] == job_queue.RUNNING
+
+
+def test_delete_finished_removes_results(tmp_path):
+    result = tmp_path / "result.png"
+    result.write_bytes(b"png")
+    done = job_queue.enqueue("s1", "image", {})
+    queued = job_queue.enqueue("s1", "image", {})
+    job_queue.claim("w1")
+    job_queue.complete(done, "w1", str(result), "image/png")
+
+    job_queue.delete_finished("s1")
+
+    assert not result.exists()
+    assert [job["id"] for job in job_queue.list_jobs("s1")] == [queued]
+
+
+def test_worker_that_lost_its_job_cannot_overwrite_it():
+    job_id = job_queue.enqueue("s1", "image", {})
+    job_queue.claim("slow")
+    _make_stale(job_id)
+    job_queue.requeue_stale()
+    job_queue.claim("fresh")
+
+    job_queue.heartbeat(job_id, "slow")
+    _make_stale(job_id)
+    assert job_queue.requeue_stale() == 1  # the lost worker's heartbeat did not keep it alive
+    job_queue.claim("fresh")
+
+    assert not job_queue.complete(job_id, "slow", "/results/old.png", "image/png")
+    assert not job_queue.fail(job_id, "slow", "timeout")
+    assert job_queue.get(job_id)["status"] == job_queue.RUNNING
+
+    assert job_queue.complete(job_id, "fresh", "/results/new.png", "image/png")
+    assert not job_queue.fail(job_id, "fresh", "late")  # finished jobs stay finished
+    assert job_queue.get(job_id)["result_path"] == "/results/new.png"
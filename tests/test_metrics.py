@@ -0,0 +1,82 @@
+import pytest
+
+import metrics
+
+
+def test_counter_by_labels():
+    counter = metrics.Counter("test_requests_total", "Requests.", ("model", "code"))
+    counter.inc(model="pro", code=200)
+    counter.inc(2, model="pro", code=200)
+    counter.inc(model="pro", code=503)
+
+    assert sorted(counter.samples(), key=lambda s: s[0]["code"]) == [
+        ({"model": "pro", "code": "200"}, 3), ({"model": "pro", "code": "503"}, 1)]
+    assert 'test_requests_total{model="pro",code="200"} 3' in counter.expose()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Latency.", ("model",), buckets=(1, 5, 10))
+    for value in (0.5, 3, 3, 7, 60):
+        histogram.observe(value, model="pro")
+
+    lines = histogram.expose()
+    assert 'test_seconds_bucket{model="pro",le="1"} 1' in lines
+    assert 'test_seconds_bucket{model="pro",le="5"} 3' in lines
+    assert 'test_seconds_bucket{model="pro",le="10"} 4' in lines
+    assert 'test_seconds_bucket{model="pro",le="+Inf"} 5' in lines
+    assert 'test_seconds_sum{model="pro"} 73.5' in lines
+    assert 'test_seconds_count{model="pro"} 5' in lines
+
+
+def test_histogram_percentiles_nearest_rank():
+    histogram = metrics.Histogram("test_seconds", "Latency.", ("model",))
+    for value in range(1, 101):
+        histogram.observe(value, model="flash")
+
+    [(labels, count, values)] = histogram.percentiles()
+    assert labels == {"model": "flash"}
+    assert count == 100
+    assert values == {50: 50, 90: 90, 99: 99}
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_total", "Escaping.", ("reason",))
+    counter.inc(reason='say "hi"\n')
+    assert counter.expose() == ['test_total{reason="say \\"hi\\"\\n"} 1']
+
+
+def test_model_from_url():
+    assert metrics.model_from_url(
+        "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent?key=k"
+    ) == "gemini-2.5-flash-image"
+    assert metrics.model_from_url("https://example.com/v1beta/operations/123") == "other"
+    assert metrics.model_from_url(None) == "other"
+
+
+def generations(function_name, outcome):
+    return sum(value for labels, value in metrics.GENERATIONS.samples()
+               if labels == {"function": function_name, "outcome": outcome})
+
+
+def test_instrument_counts_outcomes():
+    @metrics.instrument("test_generate")
+    def generate(result):
+        if result == "raise":
+            raise RuntimeError(result)
+        return result
+
+    assert generate((b"png", "image/png")) == (b"png", "image/png")
+    generate((None, None))
+    with pytest.raises(RuntimeError):
+        generate("raise")
+
+    assert (generations("test_generate", "ok"), generations("test_generate", "failed"),
+            generations("test_generate", "error")) == (1, 1, 1)
+
+
+def test_render_has_help_and_type_for_every_metric():
+    text = metrics.render()
+    for metric in metrics.REGISTRY:
+        assert f"# HELP {metric.name} " in text
+        assert f"# TYPE {metric.name} {metric.kind}" in text
+    assert text.endswith("\n")
@@ -0,0 +1,96 @@
+import io
+from collections import OrderedDict
+
+import pytest
+from PIL import Image
+
+import reference_images
+
+ICC = b"not-a-real-profile" * 8
+
+
+@pytest.fixture(autouse=True)
+def empty_store(monkeypatch):
+    monkeypatch.setattr(reference_images, "_store", OrderedDict())
+    monkeypatch.setattr(reference_images, "_store_bytes", 0)
+
+
+def upload(data, name="photo.png"):
+    buf = io.BytesIO(data)
+    buf.name = name
+    return buf
+
+
+def encoded(image, format="PNG", **save_kwargs):
+    out = io.BytesIO()
+    image.save(out, format, **save_kwargs)
+    return out.getvalue()
+
+
+def test_same_content_is_encoded_once():
+    first = reference_images.encode_reference(upload(b"same bytes", "a.png"))
+    again = reference_images.encode_reference(upload(b"same bytes", "b.png"))
+    assert again is first
+    assert first["mimeType"] == "image/png"
+    assert reference_images.encode_reference(upload(b"other bytes")) is not first
+
+
+def test_least_recently_used_payloads_are_evicted_by_size(monkeypatch):
+    # Each 30-byte upload is 40 base64 characters — room for two
+    monkeypatch.setattr(reference_images, "MAX_STORE_BYTES", 80)
+    a = reference_images.encode_reference(upload(b"a" * 30))
+    reference_images.encode_reference(upload(b"b" * 30))
+    assert reference_images.encode_reference(upload(b"a" * 30)) is a  # a is now most recent
+    reference_images.encode_reference(upload(b"c" * 30))
+
+    kept = {entry["data"] for entry in reference_images._store.values()}
+    assert a["data"] in kept
+    assert len(reference_images._store) == 2
+    assert reference_images._store_bytes == 80
+
+
+def test_preprocess_settings_are_part_of_the_cache_key():
+    data = encoded(Image.new("RGB", (400, 200), (200, 30, 30)))
+    raw = reference_images.encode_reference(upload(data))
+    small = reference_images.encode_reference(upload(data), {"max_edge": 100, "format": "JPEG", "quality": 90})
+    smaller = reference_images.encode_reference(upload(data), {"max_edge": 50, "format": "JPEG", "quality": 90})
+
+    assert raw["mimeType"] == "image/png"
+    assert raw["sent_bytes"] == raw["original_bytes"]
+    assert small["mimeType"] == "image/jpeg"
+    assert len({raw["data"], small["data"], smaller["data"]}) == 3
+    assert reference_images.encode_reference(upload(data), {"quality": 90, "format": "JPEG", "max_edge": 50}) is smaller
+
+
+def test_exif_orientation_is_applied_and_metadata_dropped():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° clockwise for display
+    data = encoded(Image.new("RGB", (300, 100), (10, 120, 10)), "JPEG", exif=exif)
+
+    processed, mime = reference_images.preprocess_image(data)
+    with Image.open(io.BytesIO(processed)) as img:
+        assert img.size == (100, 300)
+        assert not img.getexif()
+    assert mime == "image/jpeg"
+
+
+def test_icc_profile_kept_only_while_the_mode_is_unchanged():
+    big = (2000, 100)
+    rgb = encoded(Image.new("RGB", big, (10, 20, 30)), "JPEG", icc_profile=ICC)
+    cmyk = encoded(Image.new("CMYK", big, (0, 50, 100, 0)), "JPEG", icc_profile=ICC)
+
+    with Image.open(io.BytesIO(reference_images.preprocess_image(rgb)[0])) as img:
+        assert img.info.get("icc_profile") == ICC
+    with Image.open(io.BytesIO(reference_images.preprocess_image(cmyk)[0])) as img:
+        assert img.mode == "RGB"
+        assert "icc_profile" not in img.info
+
+
+def test_small_upright_image_is_sent_as_is():
+    data = encoded(Image.new("RGB", (16, 16), (255, 255, 255)))
+    assert reference_images.preprocess_image(data) is None
+    assert reference_images.preprocess_image(b"not an image") is None
+
+    entry = reference_images.encode_reference(upload(data), dict(reference_images.DEFAULT_PREPROCESS))
+    assert entry["mimeType"] == "image/png"
+    assert entry["sent_bytes"] == entry["original_bytes"] == len(data)
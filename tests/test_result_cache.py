@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import result_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path / "images")
+    return tmp_path / "images"
+
+
+def _age(cache_dir, key, ext, mtime):
+    os.utime(cache_dir / f"{key}.{ext}", (mtime, mtime))
+
+
+def test_key_covers_every_input():
+    base = result_cache.make_key("prompt", "pro", ["a"], aspect_ratio="1:1", image_size="2K", slot=0)
+    assert base == result_cache.make_key("prompt", "pro", ["a"], aspect_ratio="1:1", image_size="2K", slot=0)
+    variants = [
+        result_cache.make_key("prompt!", "pro", ["a"], aspect_ratio="1:1", image_size="2K", slot=0),
+        result_cache.make_key("prompt", "flash", ["a"], aspect_ratio="1:1", image_size="2K", slot=0),
+        result_cache.make_key("prompt", "pro", ["b"], aspect_ratio="1:1", image_size="2K", slot=0),
+        result_cache.make_key("prompt", "pro", ["a"], aspect_ratio="9:16", image_size="2K", slot=0),
+        result_cache.make_key("prompt", "pro", ["a"], aspect_ratio="1:1", image_size=None, slot=0),
+        result_cache.make_key("prompt", "pro", ["a"], aspect_ratio="1:1", image_size="2K", slot=1),
+    ]
+    assert base not in variants
+    assert len(set(variants)) == len(variants)
+
+
+def test_put_get_roundtrip_keeps_mime():
+    result_cache.put("k1", b"jpeg-bytes", "image/jpeg")
+    assert result_cache.get("k1") == (b"jpeg-bytes", "image/jpeg")
+    assert result_cache.get("missing") is None
+    assert result_cache.stats() == (1, len(b"jpeg-bytes"))
+
+
+def test_eviction_drops_least_recently_used_first(cache_dir):
+    for number, key in enumerate(("old", "middle", "new")):
+        result_cache.put(key, b"x" * 100, "image/png")
+        _age(cache_dir, key, "png", 1_000_000 + number)
+
+    result_cache.evict(max_bytes=250)
+
+    assert result_cache.get("old") is None
+    assert result_cache.get("middle") is not None
+    assert result_cache.get("new") is not None
+
+
+def test_hit_refreshes_recency(cache_dir):
+    for number, key in enumerate(("a", "b", "c")):
+        result_cache.put(key, b"x" * 100, "image/png")
+        _age(cache_dir, key, "png", 1_000_000 + number)
+
+    assert result_cache.get("a") is not None  # "a" is now the most recently used
+
+    result_cache.evict(max_bytes=200)
+
+    assert result_cache.get("b") is None
+    assert result_cache.get("a") is not None
+    assert result_cache.get("c") is not None
+
+
+def test_put_evicts_beyond_size_limit(cache_dir, monkeypatch):
+    monkeypatch.setattr(result_cache, "MAX_CACHE_BYTES", 150)
+    result_cache.put("first", b"x" * 100, "image/png")
+    _age(cache_dir, "first", "png", 1_000_000)
+    result_cache.put("second", b"x" * 100, "image/png")
+
+    assert result_cache.get("first") is None
+    assert result_cache.get("second") == (b"x" * 100, "image/png")
+    assert not list(cache_dir.glob(".*.tmp"))
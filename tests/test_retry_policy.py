@@ -0,0 +1,120 @@
+import pytest
+import requests
+
+import retry_policy
+
+FAST = retry_policy.RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01, deadline=60)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry_policy.time, "sleep", slept.append)
+    return slept
+
+
+def response(status, headers=None, body=b"{}"):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = body
+    resp._content_consumed = True
+    resp.url = "http://test/models/m:generateContent"
+    return resp
+
+
+def sender(*outcomes):
+    """send() that returns / raises the given outcomes in order."""
+    outcomes = list(outcomes)
+    calls = []
+
+    def send(read_timeout):
+        calls.append(read_timeout)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    send.calls = calls
+    return send
+
+
+def test_retries_overload_until_success(no_sleep):
+    send = sender(response(503), response(429), response(200))
+    assert retry_policy.run(send, FAST, 30).status_code == 200
+    assert len(send.calls) == 3
+    assert len(no_sleep) == 2
+
+
+def test_retried_responses_are_closed_before_the_next_attempt():
+    closed = []
+    overloaded, ok = response(503), response(200)
+    overloaded.close = lambda: closed.append("503")
+    ok.close = lambda: closed.append("200")
+
+    def send(read_timeout):
+        send.closed_before.append(list(closed))
+        return overloaded if not send.closed_before[1:] else ok
+
+    send.closed_before = []
+    assert retry_policy.run(send, FAST, 30) is ok
+    assert send.closed_before == [[], ["503"]]
+    assert closed == ["503"]  # the caller owns the successful response
+
+
+def test_fatal_status_is_raised_at_once():
+    send = sender(response(400), response(200))
+    with pytest.raises(requests.exceptions.HTTPError):
+        retry_policy.run(send, FAST, 30)
+    assert len(send.calls) == 1
+
+
+def test_last_error_raised_after_max_attempts():
+    send = sender(response(503), response(503), response(503), response(200))
+    with pytest.raises(requests.exceptions.HTTPError) as excinfo:
+        retry_policy.run(send, FAST, 30)
+    assert excinfo.value.response.status_code == 503
+    assert len(send.calls) == 3
+
+
+def test_retry_after_header_overrides_backoff(no_sleep):
+    send = sender(response(429, {"Retry-After": "7"}), response(200))
+    retry_policy.run(send, FAST, 30)
+    assert no_sleep == [7.0]
+
+
+def test_retry_after_from_google_retry_info():
+    body = b'{"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "23s"}]}}'
+    assert retry_policy.parse_retry_after(response(429, body=body)) == 23.0
+    assert retry_policy.parse_retry_after(response(429)) is None
+
+
+def test_read_timeout_retried_only_if_the_policy_allows():
+    no_read_retries = retry_policy.RetryPolicy(max_attempts=3, base_delay=0.01, deadline=60, retry_read_timeouts=False)
+    send = sender(requests.exceptions.ReadTimeout(), response(200))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        retry_policy.run(send, no_read_retries, 30)
+
+    send = sender(requests.exceptions.ReadTimeout(), response(200))
+    assert retry_policy.run(send, FAST, 30).status_code == 200
+
+
+def test_attempts_share_the_deadline_budget():
+    deadline = retry_policy.Deadline(retry_policy.MIN_ATTEMPT_SECONDS - 1)
+    send = sender(response(200))
+    with pytest.raises(requests.exceptions.Timeout):
+        retry_policy.run(send, FAST, 30, deadline=deadline)
+    assert send.calls == []
+
+
+def test_read_timeout_capped_by_remaining_budget():
+    send = sender(response(200))
+    retry_policy.run(send, FAST, 300, deadline=retry_policy.Deadline(20))
+    assert send.calls[0] <= 20
+
+
+def test_no_wait_past_the_budget():
+    send = sender(response(503, {"Retry-After": "120"}), response(200))
+    with pytest.raises(requests.exceptions.HTTPError):
+        retry_policy.run(send, FAST, 30, deadline=retry_policy.Deadline(60))
+    assert len(send.calls) == 1
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+from PIL import Image, ImageChops
+
+import text_overlay
+
+ELEMENTS = {"headline": "Goldene Momente", "subline": "Handgefertigt in Pforzheim",
+            "cta": "Jetzt entdecken →", "offer": "-20%"}
+
+
+def photo(size=(800, 1000), color=(40, 60, 90)):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_elements_from_prompt_lines():
+    lines = [
+        'HEADLINE TEXT ON IMAGE: "Goldene Momente" (spelled: G-O-L-D-E-N-E M-O-M-E-N-T-E)',
+        "SUBLINE TEXT: Handgefertigt in Pforzheim",
+        '  CTA BUTTON/TEXT: "Jetzt entdecken"',
+        "TYPOGRAPHY: bold sans serif",
+    ]
+    assert text_overlay.elements_from_prompt_lines(lines) == {
+        "headline": "Goldene Momente", "subline": "Handgefertigt in Pforzheim", "cta": "Jetzt entdecken", "offer": ""}
+
+
+def test_wrap_respects_width():
+    font = text_overlay.load_font(text_overlay.DEFAULT_FONT_PACK, "body", 20)
+    lines = text_overlay._wrap("eins zwei drei vier fünf sechs sieben acht", font, 120)
+    assert len(lines) > 1
+    assert " ".join(lines) == "eins zwei drei vier fünf sechs sieben acht"
+    assert all(text_overlay._text_width(font, line) <= 120 for line in lines if " " in line)
+
+
+def test_fit_shrinks_until_the_text_fits():
+    font, lines = text_overlay._fit("Ein sehr langer Headline-Text für ein schmales Bild", text_overlay.DEFAULT_FONT_PACK,
+                                    "headline", 120, 300, 2)
+    assert len(lines) <= 2
+    assert font.size < 120
+
+
+def test_contrast_follows_the_background():
+    assert text_overlay._contrast_on((255, 215, 0)) == text_overlay.DARK
+    assert text_overlay._contrast_on((17, 17, 17)) == text_overlay.LIGHT
+    assert text_overlay._region_tone(Image.new("RGB", (50, 50), (250, 250, 250)), (0, 0, 50, 50)) == ("light", False)
+
+
+@pytest.mark.parametrize("layout", list(text_overlay.LAYOUTS))
+@pytest.mark.parametrize("font_pack", list(text_overlay.FONT_PACKS))
+def test_composite_keeps_size_and_draws_text(layout, font_pack):
+    source = photo()
+
+    png, mime = text_overlay.composite(source, ELEMENTS, layout=layout, font_pack=font_pack)
+
+    assert mime == "image/png"
+    result = Image.open(io.BytesIO(png))
+    assert result.size == (800, 1000)
+    assert ImageChops.difference(result.convert("RGB"), Image.open(io.BytesIO(source))).getbbox() is not None
+
+
+def test_composite_without_elements_leaves_the_image_unchanged():
+    source = photo()
+    png, _ = text_overlay.composite(source, dict.fromkeys(ELEMENTS, ""))
+    assert ImageChops.difference(Image.open(io.BytesIO(png)).convert("RGB"),
+                                 Image.open(io.BytesIO(source))).getbbox() is None
+
+
+def test_unknown_layout_or_font_pack():
+    with pytest.raises(ValueError):
+        text_overlay.composite(photo(), ELEMENTS, layout="nope")
+    with pytest.raises(ValueError):
+        text_overlay.composite(photo(), ELEMENTS, font_pack="nope")
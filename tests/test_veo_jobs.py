@@ -0,0 +1,148 @@
+import pytest
+import requests
+
+import veo_jobs
+
+
+class PollResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(veo_jobs, "VIDEO_DIR", tmp_path / "videos")
+    monkeypatch.setattr(veo_jobs, "LATENCY_FILE", tmp_path / "veo_latency.json")
+    monkeypatch.setattr(veo_jobs, "_latency", None)
+    monkeypatch.setattr(veo_jobs.time, "sleep", lambda seconds: None)
+
+
+def poll_with(monkeypatch, *answers):
+    """Run _poll synchronously; each poll returns / raises the next answer."""
+    answers = list(answers)
+
+    def _run(send, policy, read_timeout, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return PollResponse(answer)
+
+    monkeypatch.setattr(veo_jobs.retry_policy, "run", _run)
+    job = veo_jobs.VeoJob("operations/op1", "veo-3.1-generate-preview", "key", duration=8)
+    veo_jobs._poll(job)
+    return job
+
+
+def latency_samples():
+    return veo_jobs._load_latency().get(veo_jobs._latency_key("veo-3.1-generate-preview", 8), [])
+
+
+def test_finished_operation_is_saved(monkeypatch, tmp_path):
+    monkeypatch.setattr(veo_jobs, "save_video", lambda poll_data, dest: dest)
+    job = poll_with(monkeypatch, requests.exceptions.ConnectionError("flaky"), {"done": False}, {"done": True})
+    assert job.status == veo_jobs.DONE
+    assert job.video_path == str(tmp_path / "videos" / f"{job.id}.mp4")
+
+
+def test_operation_error_fails_the_job(monkeypatch):
+    job = poll_with(monkeypatch, {"error": {"message": "quota"}})
+    assert job.status == veo_jobs.FAILED
+    assert "quota" in job.error
+
+
+def test_failed_operation_is_not_taken_for_a_finished_one(monkeypatch):
+    job = poll_with(monkeypatch, {"done": True, "error": {"message": "safety filter"}})
+    assert job.status == veo_jobs.FAILED
+    assert "safety filter" in job.error
+    assert latency_samples() == []
+
+
+def test_only_saved_videos_feed_the_latency_history(monkeypatch):
+    monkeypatch.setattr(veo_jobs, "save_video", lambda poll_data, dest: None)
+    job = poll_with(monkeypatch, {"done": True, "response": {"oddShape": {}}})
+    assert job.status == veo_jobs.FAILED
+    assert latency_samples() == []
+
+    monkeypatch.setattr(veo_jobs, "save_video", lambda poll_data, dest: dest)
+    poll_with(monkeypatch, {"done": True})
+    assert len(latency_samples()) == 1
+
+
+def test_message_past_p90_says_it_takes_longer(monkeypatch):
+    monkeypatch.setattr(veo_jobs, "save_video", lambda poll_data, dest: dest)
+    job = veo_jobs.VeoJob("operations/op1", "veo-2.0", "key")
+    monkeypatch.setattr(veo_jobs.time, "time", lambda: job.started_at + 300)  # p90 is 150
+    messages = []
+
+    def _run(send, policy, read_timeout, **kwargs):
+        messages.append(job.message)
+        return PollResponse({"done": True})
+
+    monkeypatch.setattr(veo_jobs.retry_policy, "run", _run)
+    veo_jobs._poll(job)
+    assert messages == ["⏳ Video wird generiert... (300s, dauert länger als üblich)"]
+
+
+def test_unexpected_exception_fails_the_job_instead_of_hanging(monkeypatch):
+    def _disk_full(poll_data, dest):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(veo_jobs, "save_video", _disk_full)
+    job = poll_with(monkeypatch, {"done": True})
+    assert job.status == veo_jobs.FAILED
+    assert "No space left" in job.error
+    assert job.finished_at is not None
+
+
+def test_poll_delay_sparse_dense_then_backing_off():
+    percentiles = (40.0, 75.0, 150.0)
+    assert veo_jobs.next_poll_delay(0, percentiles) == veo_jobs.MAX_POLL_INTERVAL
+    assert veo_jobs.next_poll_delay(30, percentiles) == 10
+    assert veo_jobs.next_poll_delay(39, percentiles) == veo_jobs.MIN_POLL_INTERVAL
+    assert veo_jobs.next_poll_delay(100, percentiles) == veo_jobs.MIN_POLL_INTERVAL
+    assert veo_jobs.next_poll_delay(200, percentiles) == veo_jobs.MIN_POLL_INTERVAL + 5
+    assert veo_jobs.next_poll_delay(10_000, percentiles) == veo_jobs.TAIL_POLL_INTERVAL
+
+
+def test_percentiles_use_prior_until_enough_samples():
+    model = "veo-3.1-generate-preview"
+    assert veo_jobs.latency_percentiles(model, 8) == veo_jobs.DEFAULT_PERCENTILES
+    for seconds in range(50, 150, 10):
+        veo_jobs.record_latency(model, 8, seconds)
+
+    assert veo_jobs.latency_percentiles(model, 8) == (50, 90, 130)
+    assert veo_jobs.latency_percentiles(model, 4) == veo_jobs.DEFAULT_PERCENTILES
+    assert veo_jobs.LATENCY_FILE.exists()
+
+
+def test_percentiles_stay_strictly_increasing():
+    for _ in range(veo_jobs.MIN_SAMPLES):
+        veo_jobs.record_latency("veo-2.0", None, 60)
+    p10, p50, p90 = veo_jobs.latency_percentiles("veo-2.0", None)
+    assert p10 < p50 < p90
+
+
+def test_only_recent_samples_are_kept(monkeypatch):
+    monkeypatch.setattr(veo_jobs, "LATENCY_SAMPLES", 5)
+    for seconds in range(10):
+        veo_jobs.record_latency("veo-2.0", 8, seconds)
+    assert veo_jobs._latency[veo_jobs._latency_key("veo-2.0", 8)] == [5, 6, 7, 8, 9]
+
+
+@pytest.mark.parametrize("elapsed, expected", [(0, 0.0), (40, 0.10), (75, 0.50), (150, 0.90)])
+def test_progress_follows_the_percentile_curve(monkeypatch, elapsed, expected):
+    job = veo_jobs.VeoJob("operations/op1", "veo-2.0", "key")
+    monkeypatch.setattr(veo_jobs.time, "time", lambda: job.started_at + elapsed)
+    assert job.estimate_progress() == pytest.approx(expected)
+
+
+def test_progress_and_eta_in_the_tail(monkeypatch):
+    job = veo_jobs.VeoJob("operations/op1", "veo-2.0", "key")
+    monkeypatch.setattr(veo_jobs.time, "time", lambda: job.started_at + 100)
+    assert job.eta == 50  # past p50 → counting down to p90
+    monkeypatch.setattr(veo_jobs.time, "time", lambda: job.started_at + 10_000)
+    assert job.eta == 0
+    assert job.estimate_progress() == 0.95
@@ -0,0 +1,286 @@
+"""Local typography for ad creatives — headline, subline, CTA button and offer badge set with Pillow.
+
+The alternative to Hybrid step 2's Pro text pass: the same text elements the
+Hybrid split pulls out of the prompt are composited onto the Flash image. The
+spelling is exact and it takes milliseconds instead of a Pro call (no visual
+refinement, though).
+
+    LAYOUTS      where the headline block, the CTA button and the offer badge go
+    FONT_PACKS   headline / body font candidates per style — the first file found
+                 wins; put .ttf / .otf files into fonts/ to use brand fonts
+    contrast     text color and backing scrim are picked from the pixels under
+                 each element (luminance and how busy they are)
+"""
+import io
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageStat
+
+FONT_DIR = Path(__file__).resolve().parent / "fonts"
+SYSTEM_FONT_DIRS = (
+    "/usr/share/fonts", "/usr/local/share/fonts", str(Path.home() / ".fonts"),
+    "/Library/Fonts", "/System/Library/Fonts", "C:/Windows/Fonts",
+)
+
+# text: headline + subline block ("top", "center", "bottom" or None); cta: "bottom" or None;
+# badge: corner of the offer badge
+LAYOUTS = {
+    "Headline oben · CTA unten · Badge rechts oben": {"text": "top", "cta": "bottom", "badge": "top-right"},
+    "Headline unten · CTA unten · Badge links oben": {"text": "bottom", "cta": "bottom", "badge": "top-left"},
+    "Headline mittig · CTA unten · Badge rechts oben": {"text": "center", "cta": "bottom", "badge": "top-right"},
+    "Minimal (nur CTA + Badge)": {"text": None, "cta": "bottom", "badge": "top-right"},
+}
+DEFAULT_LAYOUT = next(iter(LAYOUTS))
+
+FONT_PACKS = {
+    "Modern Sans": {
+        "headline": ("Montserrat-Bold.ttf", "Inter-Bold.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf",
+                     "Arial Bold.ttf", "arialbd.ttf", "HelveticaNeue.ttc"),
+        "body": ("Montserrat-Regular.ttf", "Inter-Regular.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf",
+                 "Arial.ttf", "arial.ttf", "HelveticaNeue.ttc"),
+    },
+    "Elegant Serif": {
+        "headline": ("PlayfairDisplay-Bold.ttf", "DejaVuSerif-Bold.ttf", "LiberationSerif-Bold.ttf",
+                     "Georgia Bold.ttf", "georgiab.ttf", "Times New Roman Bold.ttf", "timesbd.ttf"),
+        "body": ("PlayfairDisplay-Regular.ttf", "DejaVuSerif.ttf", "LiberationSerif-Regular.ttf",
+                 "Georgia.ttf", "georgia.ttf", "Times New Roman.ttf", "times.ttf"),
+    },
+    "Condensed Bold": {
+        "headline": ("Oswald-Bold.ttf", "BebasNeue-Regular.ttf", "DejaVuSansCondensed-Bold.ttf",
+                     "LiberationSansNarrow-Bold.ttf", "Arial Narrow Bold.ttf", "ARIALNB.TTF"),
+        "body": ("Oswald-Regular.ttf", "DejaVuSansCondensed.ttf", "LiberationSansNarrow-Regular.ttf",
+                 "Arial Narrow.ttf", "ARIALN.TTF"),
+    },
+}
+DEFAULT_FONT_PACK = next(iter(FONT_PACKS))
+
+# Prompt lines of the Hybrid split (see build_ad_creative_prompt) → element
+PROMPT_PREFIXES = {
+    "HEADLINE TEXT ON IMAGE:": "headline",
+    "SUBLINE TEXT:": "subline",
+    "CTA BUTTON/TEXT:": "cta",
+    "OFFER BADGE:": "offer",
+}
+_QUOTED = re.compile(r'"(.*)"\s*(?:\(spelled:.*)?$')
+
+DARK = (17, 17, 17)
+LIGHT = (255, 255, 255)
+CTA_COLORS = {"dark": (255, 215, 0), "light": (17, 17, 17)}  # button fill on dark / light backgrounds
+BADGE_COLOR = (214, 40, 57)
+BUSY_STDDEV = 45     # luminance spread above which text gets a backing scrim
+MARGIN = 0.05        # of the shorter image edge
+
+
+def elements_from_prompt_lines(lines):
+    """{"headline", "subline", "cta", "offer": text} from the text lines split off a Hybrid prompt."""
+    elements = dict.fromkeys(PROMPT_PREFIXES.values(), "")
+    for line in lines:
+        stripped = line.strip()
+        for prefix, name in PROMPT_PREFIXES.items():
+            if stripped.upper().startswith(prefix):
+                match = _QUOTED.search(stripped[len(prefix):])
+                elements[name] = match.group(1).strip() if match else stripped[len(prefix):].strip()
+    return elements
+
+
+@lru_cache(maxsize=1)
+def _font_index():
+    """{lower-case file name: path} of every font in fonts/ and the usual system dirs (fonts/ wins)."""
+    index = {}
+    for base in (*reversed(SYSTEM_FONT_DIRS), str(FONT_DIR)):
+        for root, _, files in os.walk(base):
+            for name in files:
+                if name.lower().endswith((".ttf", ".otf", ".ttc")):
+                    index[name.lower()] = os.path.join(root, name)
+    return index
+
+
+@lru_cache(maxsize=64)
+def load_font(font_pack, role, size):
+    """The first available font of the pack for role ("headline" / "body").
+
+    Falls back to the default pack, then to Pillow's built-in font (which lacks glyphs like "→").
+    """
+    candidates = FONT_PACKS.get(font_pack, FONT_PACKS[DEFAULT_FONT_PACK])[role] + FONT_PACKS[DEFAULT_FONT_PACK][role]
+    for name in candidates:
+        path = _font_index().get(name.lower())
+        if path:
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                continue
+    return ImageFont.load_default(size)
+
+
+def available_fonts(font_pack):
+    """{role: font file name or None (built-in fallback)} — for the UI."""
+    return {role: next((name for name in names + FONT_PACKS[DEFAULT_FONT_PACK][role]
+                        if name.lower() in _font_index()), None)
+            for role, names in FONT_PACKS[font_pack].items()}
+
+
+def _text_width(font, text):
+    left, _, right, _ = font.getbbox(text)
+    return right - left
+
+
+def _wrap(text, font, max_width):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}".strip()
+            if line and _text_width(font, candidate) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _fit(text, font_pack, role, size, max_width, max_lines):
+    """Largest font ≤ size whose wrapped text fits max_width in at most max_lines lines."""
+    while True:
+        font = load_font(font_pack, role, size)
+        lines = _wrap(text, font, max_width)
+        if size <= 12 or (len(lines) <= max_lines and all(_text_width(font, l) <= max_width for l in lines)):
+            return font, lines
+        size = int(size * 0.9)
+
+
+def _line_height(font):
+    ascent, descent = font.getmetrics()
+    return ascent + descent
+
+
+def _region_tone(image, box):
+    """("dark" | "light", busy) for the pixels under box."""
+    crop = image.crop(tuple(int(v) for v in box)).convert("L")
+    stat = ImageStat.Stat(crop)
+    return ("light" if stat.mean[0] > 140 else "dark"), stat.stddev[0] > BUSY_STDDEV
+
+
+def _contrast_on(fill):
+    luminance = 0.299 * fill[0] + 0.587 * fill[1] + 0.114 * fill[2]
+    return DARK if luminance > 140 else LIGHT
+
+
+def _draw_text_block(image, blocks, placement, top_limit, bottom_limit, font_pack, margin):
+    """Headline + subline, centered between top_limit and bottom_limit at placement ("top" / "center" / "bottom").
+
+    Text color follows the background; a soft scrim goes behind it where the background is busy.
+    """
+    width = image.width
+    max_width = width - 2 * margin
+    laid_out = []
+    for text, role, size, max_lines in blocks:
+        if text:
+            font, lines = _fit(text, font_pack, role, size, max_width, max_lines)
+            laid_out.append((font, lines))
+    if not laid_out:
+        return
+    gap = int(min(image.size) * 0.015)
+    heights = [len(lines) * _line_height(font) for font, lines in laid_out]
+    total = sum(heights) + gap * (len(laid_out) - 1)
+    if placement == "top":
+        top = top_limit
+    elif placement == "bottom":
+        top = bottom_limit - total
+    else:
+        top = (image.height - total) / 2
+    top = max(top_limit, min(top, bottom_limit - total))
+    box = (margin, top, width - margin, top + total)
+
+    tone, busy = _region_tone(image, box)
+    color = DARK if tone == "light" else LIGHT
+    if busy:
+        # Blurred band behind the text in the opposite tone
+        pad = gap * 2
+        scrim = Image.new("L", image.size, 0)
+        ImageDraw.Draw(scrim).rounded_rectangle((box[0] - pad, box[1] - pad, box[2] + pad, box[3] + pad),
+                                                radius=pad * 2, fill=170)
+        scrim = scrim.filter(ImageFilter.GaussianBlur(pad))
+        image.paste(Image.new("RGB", image.size, LIGHT if color == DARK else DARK), (0, 0), scrim)
+
+    draw = ImageDraw.Draw(image)
+    y = top
+    for font, lines in laid_out:
+        for line in lines:
+            draw.text(((width - _text_width(font, line)) / 2, y), line, font=font, fill=color)
+            y += _line_height(font)
+        y += gap
+
+
+def _draw_cta(image, text, font_pack, margin):
+    """Rounded button centered at the bottom; returns its top edge."""
+    short = min(image.size)
+    font, lines = _fit(text, font_pack, "headline", int(short * 0.042), image.width * 0.7, 1)
+    label = lines[0] if lines else text
+    pad_x, pad_y = int(short * 0.04), int(short * 0.022)
+    button_w = _text_width(font, label) + 2 * pad_x
+    button_h = _line_height(font) + 2 * pad_y
+    left = (image.width - button_w) / 2
+    top = image.height - margin - button_h
+    tone, _ = _region_tone(image, (left, top, left + button_w, top + button_h))
+    fill = CTA_COLORS[tone]
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((left, top, left + button_w, top + button_h), radius=button_h // 2, fill=fill)
+    draw.text((left + pad_x, top + pad_y), label, font=font, fill=_contrast_on(fill))
+    return top
+
+
+def _draw_badge(image, text, corner, font_pack, margin):
+    """Offer badge — a rounded label in a corner; returns its box."""
+    short = min(image.size)
+    font, lines = _fit(text, font_pack, "headline", int(short * 0.034), image.width * 0.32, 3)
+    pad = int(short * 0.02)
+    block_w = max(_text_width(font, line) for line in lines) + 2 * pad
+    block_h = len(lines) * _line_height(font) + 2 * pad
+    left = margin if corner.endswith("left") else image.width - margin - block_w
+    top = margin if corner.startswith("top") else image.height - margin - block_h
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((left, top, left + block_w, top + block_h), radius=pad, fill=BADGE_COLOR)
+    y = top + pad
+    for line in lines:
+        draw.text((left + (block_w - _text_width(font, line)) / 2, y), line, font=font, fill=LIGHT)
+        y += _line_height(font)
+    return left, top, left + block_w, top + block_h
+
+
+def composite(image_bytes, elements, layout=DEFAULT_LAYOUT, font_pack=DEFAULT_FONT_PACK):
+    """Set the text elements onto the image; returns (PNG bytes, "image/png").
+
+    elements: {"headline", "subline", "cta", "offer": text}; empty ones are skipped.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r} — available: {', '.join(LAYOUTS)}")
+    if font_pack not in FONT_PACKS:
+        raise ValueError(f"Unknown font pack {font_pack!r} — available: {', '.join(FONT_PACKS)}")
+    spec = LAYOUTS[layout]
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    short = min(image.size)
+    margin = int(short * MARGIN)
+
+    # Badge and CTA first — the headline block is fitted into the space they leave
+    top_limit, bottom_limit = margin, image.height - margin
+    if elements.get("offer") and spec["badge"]:
+        badge = _draw_badge(image, elements["offer"], spec["badge"], font_pack, margin)
+        if spec["badge"].startswith("top") and spec["text"] == "top":
+            top_limit = badge[3] + margin // 2
+    if elements.get("cta") and spec["cta"]:
+        bottom_limit = _draw_cta(image, elements["cta"], font_pack, margin) - margin // 2
+
+    if spec["text"]:
+        blocks = [
+            (elements.get("headline"), "headline", int(short * 0.085), 3),
+            (elements.get("subline"), "body", int(short * 0.042), 2),
+        ]
+        _draw_text_block(image, blocks, spec["text"], top_limit, bottom_limit, font_pack, margin)
+
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=False)
+    return out.getvalue(), "image/png"
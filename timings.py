@@ -0,0 +1,147 @@
+"""Per-phase latency spans for one generation — where did the 4 minutes go?
+
+A Trace collects spans (model discovery, reference encoding, upload, server
+wait, download + decode, retry backoff, hybrid steps …). The generation code
+does not pass it around: recording(trace) binds it to the current thread and
+span() / add() write into whatever trace is bound (nothing, if none is). Helper
+threads (e.g. the hedged Pro request) join a trace with bind().
+
+Finished traces are appended to LOG_PATH, one JSON object per generation.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+CACHE_ROOT = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+LOG_PATH = CACHE_ROOT / "timings.jsonl"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # then rotated to timings.jsonl.1
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """Spans of one generation. Thread-safe; nesting depth is tracked per thread."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.total = None
+        self.meta = {}
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._depth = threading.local()
+
+    def add(self, phase, seconds, start=None, **meta):
+        offset = (start if start is not None else time.perf_counter() - seconds) - self._origin
+        span = {"phase": phase, "start": round(offset, 3), "seconds": round(seconds, 3),
+                "depth": getattr(self._depth, "value", 0), **meta}
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, phase, **meta):
+        depth = getattr(self._depth, "value", 0)
+        self._depth.value = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth.value = depth
+            self.add(phase, time.perf_counter() - start, start=start, **meta)
+
+    def as_dict(self):
+        return {
+            "time": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "total": round(self.total if self.total is not None else time.perf_counter() - self._origin, 3),
+            **self.meta,
+            "spans": sorted(self.spans, key=lambda s: (s["start"], s["depth"])),
+        }
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+def bind(trace):
+    """Make trace the current one for this thread (None unbinds)."""
+    _local.trace = trace
+
+
+@contextmanager
+def span(phase, **meta):
+    """Time a block into the current trace; a no-op without one."""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    with trace.span(phase, **meta):
+        yield
+
+
+def add(phase, seconds, start=None, **meta):
+    trace = current()
+    if trace is not None:
+        trace.add(phase, seconds, start=start, **meta)
+
+
+@contextmanager
+def recording(trace, **meta):
+    """Bind trace for the duration of one generation, then log it."""
+    previous = current()
+    trace.meta.update(meta)
+    bind(trace)
+    try:
+        yield trace
+    finally:
+        bind(previous)
+        finish(trace)
+
+
+def finish(trace):
+    """Close a trace and log it — for generations that run on more than one thread."""
+    trace.total = time.perf_counter() - trace._origin
+    write_log(trace)
+
+
+def write_log(trace):
+    line = json.dumps(trace.as_dict(), ensure_ascii=False) + "\n"
+    with _log_lock:
+        try:
+            LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            if LOG_PATH.exists() and LOG_PATH.stat().st_size > LOG_MAX_BYTES:
+                os.replace(LOG_PATH, LOG_PATH.with_name(LOG_PATH.name + ".1"))
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass  # timings are diagnostics — never fail a generation over them
+
+
+class UploadTimer:
+    """Request body wrapper that notes when its last byte was handed to the socket.
+
+    requests streams an iterable, sized body chunk by chunk with a
+    Content-Length, so the end of iteration is the end of the upload.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, body):
+        self.body = body
+        self.sent_at = None
+
+    def __len__(self):
+        return len(self.body)
+
+    def __iter__(self):
+        if isinstance(self.body, (bytes, bytearray)):
+            view = memoryview(self.body)
+            for offset in range(0, len(view), self.CHUNK):
+                yield view[offset:offset + self.CHUNK]
+        else:
+            yield from self.body
+        self.sent_at = time.perf_counter()
@@ -0,0 +1,399 @@
+"""Background polling for Veo long-running operations.
+
+generate_video_veo only submits; the operation is then tracked here by a
+daemon thread, so the Streamlit script thread is free again right away.
+Jobs live in a process-wide registry keyed by job id — a session keeps the
+ids in st.session_state and picks up status / the finished video on rerun.
+Nothing in here touches st.*: the session that started a job may be gone.
+
+Polling follows the completion times recorded per (model, duration): sparse
+before the fastest runs usually finish, dense around the typical completion,
+backing off again for the long tail. The same percentiles drive the ETA.
+
+Which Veo model accepted a key's requests — and with which parameters — is
+remembered on disk per key fingerprint, so submissions skip the 404/503 probe
+round-trips until the record expires (MODEL_RECORD_TTL).
+
+Finished videos are streamed straight to a file under VIDEO_DIR (resuming
+with a Range request if the connection drops) — sessions keep the path, not
+the MP4 bytes.
+"""
+import base64
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+import gemini_client
+import metrics
+import retry_policy
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MAX_WAIT = 600  # 10 minutes
+
+# Polling schedule bounds (seconds)
+MIN_POLL_INTERVAL = 3      # near the expected completion
+MAX_POLL_INTERVAL = 30     # while nothing can be done yet
+TAIL_POLL_INTERVAL = 20    # cap once past the 90th percentile
+
+CACHE_ROOT = Path(os.environ.get("NANO_BANANA_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+
+# Completion-time history: persisted so estimates survive restarts
+LATENCY_FILE = CACHE_ROOT / "veo_latency.json"
+LATENCY_SAMPLES = 50       # most recent completions kept per model + duration
+MIN_SAMPLES = 3            # below this the prior is used
+# Prior until enough runs are recorded: (p10, p50, p90) in seconds
+DEFAULT_PERCENTILES = (40.0, 75.0, 150.0)
+
+# Known-good Veo model per API key (fingerprint) — re-probed after the TTL
+MODEL_RECORD_FILE = CACHE_ROOT / "veo_models.json"
+MODEL_RECORD_TTL = 6 * 60 * 60
+
+# Finished jobs nobody collected are dropped after this long
+FINISHED_JOB_TTL = 60 * 60
+
+# Downloaded videos — deleted after VIDEO_TTL
+VIDEO_DIR = CACHE_ROOT / "videos"
+VIDEO_TTL = 24 * 60 * 60
+DOWNLOAD_CHUNK = 1024 * 1024
+DOWNLOAD_RESUMES = 5
+
+
+class VeoJob:
+    """Handle for one Veo operation. Fields are written by the poller thread only."""
+
+    def __init__(self, operation_name, model, api_key, duration=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.operation_name = operation_name
+        self.model = model
+        self.api_key = api_key
+        self.duration = duration
+        self.percentiles = latency_percentiles(model, duration)
+        self.status = RUNNING
+        self.message = "⏳ Video wird generiert..."
+        self.progress = 0.0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.video_path = None
+        self.error = None
+        self.raw_response = None  # kept when the finished response has an unknown shape
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def eta(self):
+        """Seconds until the typical (p50) — or, once past it, the p90 — completion."""
+        _, p50, p90 = self.percentiles
+        target = p50 if self.elapsed < p50 else p90
+        return max(0.0, target - self.elapsed)
+
+    def estimate_progress(self):
+        """Share of recorded runs that were finished by now, squeezed below 1.0 while running."""
+        p10, p50, p90 = self.percentiles
+        t = self.elapsed
+        # Piecewise-linear CDF through the percentiles: 0→p10→p50→p90 = 0→10→50→90 %
+        if t <= p10:
+            share = 0.10 * t / p10
+        elif t <= p50:
+            share = 0.10 + 0.40 * (t - p10) / (p50 - p10)
+        elif t <= p90:
+            share = 0.50 + 0.40 * (t - p50) / (p90 - p50)
+        else:
+            share = 0.90 + 0.05 * min(1.0, (t - p90) / max(1.0, MAX_WAIT - p90))
+        return min(share, 0.95)
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.progress = 1.0
+        metrics.VEO_JOBS.inc(model=self.model, status=status)
+        metrics.VEO_SECONDS.observe(self.finished_at - self.started_at, model=self.model)
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+_latency = None  # "model|duration" -> [seconds, ...], loaded lazily
+_latency_lock = threading.Lock()
+
+
+_model_records = None  # key fingerprint -> {"model", "params", "checked_at"}, loaded lazily
+_model_records_lock = threading.Lock()
+
+
+def _write_json(path, data):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _load_model_records():
+    global _model_records
+    if _model_records is None:
+        try:
+            _model_records = json.loads(MODEL_RECORD_FILE.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _model_records = {}
+    return _model_records
+
+
+def known_model(api_key):
+    """{"model", "params"} that last worked for this key, or None if unknown / expired."""
+    with _model_records_lock:
+        record = _load_model_records().get(gemini_client.key_fingerprint(api_key))
+    if not record or time.time() - record.get("checked_at", 0) > MODEL_RECORD_TTL:
+        return None
+    return record
+
+
+def remember_model(api_key, model, params):
+    """Record the Veo model + parameters that accepted a submission for this key."""
+    with _model_records_lock:
+        records = _load_model_records()
+        records[gemini_client.key_fingerprint(api_key)] = {
+            "model": model,
+            "params": params,
+            "checked_at": time.time(),
+        }
+        _write_json(MODEL_RECORD_FILE, records)
+
+
+def forget_model(api_key):
+    with _model_records_lock:
+        if _load_model_records().pop(gemini_client.key_fingerprint(api_key), None) is not None:
+            _write_json(MODEL_RECORD_FILE, _model_records)
+
+
+def _latency_key(model, duration):
+    return f"{model}|{duration or '-'}"
+
+
+def _load_latency():
+    global _latency
+    if _latency is None:
+        try:
+            _latency = json.loads(LATENCY_FILE.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _latency = {}
+    return _latency
+
+
+def record_latency(model, duration, seconds):
+    """Remember how long a finished job took (atomic write, last LATENCY_SAMPLES kept)."""
+    with _latency_lock:
+        samples = _load_latency().setdefault(_latency_key(model, duration), [])
+        samples.append(round(seconds, 1))
+        del samples[:-LATENCY_SAMPLES]
+        _write_json(LATENCY_FILE, _latency)
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def latency_percentiles(model, duration):
+    """(p10, p50, p90) completion time in seconds for this model + duration."""
+    with _latency_lock:
+        samples = sorted(_load_latency().get(_latency_key(model, duration), []))
+    if len(samples) < MIN_SAMPLES:
+        return DEFAULT_PERCENTILES
+    p10, p50, p90 = (_percentile(samples, pct) for pct in (10, 50, 90))
+    # Keep the curve strictly increasing so the schedule / progress math stays sane
+    p50 = max(p50, p10 + 1)
+    p90 = max(p90, p50 + 1)
+    return p10, p50, p90
+
+
+def next_poll_delay(elapsed, percentiles):
+    """Sparse before p10, dense between p10 and p90, slowly backing off in the tail."""
+    p10, _, p90 = percentiles
+    if elapsed < p10:
+        delay = p10 - elapsed
+    elif elapsed < p90:
+        delay = MIN_POLL_INTERVAL
+    else:
+        delay = MIN_POLL_INTERVAL + (elapsed - p90) / 10
+        delay = min(delay, TAIL_POLL_INTERVAL)
+    return max(MIN_POLL_INTERVAL, min(delay, MAX_POLL_INTERVAL))
+
+
+def start(operation_name, model, api_key, duration=None):
+    """Register a submitted operation and start its background poller."""
+    job = VeoJob(operation_name, model, api_key, duration)
+    with _jobs_lock:
+        _prune()
+        _jobs[job.id] = job
+    threading.Thread(target=_poll, args=(job,), name=f"veo-poll-{job.id}", daemon=True).start()
+    return job
+
+
+def get(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def discard(job_id):
+    """Forget a job once its session has collected the result."""
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def _prune():
+    now = time.time()
+    for job_id in [j.id for j in _jobs.values() if j.finished_at and now - j.finished_at > FINISHED_JOB_TTL]:
+        del _jobs[job_id]
+    for path in VIDEO_DIR.glob("*.mp4*"):
+        try:
+            if now - path.stat().st_mtime > VIDEO_TTL:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def download_to_file(url, dest, headers=None):
+    """Stream url into dest chunk by chunk; after a dropped connection, resume with a Range request."""
+    part = dest.with_name(dest.name + ".part")
+    written = 0
+    resumes = 0
+    with open(part, "wb") as fh:
+        while True:
+            request_headers = dict(headers or {})
+            if written:
+                request_headers["Range"] = f"bytes={written}-"
+            try:
+                resp = retry_policy.run(
+                    lambda t: gemini_client.http_get(url, headers=request_headers, read_timeout=t, stream=True),
+                    retry_policy.VEO_SUBMIT_POLICY, 120,
+                )
+                with resp:
+                    if written and resp.status_code != 206:
+                        # Server ignored the range — start over
+                        fh.seek(0)
+                        fh.truncate()
+                        written = 0
+                    for chunk in resp.iter_content(DOWNLOAD_CHUNK):
+                        fh.write(chunk)
+                        written += len(chunk)
+                        metrics.BYTES_RECEIVED.inc(len(chunk), model=metrics.model_from_url(url))
+                break
+            except requests.exceptions.RequestException as e:
+                resumes += 1
+                fatal = isinstance(e, requests.exceptions.HTTPError) and not retry_policy.is_retryable(e)
+                if fatal or resumes > DOWNLOAD_RESUMES:
+                    fh.close()
+                    part.unlink(missing_ok=True)
+                    raise
+                time.sleep(retry_policy.VEO_SUBMIT_POLICY.backoff(resumes))
+    os.replace(part, dest)
+    return dest
+
+
+def save_video(poll_data, dest):
+    """Write the video of a finished operation to dest; None if the response shape is unknown."""
+    response_obj = poll_data.get("response", {})
+
+    # Try multiple known response structures
+    video_samples = None
+
+    # Structure 1: response.generateVideoResponse.generatedSamples
+    gvr = response_obj.get("generateVideoResponse", {})
+    if gvr:
+        video_samples = gvr.get("generatedSamples", [])
+
+    # Structure 2: response.generatedSamples
+    if not video_samples:
+        video_samples = response_obj.get("generatedSamples", [])
+
+    # Structure 3: response.videos (Vertex style)
+    if not video_samples:
+        video_samples = response_obj.get("videos", [])
+
+    if not video_samples:
+        return None
+    sample = video_samples[0]
+    video_obj = sample.get("video", sample)
+
+    # Base64 encoded
+    if "bytesBase64Encoded" in video_obj:
+        dest.write_bytes(base64.b64decode(video_obj["bytesBase64Encoded"]))
+        return dest
+
+    # URI to download
+    uri = video_obj.get("uri") or video_obj.get("gcsUri")
+    if uri:
+        return download_to_file(uri, dest)
+    return None
+
+
+def _poll(job):
+    try:
+        _poll_until_done(job)
+    except Exception as e:
+        # Disk full, unexpected payload, ... — fail the job instead of leaving it RUNNING forever
+        job._finish(FAILED, f"Video konnte nicht verarbeitet werden: {e}")
+
+
+def _poll_until_done(job):
+    # Poll for completion — use x-goog-api-key header
+    poll_headers = {"x-goog-api-key": job.api_key}
+    poll_url = f"{gemini_client.GEMINI_BASE_URL}/{job.operation_name}"
+
+    while job.elapsed < MAX_WAIT:
+        time.sleep(next_poll_delay(job.elapsed, job.percentiles))
+        job.progress = job.estimate_progress()
+        # Past p90 there is no estimate left — don't promise "almost done" for minutes
+        eta = f"noch ca. {job.eta:.0f}s" if job.eta else "dauert länger als üblich"
+        job.message = f"⏳ Video wird generiert... ({job.elapsed:.0f}s, {eta})"
+
+        try:
+            poll_resp = retry_policy.run(
+                lambda t: gemini_client.http_get(poll_url, headers=poll_headers, read_timeout=t),
+                retry_policy.VEO_POLL_POLICY, 30,
+            )
+            poll_data = poll_resp.json()
+
+            # Check for error in response (a failed operation is "done" too)
+            if "error" in poll_data:
+                err = poll_data["error"]
+                job._finish(FAILED, f"Veo Fehler: {err.get('message', str(err))}")
+                return
+
+            if poll_data.get("done", False):
+                # Pickup time is at most one (dense) poll interval after the real completion
+                finished_after = job.elapsed
+                job.message = "📥 Video fertig — wird geladen..."
+                VIDEO_DIR.mkdir(parents=True, exist_ok=True)
+                video_path = save_video(poll_data, VIDEO_DIR / f"{job.id}.mp4")
+                if video_path:
+                    # Only real renders feed the poll schedule — failures finish at odd times
+                    record_latency(job.model, job.duration, finished_after)
+                    job.video_path = str(video_path)
+                    job.message = "✅ Video fertig!"
+                    job._finish(DONE)
+                else:
+                    job.raw_response = poll_data
+                    keys = list(poll_data.get("response", {}).keys())
+                    job._finish(FAILED, f"Video fertig, aber unbekanntes Format. Response-Keys: {keys}")
+                return
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            job.message = f"Poll-Fehler ({job.elapsed:.0f}s): {e} — versuche weiter..."
+            continue
+
+    job._finish(FAILED, "Video-Generierung hat zu lange gedauert (>10 Min). Das kann bei hoher Nachfrage passieren. Bitte nochmal versuchen.")
@@ -0,0 +1,134 @@
+"""Job-queue worker: claims jobs from job_queue and runs them headless.
+
+    python worker.py                  # one worker process
+    python worker.py --processes 3    # three in parallel
+    python worker.py --once           # drain the queue, then exit
+
+Each process loads main.py headless once (see headless.py), then runs image
+jobs through smart_generate_image and video jobs through generate_video_veo,
+storing results under job_queue.RESULTS_DIR. Needs GEMINI_API_KEY (environment
+or .streamlit/secrets.toml). Point several workers — also on other machines —
+at the same NANO_BANANA_CACHE_DIR / NANO_BANANA_JOB_DB to share the queue.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+
+import headless
+import job_queue
+import result_cache
+import veo_jobs
+
+IDLE_SLEEP = 2
+
+
+def _heartbeat_loop(job_id, worker_id, stop):
+    while not stop.wait(job_queue.HEARTBEAT_INTERVAL):
+        job_queue.heartbeat(job_id, worker_id)
+
+
+def _failure(recorder, fallback):
+    return recorder.errors[-1] if recorder.errors else fallback
+
+
+def run_image_job(app, job, recorder):
+    params = job["params"]
+    headless.apply_settings(app, overrides=params.get("settings"))
+    refs = [headless.open_reference(path) for path in params.get("ref_paths", [])] or None
+    img_bytes, mime_type = app["smart_generate_image"](
+        params["prompt"], headless.gemini_api_key(app),
+        reference_images=refs, aspect_ratio_str=params.get("aspect_ratio"),
+        cache_slot=params.get("cache_slot", 0),
+    )
+    if not img_bytes:
+        raise RuntimeError(_failure(recorder, "Gemini hat kein Bild zurückgegeben."))
+    path = job_queue.RESULTS_DIR / f"{job['id']}.{result_cache.MIME_EXT.get(mime_type, 'png')}"
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(img_bytes)
+    os.replace(tmp, path)
+    return str(path), mime_type
+
+
+def run_video_job(app, job, recorder):
+    params = job["params"]
+    veo_job = app["generate_video_veo"](params["prompt"], headless.gemini_api_key(app),
+                                         duration=params.get("duration"))
+    if veo_job is None:
+        raise RuntimeError(_failure(recorder, "Veo-Auftrag konnte nicht gesendet werden."))
+    while veo_job.status == veo_jobs.RUNNING:
+        time.sleep(IDLE_SLEEP)
+    veo_jobs.discard(veo_job.id)
+    if veo_job.status != veo_jobs.DONE:
+        raise RuntimeError(veo_job.error)
+    path = job_queue.RESULTS_DIR / f"{job['id']}.mp4"
+    shutil.move(veo_job.video_path, path)
+    return str(path), "video/mp4"
+
+
+RUNNERS = {"image": run_image_job, "video": run_video_job}
+
+
+def work(worker_id, once=False):
+    app = headless.load_app()
+    recorder = headless.ErrorRecorder(app["st"])
+    app["st"] = recorder
+    baseline = dict(app)  # settings of one job must not leak into the next
+    job_queue.RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"[{worker_id}] ready — waiting for jobs in {job_queue.DB_PATH}", flush=True)
+
+    while True:
+        job_queue.requeue_stale()
+        job = job_queue.claim(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(IDLE_SLEEP)
+            continue
+
+        app.clear()
+        app.update(baseline)
+        recorder.reset()
+        # Costs of the job are booked to the session that queued it
+        recorder.session_state.queue_session_id = job["session_id"]
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat_loop, args=(job["id"], worker_id, stop), daemon=True).start()
+        started = time.time()
+        try:
+            result_path, result_mime = RUNNERS[job["kind"]](app, job, recorder)
+            held = job_queue.complete(job["id"], worker_id, result_path, result_mime)
+            outcome = "done"
+        except Exception as e:
+            held = job_queue.fail(job["id"], worker_id, str(e))
+            outcome = f"failed: {e}"
+        finally:
+            stop.set()
+        if not held:
+            # Requeued after missed heartbeats and claimed by another worker — its outcome counts
+            outcome += " (taken over by another worker, dropped)"
+        print(f"[{worker_id}] {job['kind']} job {job['id']} {outcome} after {time.time() - started:.0f}s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Nano Banana generation jobs from the job queue.")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start (default 1)")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    if args.processes <= 1:
+        work(prefix, args.once)
+        return
+    procs = [multiprocessing.Process(target=work, args=(f"{prefix}-{i}", args.once))
+             for i in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()